@@ -1,12 +1,56 @@
+from io import StringIO
+
+
 class Client(object):
+    max_issue_title_length = 256
+
     def get_last_diff(self):
         return None
 
+    def get_last_diff_file(self, parser=None):
+        """Get the last diff as a file, which the parser may read as it arrives."""
+        last_diff = self.get_last_diff()
+        return StringIO(last_diff) if last_diff else None
+
     def create_issue(self, issue):
         return [201, None]
 
+    def create_issues(self, issues):
+        """Create (or update) the issue for each of several TODOs, returning the result of each like create_issue."""
+        return [self.create_issue(issue) for issue in issues]
+
+    def close_issues(self, issues):
+        """Close the issue for each of several TODOs, returning the result of each like close_issue."""
+        return [self.close_issue(issue) for issue in issues]
+
+    def move_issue(self, old_issue, new_issue):
+        return [200, None]
+
     def close_issue(self, issue):
         return 200
 
+    def finish(self):
+        """Apply any changes collected during the run."""
+        pass
+
+    def get_rate_limit(self):
+        """Get the number of requests left under each rate limit, or None if there aren't any."""
+        return None
+
+    def estimate_requests(self, issue):
+        """Estimate the requests needed to process an issue, under each rate limit."""
+        return {}
+
+    def get_todo_issues(self):
+        """Get the open issues created for TODOs, each a dict with its number, title and file (if known)."""
+        return []
+
+    def get_issue_title(self, issue):
+        """Get the title of the issue for a TODO, prefixed with its ref unless that means something else."""
+        title = issue.title
+        if issue.ref and not issue.ref.startswith(('@', '!', '#')):
+            title = f'[{issue.ref}] {issue.title}'
+        return title + '...' if len(title) > self.max_issue_title_length else title
+
     def get_issue_url(self, new_issue_number):
         return "N/A"
@@ -0,0 +1,56 @@
+import re
+
+
+class CodeSnippet(object):
+    """A changed code block from a diff, shared by every Issue found within it and cleaned on first use."""
+    DELETED_LINES_PATTERN = re.compile(r'\n^-.*$', re.MULTILINE)
+    ADDED_LINES_PATTERN = re.compile(r'\n^\+.*$', re.MULTILINE)
+    LINE_SYMBOLS_PATTERN = re.compile(r'^.', re.MULTILINE)
+    NO_NEWLINE_PATTERN = re.compile(r'\n\sNo newline at end of file', re.MULTILINE)
+
+    def __init__(self, hunk, excerpts=False):
+        self._hunk = hunk
+        self._text = None
+        self._old_text = None
+        # Excerpts may be taken from either side of the change, so the raw hunk is kept until then.
+        self.excerpts = excerpts
+
+    def _clean(self, other_side_pattern):
+        # Strip the lines from the other side of the change.
+        cleaned_hunk = other_side_pattern.sub('', self._hunk)
+        # Strip leading symbols/whitespace.
+        cleaned_hunk = self.LINE_SYMBOLS_PATTERN.sub('', cleaned_hunk)
+        # Strip newline message.
+        return self.NO_NEWLINE_PATTERN.sub('', cleaned_hunk)
+
+    @property
+    def text(self):
+        """The code block with the diff symbols stripped, so it can be included in the issue body."""
+        if self._text is None:
+            # Strip removed lines.
+            self._text = self._clean(self.DELETED_LINES_PATTERN)
+            if not self.excerpts:
+                # The raw hunk is no longer needed once cleaned.
+                self._hunk = None
+        return self._text
+
+    @property
+    def old_text(self):
+        """The code block as it was before the change, with the diff symbols stripped."""
+        if self._old_text is None:
+            self._old_text = self._clean(self.ADDED_LINES_PATTERN)
+        return self._old_text
+
+    def excerpt(self, start_line_within_hunk, num_lines, context_lines, deleted=False):
+        """
+        Return only the lines of a TODO plus the given number of lines either side of it, from the side of the change
+        the TODO is on (as its line within the hunk counts the lines on that side).
+        """
+        # The first line holds any section heading that followed the @@ line numbers, so skip it.
+        lines = (self.old_text if deleted else self.text).split('\n')[1:]
+        start = max(start_line_within_hunk - 1 - context_lines, 0)
+        end = min(start_line_within_hunk - 1 + num_lines + context_lines, len(lines))
+        return '\n'.join(lines[start:end])
+
+    def __str__(self):
+        return self.text
@@ -0,0 +1,168 @@
+import re
+
+from RegexBackend import RegexBackend
+
+
+class CommentScanner(object):
+    """Scanner for finding the comments in a code block, for all of a language's comment markers at once.
+
+    The lines are walked once, tracking the state of every marker as it goes, so the time taken only grows linearly
+    with the size of the block, even if it contains lots of block comments which are never closed.
+    """
+
+    def __init__(self, markers):
+        self.markers = markers
+        self.line_patterns = {}
+        self.block_patterns = {}
+        for i, marker in enumerate(markers):
+            if marker['type'] == 'line':
+                self.line_patterns[i] = RegexBackend.compile(self._get_line_comment_pattern(marker, markers))
+            else:
+                self.block_patterns[i] = (self._compile(marker['pattern']['start']),
+                                          self._compile(marker['pattern']['end']))
+
+    @staticmethod
+    def _compile(pattern):
+        try:
+            return RegexBackend.compile(pattern)
+        except re.error:
+            # Treat a marker that isn't a valid regex (e.g. '+=') as literal text.
+            return RegexBackend.compile(re.escape(pattern))
+
+    def _get_line_comment_pattern(self, marker, markers):
+        # Add a negative lookup to include the second character from alternative comment patterns.
+        # This step is essential to handle cases like in Julia, where '#' and '#=' are comment patterns.
+        # It ensures that when a space after the comment is optional ('\s' => '\s*'),
+        # the second character would be matched because of the any character expression ('.+').
+        suff_escape_list = []
+        pref_escape_list = []
+        for to_escape in markers:
+            if to_escape['type'] == 'line':
+                if to_escape['pattern'] == marker['pattern']:
+                    continue
+                if marker['pattern'][0] == to_escape['pattern'][0]:
+                    suff_escape_list.append(self._extract_character(to_escape['pattern'], 1))
+            else:
+                # Block comments and line comments cannot have the same comment pattern,
+                # so a check if the string is the same is unnecessary.
+                if to_escape['pattern']['start'][0] == marker['pattern'][0]:
+                    suff_escape_list.append(self._extract_character(to_escape['pattern']['start'], 1))
+                search = to_escape['pattern']['end'].find(marker['pattern'])
+                if search != -1:
+                    pref_escape_list.append(self._extract_character(to_escape['pattern']['end'], search - 1))
+
+        # The characters either side of the marker are matched with negated character classes rather than lookarounds,
+        # so the pattern can be matched in linear time. The marker must be followed by at least one more character.
+        return ((r'(?:^|[^' + ''.join(map(self._as_class_member, pref_escape_list)) + r'])'
+                 if len(pref_escape_list) > 0 else '')
+                + '(?:' + marker['pattern'] + ')'
+                + (r'[^' + ''.join(map(self._as_class_member, suff_escape_list)) + r']'
+                   if len(suff_escape_list) > 0 else '.'))
+
+    @staticmethod
+    def _as_class_member(character):
+        return character if character.startswith('\\') else re.escape(character)
+
+    @staticmethod
+    def _extract_character(input_str, pos):
+        # Extracts a character from the input string at the specified position,
+        # considering escape sequences when applicable.
+        # Test cases
+        # print(_extract_character("/\\*", 1))   # Output: "\*"
+        # print(_extract_character("\\*", 0))    # Output: "\*"
+        # print(_extract_character("\\", 0))     # Output: "\\"
+        # print(_extract_character("w", 0))      # Output: "w"
+        # print(_extract_character("wa", 1))     # Output: "a"
+        # print(_extract_character("\\\\w", 1))  # Output: "\\"
+        if input_str[pos] == '\\':
+            if pos >= 1 and not input_str[pos - 1] == '\\' and len(input_str) > pos + 1:
+                return '\\' + input_str[pos + 1]
+            return '\\\\'
+        if pos >= 1:
+            if input_str[pos - 1] == '\\':
+                return '\\' + input_str[pos]
+        return input_str[pos]
+
+    def scan(self, lines):
+        """
+        Find the comments in these lines, returning a list of them for each marker.
+        Each comment is a dict of its start and end lines (relative to the first line) and its text.
+        Consecutive lines with line comments are merged into one comment.
+        """
+        comments = [[] for _ in self.markers]
+        # For each block marker, the position after the end of the previous comment, and the start of any open comment.
+        block_states = {i: {'floor': (0, 0), 'start': None} for i in self.block_patterns}
+        for line_number, line in enumerate(lines):
+            for i, line_pattern in self.line_patterns.items():
+                if line_pattern.search(line):
+                    marker_comments = comments[i]
+                    if marker_comments and marker_comments[-1]['end'] == line_number - 1:
+                        marker_comments[-1]['end'] = line_number
+                        marker_comments[-1]['comment'] += '\n' + line
+                    else:
+                        marker_comments.append({'start': line_number, 'end': line_number, 'comment': line})
+            for i, (start_pattern, end_pattern) in self.block_patterns.items():
+                self._scan_block_comments(lines, line_number, start_pattern, end_pattern, block_states[i],
+                                          comments[i])
+        return comments
+
+    def _scan_block_comments(self, lines, line_number, start_pattern, end_pattern, state, marker_comments):
+        """Advance the state of a block marker through a line, adding any comments that are closed on it."""
+        line = lines[line_number]
+        pos = 0
+        while True:
+            if state['start'] is None:
+                start_search = start_pattern.search(line, pos)
+                if not start_search:
+                    return
+                comment_start = self._get_comment_start(lines, line_number, start_search.start(), state['floor'])
+                if comment_start is None:
+                    pos = start_search.start() + 1
+                    continue
+                state['start'] = comment_start
+                pos = start_search.end()
+            end_search = end_pattern.search(line, pos)
+            if not end_search:
+                # The comment continues onto the next line.
+                return
+            comment_end = (line_number, end_search.end())
+            marker_comments.append(self._get_comment(lines, state['start'], comment_end))
+            state['floor'] = comment_end
+            state['start'] = None
+            pos = max(end_search.end(), pos + 1)
+
+    @staticmethod
+    def _get_comment_start(lines, line_number, col, floor):
+        """
+        Find where a block comment whose start marker is at this position begins, or None if it isn't a comment.
+        The start marker must follow whitespace or a diff symbol, which (like any whitespace before it, including
+        line breaks) is included in the comment, but only back as far as the end of the previous comment.
+        """
+        after_whitespace = False
+        while True:
+            lower = floor[1] if line_number == floor[0] else 0
+            while col > lower and lines[line_number][col - 1].isspace():
+                col -= 1
+                after_whitespace = True
+            if col == 0 and line_number > floor[0]:
+                # The line break at the end of the previous line is whitespace too.
+                line_number -= 1
+                col = len(lines[line_number])
+                after_whitespace = True
+                continue
+            break
+        if col > lower and lines[line_number][col - 1] in '+-':
+            return line_number, col - 1
+        if after_whitespace:
+            return line_number, col
+        return None
+
+    @staticmethod
+    def _get_comment(lines, start, end):
+        (start_line, start_col), (end_line, end_col) = start, end
+        if start_line == end_line:
+            comment = lines[start_line][start_col:end_col]
+        else:
+            comment = '\n'.join([lines[start_line][start_col:]] + lines[start_line + 1:end_line]
+                                + [lines[end_line][:end_col]])
+        return {'start': start_line, 'end': end_line, 'comment': comment}
@@ -0,0 +1,144 @@
+import queue
+import threading
+
+from LineStatus import LineStatus
+from MoveCandidates import MoveCandidates
+
+
+class QueuedLines(object):
+    """The lines of a diff, taken from a queue as another thread reads them, in chunks ending with None."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def __iter__(self):
+        for chunk in iter(self.chunks.get, None):
+            yield from chunk
+
+    def close(self):
+        pass
+
+
+class DiffPipeline(object):
+    """
+    Reads, parses and processes a diff at the same time, with bounded queues between the stages: one thread reads the
+    diff, another parses each file section as it arrives, and the TODOs found are handed back to be processed a group
+    at a time. A TODO removed from one file may have been added to another further on, so the TODOs that may have moved
+    are held back until the whole diff has been parsed. A quick pass over the whole diff rules out the rest, so they can
+    go as soon as their file has been parsed. If the diff is already in hand (e.g. downloaded in one go), the pass is
+    made before parsing starts; otherwise it's made while reading, and the TODOs wait until the whole diff is read.
+    """
+    # The number of lines read before they're passed on to the parser.
+    CHUNK_SIZE = 1000
+
+    def __init__(self, parser, queue_size=16, insert_issue_urls=False):
+        self.parser = parser
+        # The number of chunks of lines, and of parsed sections, that can be waiting for the next stage.
+        self.queue_size = queue_size
+        # The URLs are inserted from the bottom of each file up, so a file's new TODOs must be processed together.
+        self.insert_issue_urls = insert_issue_urls
+        self.move_candidates = MoveCandidates(parser.identifiers)
+        # The keys of the TODOs that may have moved, once the whole diff has been checked for them.
+        self.move_keys = None
+        self.moves_found = threading.Event()
+        self.errors = []
+        self.raw_issues = []
+        # The URLs of the TODOs handed back as added, so a TODO removed with the same URL isn't closed afterwards.
+        self.added_urls = set()
+
+    def _read(self, diff_file, chunks):
+        try:
+            if diff_file.seekable():
+                # Finding the TODOs that may have moved is much quicker than parsing, so do it first, and then none of
+                # the TODOs need to wait for the rest of the diff to be read.
+                for line in diff_file:
+                    self.move_candidates.add_line(line)
+                diff_file.seek(0)
+                self.moves_found.set()
+            chunk = []
+            for line in diff_file:
+                if not self.moves_found.is_set():
+                    self.move_candidates.add_line(line)
+                chunk.append(line)
+                if len(chunk) == self.CHUNK_SIZE:
+                    chunks.put(chunk)
+                    chunk = []
+            chunks.put(chunk)
+            diff_file.close()
+            self.moves_found.set()
+        except Exception as e:
+            self.errors.append(e)
+        finally:
+            chunks.put(None)
+
+    def _parse(self, chunks, sections):
+        try:
+            for section_issues in self.parser.parse_sections(QueuedLines(chunks)):
+                sections.put(section_issues)
+        except Exception as e:
+            self.errors.append(e)
+            # Let the reader finish rather than waiting for a parser that has stopped.
+            for _ in iter(chunks.get, None):
+                pass
+        finally:
+            sections.put(None)
+
+    def _split(self, section_issues):
+        """Split a section's TODOs without URLs into those that can be processed now, and those that may have moved."""
+        if self.move_keys is None:
+            self.move_keys = self.move_candidates.get_keys()
+        ready_issues = []
+        held_issues = []
+        for issue in section_issues:
+            if not issue.issue_url:
+                key = MoveCandidates.get_issue_key(issue)
+                (held_issues if key in self.move_keys else ready_issues).append(issue)
+        if held_issues and self.insert_issue_urls:
+            return [], ready_issues + held_issues
+        return ready_issues, held_issues
+
+    def get_groups(self, diff_file):
+        """
+        Yield the TODOs found in the diff in groups, as soon as each can be processed. The last group holds the TODOs
+        held back, so it must be checked for moved TODOs before it's processed.
+        """
+        chunks = queue.Queue(self.queue_size)
+        sections = queue.Queue(self.queue_size)
+        threads = [threading.Thread(target=self._read, args=(diff_file, chunks), daemon=True),
+                   threading.Thread(target=self._parse, args=(chunks, sections), daemon=True)]
+        for thread in threads:
+            thread.start()
+
+        # The sections waiting for the whole diff to be checked for moves, and the TODOs held back until the end.
+        waiting_sections = []
+        held_issues = []
+        for section_issues in iter(sections.get, None):
+            self.raw_issues.extend(section_issues)
+            # An issue with a URL isn't checked for moves, so it can be updated straight away, but it can only be
+            # closed once it's known that it hasn't been added elsewhere.
+            ready_issues = [issue for issue in section_issues
+                            if issue.issue_url and issue.status == LineStatus.ADDED]
+            held_issues.extend(issue for issue in section_issues
+                               if issue.issue_url and issue.status == LineStatus.DELETED)
+            waiting_sections.append(section_issues)
+            if self.moves_found.is_set():
+                for waiting_issues in waiting_sections:
+                    section_ready_issues, section_held_issues = self._split(waiting_issues)
+                    ready_issues.extend(section_ready_issues)
+                    held_issues.extend(section_held_issues)
+                waiting_sections = []
+            self.added_urls.update(issue.issue_url for issue in ready_issues if issue.issue_url)
+            if ready_issues:
+                yield ready_issues
+
+        for thread in threads:
+            thread.join()
+        if self.errors:
+            raise self.errors[0]
+        for waiting_issues in waiting_sections:
+            section_ready_issues, section_held_issues = self._split(waiting_issues)
+            held_issues.extend(section_ready_issues + section_held_issues)
+        held_issues = [issue for issue in held_issues
+                       if not (issue.status == LineStatus.DELETED and issue.issue_url in self.added_urls)]
+        if held_issues:
+            yield held_issues
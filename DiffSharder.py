@@ -0,0 +1,94 @@
+import hashlib
+import json
+import tempfile
+
+from MoveCandidates import MoveCandidates
+
+
+class DiffSharder(object):
+    """
+    Splits the file sections of a diff between several shards (e.g. the jobs of a workflow matrix), by a stable hash of
+    each file's path. Files a TODO may have moved between are kept in the same shard, so moves are still detected.
+    Linking too many files only makes the shards uneven, so a quick pass over the diff finds them rather than the parser.
+    """
+    VERSION = 2
+
+    def __init__(self, identifiers, shard_index, shard_count):
+        if shard_count < 1 or not 0 <= shard_index < shard_count:
+            raise ValueError(f'Invalid shard {shard_index} of {shard_count}')
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.identifiers = identifiers
+        # Each file points to another in its group, or to itself if it's the first (by path) in the group.
+        self.parents = {}
+
+    def _find(self, file):
+        root = file
+        while self.parents[root] != root:
+            root = self.parents[root]
+        while self.parents[file] != root:
+            self.parents[file], file = root, self.parents[file]
+        return root
+
+    def _link(self, file, other_file):
+        root, other_root = sorted([self._find(file), self._find(other_file)])
+        self.parents[other_root] = root
+
+    def plan(self, diff_file, copy_file=None):
+        """Read the diff, grouping the files that TODOs may have moved between, and copying it to a file if given."""
+        move_candidates = MoveCandidates(self.identifiers)
+        for line in diff_file:
+            if copy_file is not None:
+                copy_file.write(line)
+            move_candidates.add_line(line)
+        diff_file.close()
+        for file in move_candidates.files:
+            self.parents.setdefault(file, file)
+        for linked_files in move_candidates.get_linked_files():
+            first_file = min(linked_files)
+            for file in linked_files:
+                self._link(first_file, file)
+
+    def get_shard(self, file):
+        root = self._find(file) if file in self.parents else file
+        return int(hashlib.sha256(root.encode('utf-8')).hexdigest(), 16) % self.shard_count
+
+    def includes(self, file):
+        """Check whether a file's section belongs to this shard."""
+        return self.get_shard(file) == self.shard_index
+
+    def shard(self, diff_file, parser):
+        """Get the diff back to parse after planning, with the parser set to skip the sections of other shards."""
+        # The diff may be too large to hold in memory, so it's kept in a temporary file.
+        copy_file = tempfile.TemporaryFile('w+', encoding='utf-8', errors='surrogatepass')
+        self.plan(diff_file, copy_file)
+        copy_file.seek(0)
+        parser.section_filter = self.includes
+        return copy_file
+
+    def write_summary(self, path, raw_issues, pr_closed_issues=()):
+        """
+        Write what this shard covered, i.e. its files and the TODOs found in them, along with the issues it closed that
+        the PR description should reference. The shards' files don't overlap, so their summaries can be merged by
+        combining the lists.
+        """
+        summary = {
+            'version': self.VERSION,
+            'shard_index': self.shard_index,
+            'shard_count': self.shard_count,
+            'files': sorted(file for file in self.parents if self.includes(file)),
+            'issues': [{'file_name': raw_issue.file_name, 'start_line': raw_issue.start_line, 'title': raw_issue.title,
+                        'status': raw_issue.status.name} for raw_issue in raw_issues],
+            'pr_closed_issues': list(pr_closed_issues)
+        }
+        with open(path, 'w') as summary_file:
+            json.dump(summary, summary_file, indent=2)
+
+    @staticmethod
+    def read_pr_closed_issues(paths):
+        """Read the issues closed by every shard from their summaries, for the PR description to reference."""
+        pr_closed_issues = []
+        for path in paths:
+            with open(path) as summary_file:
+                pr_closed_issues.extend(json.load(summary_file).get('pr_closed_issues', []))
+        return pr_closed_issues
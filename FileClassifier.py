@@ -0,0 +1,84 @@
+import re
+
+
+class FileClassifier(object):
+    """
+    Classifier for files that aren't worth checking for TODOs: vendored and generated files, going by linguist's rules,
+    and minified files, going by the length of their lines.
+    """
+    # Based on the path rules in linguist's generated.rb.
+    GENERATED_PATH_PATTERN = re.compile(r'(?:^|/)(?:package-lock\.json|npm-shrinkwrap\.json|yarn\.lock|pnpm-lock\.yaml|'
+                                        r'composer\.lock|Gemfile\.lock|Cargo\.lock|poetry\.lock|Pipfile\.lock|go\.sum|'
+                                        r'flake\.lock|Podfile\.lock|mix\.lock|pubspec\.lock|packages\.lock\.json)$|'
+                                        r'\.(?:js|css)\.map$|[.-]min\.(?:js|css)$|\.designer\.(?:cs|vb)$|'
+                                        r'\.pb\.(?:go|cc|h)$|_pb2(?:_grpc)?\.py$|(?:^|/)__generated__/')
+    # Used when linguist's vendor.yml isn't available.
+    DEFAULT_VENDOR_PATTERNS = [r'(^|/)node_modules/', r'(^|/)bower_components/', r'(^|/)vendors?/', r'(^|/)dist/',
+                               r'(3rd|[Tt]hird)[-_]?[Pp]arty/']
+    # Generators usually say so in the first few lines, e.g. "Code generated by protoc-gen-go. DO NOT EDIT."
+    GENERATED_MARKER_PATTERN = re.compile(r'DO NOT EDIT|@generated')
+    GENERATED_MARKER_LINES = 5
+    FIRST_LINES_HUNK_PATTERN = re.compile(r'^@@ -[01](,\d+)? \+[01](,\d+)? @@')
+    LONG_LINE_LENGTH = 1000
+    # The proportion of long lines at which a file is treated as minified.
+    MINIFIED_RATIO = 0.5
+
+    def __init__(self, vendor_patterns=None):
+        if vendor_patterns is None:
+            vendor_patterns = self.DEFAULT_VENDOR_PATTERNS
+        self.vendor_patterns = []
+        for pattern in vendor_patterns:
+            try:
+                self.vendor_patterns.append(re.compile(pattern))
+            except re.error:
+                # Some of linguist's patterns use Ruby-only syntax.
+                pass
+        self.vendor_pattern = None
+        if self.vendor_patterns:
+            try:
+                # Matching one combined pattern is much quicker than matching each in turn.
+                self.vendor_pattern = re.compile('|'.join(f'(?:{pattern.pattern})'
+                                                          for pattern in self.vendor_patterns))
+            except re.error:
+                # Patterns with inline flags can't be combined.
+                pass
+
+    def classify_path(self, file):
+        """Return 'vendored' or 'generated' if the file's path marks it as such, otherwise None."""
+        if self.vendor_pattern is not None:
+            is_vendored = bool(self.vendor_pattern.search(file))
+        else:
+            is_vendored = any(pattern.search(file) for pattern in self.vendor_patterns)
+        if is_vendored:
+            return 'vendored'
+        if self.GENERATED_PATH_PATTERN.search(file):
+            return 'generated'
+        return None
+
+    def classify_section(self, section_lines):
+        """Return 'generated' or 'minified' if the lines of a diff section mark the file as such, otherwise None."""
+        num_lines = 0
+        num_long_lines = 0
+        check_generated_marker = False
+        in_hunks = False
+        for line in section_lines:
+            if line.startswith('@@'):
+                if not in_hunks:
+                    # Only the start of the file says whether it's generated.
+                    check_generated_marker = bool(self.FIRST_LINES_HUNK_PATTERN.match(line))
+                    in_hunks = True
+                continue
+            if not in_hunks or line.startswith('\\'):
+                continue
+            if check_generated_marker and num_lines < self.GENERATED_MARKER_LINES \
+                    and self.GENERATED_MARKER_PATTERN.search(line):
+                return 'generated'
+            num_lines += 1
+            if self.is_long_line(line):
+                num_long_lines += 1
+        if num_long_lines and num_long_lines >= num_lines * self.MINIFIED_RATIO:
+            return 'minified'
+        return None
+
+    def is_long_line(self, line):
+        return len(line) > self.LONG_LINE_LENGTH
@@ -2,27 +2,75 @@ import os
 import requests
 import json
 import re
-from urllib.parse import quote
+import difflib
+import hashlib
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from urllib.parse import quote, unquote, urlparse, parse_qs
 from Client import Client
+from LineStatus import LineStatus
+from TokenPool import TokenPool, TokenPoolSession
+from HttpCache import CachedSession, HttpCache
 
 class GitHubClient(Client):
     """Basic client for getting the last diff and managing issues."""
-    existing_issues = []
-    milestones = []
-    max_issue_title_length = 256
-
-    def __init__(self):
+    # Hidden marker in issue bodies, identifying the TODO fields they were last rendered from.
+    FINGERPRINT_PATTERN = re.compile(r'<!-- todo-to-issue fingerprint: ([0-9a-f]+) -->')
+    # The link to the TODO's line in issue bodies, giving the file it's in.
+    BLOB_URL_PATTERN = re.compile(r'/blob/[^/\s]+/([^\s#]+)#L\d+')
+    max_concurrent_requests = 8
+    # GitHub advises against creating content concurrently, or more than about once a second.
+    min_write_interval = 1
+    # When the next request creating content can be made with each token. The advice is per account, and clients for
+    # several repos may share a token (e.g. in batch mode), so the writes are paced across every client in the process.
+    next_writes: dict[str | None, float] = {}
+    next_writes_lock = threading.Lock()
+    # How many more times a page of a list is requested if it can't be retrieved, waiting longer each time.
+    page_retries = 2
+    page_retry_delay = 1
+
+    def __init__(self, repo=None, before=None, sha=None, session=None):
+        """
+        By default, the repo and the commits to compare come from the environment, but they can be given instead
+        (e.g. when processing several repos), along with a session to share between clients.
+        """
         self.github_url = os.getenv('INPUT_GITHUB_URL')
         if not self.github_url:
             raise EnvironmentError
+        # Anything that supports the requests API, e.g. the requests module itself or a shared requests.Session.
+        self.session = session or requests
+        self.token = os.getenv('INPUT_TOKEN')
+        # Extra tokens (e.g. other accounts' or GitHub App installation tokens) to spread requests across.
+        pool_tokens = [token for token in re.split(r'[\s,]+', os.getenv('INPUT_TOKEN_POOL', '')) if token]
+        self.token_pool = TokenPool.open([self.token] + pool_tokens) if pool_tokens else None
+        if self.token_pool:
+            self.session = TokenPoolSession(self.session, self.token_pool, self.token)
+        http_cache_path = os.getenv('INPUT_HTTP_CACHE', '')
+        if http_cache_path:
+            # Make GET requests conditional, so unchanged responses don't count against the rate limit.
+            self.session = CachedSession(self.session, HttpCache.open(http_cache_path))
         self.base_url = f'{self.github_url}/'
         self.repos_url = f'{self.base_url}repos/'
-        self.repo = os.getenv('INPUT_REPO')
-        self.before = os.getenv('INPUT_BEFORE')
-        self.sha = os.getenv('INPUT_SHA')
-        self.commits = json.loads(os.getenv('INPUT_COMMITS')) or []
-        self.__init_diff_url__()
-        self.token = os.getenv('INPUT_TOKEN')
+        # The open issues and milestones are only retrieved when first needed, as most pushes don't change any TODOs.
+        self._existing_issues = None
+        self._issues_by_title = None
+        self._milestones = None
+        if sha:
+            self.repo = repo
+            # Without a base, just check the given commit.
+            self.before = before or '0000000000000000000000000000000000000000'
+            self.sha = sha
+            self.commits = [{'id': sha}]
+            self.diff_url = None
+        else:
+            self.repo = repo or os.getenv('INPUT_REPO')
+            self.before = os.getenv('INPUT_BEFORE')
+            self.sha = os.getenv('INPUT_SHA')
+            self.commits = json.loads(os.getenv('INPUT_COMMITS') or 'null') or []
+            self.__init_diff_url__()
         self.issues_url = f'{self.repos_url}{self.repo}/issues'
         self.milestones_url = f'{self.repos_url}{self.repo}/milestones'
         self.issue_headers = {
@@ -40,14 +88,58 @@ class GitHubClient(Client):
         self.line_break = '\n\n' if auto_p else '\n'
         self.auto_assign = os.getenv('INPUT_AUTO_ASSIGN', 'false') == 'true'
         self.actor = os.getenv('INPUT_ACTOR')
-        self.line_base_url = os.getenv('INPUT_GITHUB_SERVER_URL')
+        self.line_base_url = os.getenv('INPUT_GITHUB_SERVER_URL') or 'https://github.com/'
         if not self.line_base_url.endswith('/'):
             self.line_base_url += '/'
         self.project = os.getenv('INPUT_PROJECT', None)
-        # Retrieve the existing repo issues now so we can easily check them later.
-        self._get_existing_issues()
-        # Populate milestones so we can perform a lookup if one is specified.
-        self._get_milestones()
+        self.paginate_diff = os.getenv('INPUT_PAGINATE_DIFF', 'false') == 'true'
+        # Set if a comparison has too many changed files for GitHub to list them all.
+        self.too_many_files = False
+        # In a PR, leave closing issues to GitHub when it's merged.
+        self.close_on_merge = os.getenv('INPUT_CLOSE_ON_MERGE', 'false') == 'true'
+        # The issues closed during the run, to reference in the PR description.
+        self.pr_closed_issues = []
+        # Parallel jobs sharing a diff would overwrite each other's changes to the PR description, so they leave the
+        # issues they close in their shard summaries, for a later job to reference all at once.
+        self.defer_pr_update = int(os.getenv('INPUT_SHARD_COUNT', '1')) > 1
+        # Lookups shared by the issues processed during the run.
+        self.valid_assignees = {}
+        self.project_ids = {}
+        # The issues already closed, e.g. for another TODO with the same title in a deleted file.
+        self.closed_issue_numbers = set()
+
+    @property
+    def existing_issues(self):
+        """The repo's open issues, retrieved the first time they're needed."""
+        if self._existing_issues is None:
+            self._get_existing_issues()
+        return self._existing_issues
+
+    @existing_issues.setter
+    def existing_issues(self, existing_issues):
+        self._existing_issues = existing_issues
+        # Indexed again when next needed.
+        self._issues_by_title = None
+
+    def _get_issues_with_title(self, title):
+        """Get the open issues with this title, indexing them by title the first time."""
+        if self._issues_by_title is None:
+            issues_by_title = defaultdict(list)
+            for existing_issue in self.existing_issues:
+                issues_by_title[existing_issue['title']].append(existing_issue)
+            self._issues_by_title = issues_by_title
+        return self._issues_by_title.get(title, [])
+
+    @property
+    def milestones(self):
+        """The repo's open milestones, retrieved the first time a TODO specifies one."""
+        if self._milestones is None:
+            self._get_milestones()
+        return self._milestones
+
+    @milestones.setter
+    def milestones(self, milestones):
+        self._milestones = milestones
 
     def __init_diff_url__(self):
         manual_commit_ref = os.getenv('MANUAL_COMMIT_REF')
@@ -63,7 +155,11 @@ class GitHubClient(Client):
         else:
             self.diff_url = os.getenv('INPUT_DIFF_URL')
 
-    def get_last_diff(self):
+    def get_last_diff_file(self, parser=None):
+        last_diff = self.get_last_diff(parser)
+        return StringIO(last_diff) if last_diff else None
+
+    def get_last_diff(self, parser=None):
         """Get the last diff."""
         if self.diff_url:
             # Diff url was directly passed in config, likely due to this being a PR.
@@ -86,13 +182,19 @@ class GitHubClient(Client):
         else:
             return None
 
+        if self.paginate_diff:
+            files_diff = self._get_files_diff(diff_url, parser)
+            if files_diff is not None:
+                return files_diff
+            print('Could not retrieve the changed files, falling back to the full diff')
+
         diff_headers = {
             'Accept': 'application/vnd.github.v3.diff',
             'Authorization': f'token {self.token}',
             'X-GitHub-Api-Version': '2022-11-28',
             'User-Agent': 'TODOToIssue'
         }
-        diff_request = requests.get(url=diff_url, headers=diff_headers)
+        diff_request = self.session.get(url=diff_url, headers=diff_headers)
         if diff_request.status_code == 200:
             return diff_request.text
 
@@ -103,35 +205,173 @@ class GitHubClient(Client):
             error_response.append(f"Server response: {json.loads(diff_request.text)['message']}")
             error_response.append('Operation will abort')
 
-        if '/compare/' in diff_url:
+        if diff_request.status_code != 404 and not self.paginate_diff:
+            # The diff may be too large for GitHub to return in one go, so try building it from each file's patch.
+            print('Falling back to retrieving the changed files individually')
+            files_diff = self._get_files_diff(diff_url, parser)
+            if files_diff is not None:
+                return files_diff
+            error_response.append('Fallback to changed files also failed')
+
+        if '/compare/' in diff_url and not self.too_many_files:
             # The before SHA may no longer be valid due to a force push, fall back to /commits/ endpoint.
+            # That's only the last commit though, so isn't used if the comparison was valid, just too large.
             diff_url = f'{self.repos_url}{self.repo}/commits/{self.sha}'
             print(f'Falling back to {diff_url}')
-            diff_request = requests.get(url=diff_url, headers=diff_headers)
+            diff_request = self.session.get(url=diff_url, headers=diff_headers)
             if diff_request.status_code == 200:
                 return diff_request.text
             error_response.append('Fallback URL also failed')
 
         raise Exception('\n'.join(error_response))
 
+    def _get_files_diff(self, diff_url, parser=None):
+        """Build the diff from the paginated list of changed files, which works even if the full diff is too large."""
+        params = {'per_page': 100, 'page': 1}
+        if re.search(r'/pulls/\d+$', diff_url):
+            pr_request = self.session.get(diff_url, headers=self.issue_headers)
+            if pr_request.status_code != 200:
+                return None
+            pull = pr_request.json()
+            base_sha = None
+            files_url = f'{diff_url}/files'
+            files_request = self.session.get(files_url, headers=self.issue_headers, params=params)
+            if files_request.status_code != 200:
+                return None
+            files = files_request.json()
+        else:
+            files_url = diff_url
+            files_request = self.session.get(files_url, headers=self.issue_headers, params=params)
+            if files_request.status_code != 200:
+                return None
+            files = files_request.json().get('files', [])
+            if '/compare/' in diff_url:
+                base_sha = files_request.json()['merge_base_commit']['sha']
+            else:
+                parents = files_request.json().get('parents', [])
+                base_sha = parents[0]['sha'] if parents else None
+
+        # Compare only lists files on the first page (pagination applies to its commits), others list them all.
+        last_page = 1 if '/compare/' in diff_url else self._get_last_page(files_request)
+        if last_page > 1:
+            with ThreadPoolExecutor(max_workers=self.max_concurrent_requests) as executor:
+                pages = list(executor.map(lambda page: self._get_files_page(files_url, page), range(2, last_page + 1)))
+            if any(page is None for page in pages):
+                return None
+            for page in pages:
+                files.extend(page)
+        print(f'Retrieved {len(files)} changed files')
+        max_files = 300 if '/compare/' in diff_url else 3000
+        if len(files) >= max_files:
+            # Carrying on would silently miss the TODOs in the rest of the files.
+            print(f'GitHub lists at most {max_files} changed files here, so the changed files can\'t all be retrieved')
+            self.too_many_files = True
+            return None
+        if re.search(r'/pulls/\d+$', diff_url) and any(file.get('patch') is None and file['status'] != 'added'
+                                                       for file in files):
+            # Diff against where the branch left the base branch, which may have moved on since.
+            base_sha = self._get_merge_base(pull['base']['sha'], pull['head']['sha'])
+            if base_sha is None:
+                return None
+
+        # Files that are too large (or binary) have no patch, so may need their contents fetching too.
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_requests) as executor:
+            sections = list(executor.map(lambda file: self._get_file_section(file, base_sha, parser), files))
+        return ''.join(section for section in sections if section)
+
+    def _get_merge_base(self, base, head):
+        """Get the commit that two commits' histories last had in common, or None if it couldn't be retrieved."""
+        compare_url = f'{self.repos_url}{self.repo}/compare/{base}...{head}'
+        compare_request = self.session.get(compare_url, headers=self.issue_headers, params={'per_page': 1})
+        if compare_request.status_code != 200:
+            return None
+        return compare_request.json()['merge_base_commit']['sha']
+
+    def _get_files_page(self, files_url, page):
+        """Get a page of the changed files list, or None if it couldn't be retrieved."""
+        params = {'per_page': 100, 'page': page}
+        files_request = self.session.get(files_url, headers=self.issue_headers, params=params)
+        if files_request.status_code != 200:
+            return None
+        files = files_request.json()
+        return files if isinstance(files, list) else files.get('files', [])
+
+    # noinspection PyMethodMayBeStatic
+    def _get_last_page(self, request):
+        """Get the number of the last page of a paginated response."""
+        last_url = request.links.get('last', {}).get('url')
+        if not last_url:
+            return 1
+        return int(parse_qs(urlparse(last_url).query).get('page', ['1'])[0])
+
+    def _get_file_section(self, file, base_sha, parser=None):
+        """Build the section of the diff for one changed file."""
+        file_name = file['filename']
+        previous_file_name = file.get('previous_filename', file_name)
+        status = file['status']
+        if parser and not parser.should_parse(file_name):
+            # The parser would skip this file anyway, so don't fetch anything for it.
+            return None
+        patch = file.get('patch')
+        if patch is None:
+            if not file.get('changes'):
+                # Binary files and pure renames have no changed lines to check.
+                return None
+            old_contents = '' if status == 'added' or not base_sha else self._get_file_contents(previous_file_name,
+                                                                                               base_sha)
+            new_contents = '' if status == 'removed' else self._get_blob_contents(file['sha'])
+            if old_contents is None or new_contents is None:
+                print(f'Could not retrieve the contents of "{file_name}", so it will not be checked for TODOs.')
+                return None
+            # Skip the file headers produced by difflib.
+            patch = '\n'.join(list(difflib.unified_diff(old_contents.splitlines(), new_contents.splitlines(),
+                                                        n=3, lineterm=''))[2:])
+            if not patch:
+                return None
+
+        section = [f'diff --git a/{previous_file_name} b/{file_name}']
+        if status == 'added':
+            section.append('new file mode 100644')
+            section.append(f'index 0000000..{file["sha"]}')
+        else:
+            if status == 'removed':
+                section.append('deleted file mode 100644')
+            # Only the new blob is known, which isn't enough to identify the change.
+            section.append('index 0000000..0000000')
+        section.append('--- /dev/null' if status == 'added' else f'--- a/{previous_file_name}')
+        section.append('+++ /dev/null' if status == 'removed' else f'+++ b/{file_name}')
+        section.append(patch)
+        return '\n'.join(section) + '\n'
+
+    def _get_file_contents(self, file_name, ref):
+        """Get the contents of a file at a particular commit."""
+        contents_url = f'{self.repos_url}{self.repo}/contents/{quote(file_name)}'
+        contents_request = self.session.get(contents_url, headers=dict(self.issue_headers,
+                                                                   Accept='application/vnd.github.raw+json'),
+                                        params={'ref': ref})
+        if contents_request.status_code == 200:
+            return contents_request.content.decode('utf-8', errors='replace')
+        return None
+
+    def _get_blob_contents(self, sha):
+        """Get the contents of a blob."""
+        blob_url = f'{self.repos_url}{self.repo}/git/blobs/{sha}'
+        blob_request = self.session.get(blob_url, headers=dict(self.issue_headers,
+                                                           Accept='application/vnd.github.raw+json'))
+        if blob_request.status_code == 200:
+            return blob_request.content.decode('utf-8', errors='replace')
+        return None
+
     # noinspection PyMethodMayBeStatic
     def _get_timestamp(self, commit):
         """Get a commit timestamp."""
         return commit.get('timestamp')
 
-    def _get_milestones(self, page=1):
+    def _get_milestones(self):
         """Get all the milestones."""
-        params = {
-            'per_page': 100,
-            'page': page,
-            'state': 'open'
-        }
-        milestones_request = requests.get(self.milestones_url, headers=self.issue_headers, params=params)
-        if milestones_request.status_code == 200:
-            self.milestones.extend(milestones_request.json())
-            links = milestones_request.links
-            if 'next' in links:
-                self._get_milestones(page + 1)
+        self.milestones = self._get_all_pages(self.milestones_url, {'state': 'open'},
+                                              lambda milestone: {'number': milestone['number'],
+                                                                 'title': milestone['title']})
 
     def _get_milestone(self, title):
         """Get the milestone number for the one with this title (creating one if it doesn't exist)."""
@@ -146,25 +386,59 @@ class GitHubClient(Client):
         milestone_data = {
             'title': title
         }
-        milestone_request = requests.post(self.milestones_url, headers=self.issue_headers, json=milestone_data)
-        return milestone_request.json()['number'] if milestone_request.status_code == 201 else None
+        milestone_request = self.session.post(self.milestones_url, headers=self.issue_headers, json=milestone_data)
+        if milestone_request.status_code != 201:
+            return None
+        # Keep the milestones up to date, so other TODOs with the same milestone don't create it again.
+        self.milestones.append({'number': milestone_request.json()['number'], 'title': title})
+        return milestone_request.json()['number']
 
-    def _get_existing_issues(self, page=1):
+    def _get_existing_issues(self):
         """Populate the existing issues list."""
-        params = {
-            'per_page': 100,
-            'page': page,
-            'state': 'open'
-        }
-        list_issues_request = requests.get(self.issues_url, headers=self.issue_headers, params=params)
-        if list_issues_request.status_code == 200:
-            self.existing_issues.extend(list_issues_request.json())
-            links = list_issues_request.links
-            if 'next' in links:
-                self._get_existing_issues(page + 1)
+        self.existing_issues = self._get_all_pages(self.issues_url, {'state': 'open'}, self._get_issue_summary)
+
+    def _get_issue_summary(self, issue):
+        """Keep only what's needed of an issue, as there may be thousands of them."""
+        fingerprint_search = self.FINGERPRINT_PATTERN.search(issue.get('body') or '')
+        blob_url_search = self.BLOB_URL_PATTERN.search(issue.get('body') or '')
+        return {'number': issue['number'], 'title': issue['title'], 'html_url': issue['html_url'],
+                'fingerprint': fingerprint_search.group(1) if fingerprint_search else None,
+                'file_name': unquote(blob_url_search.group(1)) if blob_url_search else None}
+
+    def _get_all_pages(self, url, params, summarise):
+        """
+        Get every item in a paginated list, summarising each one. The number of pages is known from the first page,
+        so the rest are fetched concurrently.
+        """
+        pages = [self._get_page(url, params, 1)]
+        last_page = self._get_last_page(pages[0])
+        if last_page > 1:
+            with ThreadPoolExecutor(max_workers=self.max_concurrent_requests) as executor:
+                pages.extend(executor.map(lambda page: self._get_page(url, params, page), range(2, last_page + 1)))
+        return [summarise(item) for page in pages for item in page.json()]
+
+    def _get_page(self, url, params, page):
+        """Get a page of a paginated list, retrying if it can't be retrieved."""
+        for attempt in range(self.page_retries + 1):
+            if attempt:
+                time.sleep(self.page_retry_delay * attempt)
+            page_request = self.session.get(url, headers=self.issue_headers,
+                                            params=dict(params, per_page=100, page=page))
+            if page_request.status_code == 200:
+                return page_request
+        # Carrying on with part of the list would lead to duplicate issues, or issues left open.
+        raise Exception('\n'.join([f'Could not retrieve page {page} of {url}',
+                                    f'Status code: {page_request.status_code}',
+                                    'Operation will abort']))
 
     def _get_project_id(self, project):
-        """Get the project ID."""
+        """Get the project ID, retrieving it the first time it's needed."""
+        if project not in self.project_ids:
+            self.project_ids[project] = self._find_project_id(project)
+        return self.project_ids[project]
+
+    def _find_project_id(self, project):
+        """Find the project ID."""
         project_type, owner, project_name = project.split('/')
         if project_type == 'user':
             query = """
@@ -199,7 +473,7 @@ class GitHubClient(Client):
         variables = {
             'owner': owner,
         }
-        project_request = requests.post('https://api.github.com/graphql',
+        project_request = self.session.post('https://api.github.com/graphql',
                                         json={'query': query, 'variables': variables},
                                         headers=self.graphql_headers)
         if project_request.status_code == 200:
@@ -226,7 +500,7 @@ class GitHubClient(Client):
             'repo': repo,
             'issue_number': issue_number
         }
-        project_request = requests.post('https://api.github.com/graphql',
+        project_request = self.session.post('https://api.github.com/graphql',
                                         json={'query': query, 'variables': variables},
                                         headers=self.graphql_headers)
         if project_request.status_code == 200:
@@ -248,16 +522,49 @@ class GitHubClient(Client):
             "projectId": project_id,
             "contentId": issue_id
         }
-        project_request = requests.post('https://api.github.com/graphql',
+        project_request = self.session.post('https://api.github.com/graphql',
                                         json={'query': mutation, 'variables': variables},
                                         headers=self.graphql_headers)
         return project_request.status_code
 
+    def _pace_writes(self):
+        """Wait until long enough has passed since the last request creating or changing an issue with this token."""
+        with self.next_writes_lock:
+            now = time.monotonic()
+            write_time = max(now, self.next_writes.get(self.token, now))
+            # Take the slot before waiting for it, so other clients wait for the one after.
+            self.next_writes[self.token] = write_time + self.min_write_interval
+        if write_time > now:
+            time.sleep(write_time - now)
+
+    def _is_valid_assignee(self, assignee):
+        """Check whether a user can be assigned issues in the repo, remembering the answer for the rest of the run."""
+        if assignee not in self.valid_assignees:
+            assignee_url = f'{self.repos_url}{self.repo}/assignees/{assignee}'
+            assignee_request = self.session.get(url=assignee_url, headers=self.issue_headers)
+            self.valid_assignees[assignee] = assignee_request.status_code == 204
+        return self.valid_assignees[assignee]
+
+    def create_issues(self, issues):
+        """
+        Create (or update) the issues for several TODOs. The lookups they share, i.e. the assignees and milestones,
+        are made first (concurrently where possible), then the issues are written one at a time.
+        """
+        assignees = {assignee for issue in issues for assignee in issue.assignees}
+        assignees.update(issue.ref.lstrip('@') for issue in issues if issue.ref and issue.ref.startswith('@'))
+        assignees.difference_update(self.valid_assignees)
+        if len(assignees) > 1:
+            with ThreadPoolExecutor(max_workers=self.max_concurrent_requests) as executor:
+                list(executor.map(self._is_valid_assignee, sorted(assignees)))
+        if any(issue.milestone for issue in issues) and self._milestones is None:
+            self._get_milestones()
+        return [self.create_issue(issue) for issue in issues]
+
     def _comment_issue(self, issue_number, comment):
         """Post a comment on an issue."""
         issue_comment_url = f'{self.repos_url}{self.repo}/issues/{issue_number}/comments'
         body = {'body': comment}
-        update_issue_request = requests.post(issue_comment_url, headers=self.issue_headers, json=body)
+        update_issue_request = self.session.post(issue_comment_url, headers=self.issue_headers, json=body)
         return update_issue_request.status_code
 
     def _find_existing_issue_by_title(self, title):
@@ -267,7 +574,7 @@ class GitHubClient(Client):
             'q': f'repo:{self.repo} is:issue in:title {title}',
             'per_page': 30
         }
-        search_request = requests.get(search_url, headers=self.issue_headers, params=params)
+        search_request = self.session.get(search_url, headers=self.issue_headers, params=params)
         if search_request.status_code == 200:
             results = search_request.json().get('items', [])
             for result in results:
@@ -301,8 +608,6 @@ class GitHubClient(Client):
             # Issue already exists, update existing rather than create new.
             endpoint += f'/{issue.issue_number}'
 
-        title = issue.title
-
         if issue.ref:
             if issue.ref.startswith('@'):
                 # Ref = assignee.
@@ -315,12 +620,20 @@ class GitHubClient(Client):
                 issue_number = issue.ref.lstrip('#')
                 if issue_number.isdigit():
                     # Create the comment now.
+                    self._pace_writes()
                     return self._comment_issue(issue_number, f'{issue.title}\n\n{issue_contents}'), None
-            else:
-                # Just prepend the ref to the title.
-                title = f'[{issue.ref}] {issue.title}'
 
-        title = title + '...' if len(title) > self.max_issue_title_length else title
+        title = self.get_issue_title(issue)
+
+        # Updating the issue is pointless if none of the fields it's rendered from have changed.
+        # Line numbers and the snippet are left out, so that changes to the surrounding code don't count.
+        requested_assignees = issue.assignees if issue.assignees or not self.auto_assign else [self.actor]
+        fingerprint = self._get_fingerprint([title, issue.body, sorted(issue.labels), sorted(requested_assignees),
+                                             issue.milestone, issue.file_name, issue_template])
+        if issue.issue_url and self._get_existing_fingerprint(issue.issue_number) == fingerprint:
+            print(f'Skipping issue update (no changes): #{issue.issue_number}')
+            return 200, issue.issue_number
+        issue_contents += f'\n\n<!-- todo-to-issue fingerprint: {fingerprint} -->'
 
         # Check for duplicate issues before creating a new one.
         if not issue.issue_url:
@@ -336,9 +649,7 @@ class GitHubClient(Client):
         if len(issue.assignees) == 0 and self.auto_assign:
             valid_assignees.append(self.actor)
         for assignee in issue.assignees:
-            assignee_url = f'{self.repos_url}{self.repo}/assignees/{assignee}'
-            assignee_request = requests.get(url=assignee_url, headers=self.issue_headers)
-            if assignee_request.status_code == 204:
+            if self._is_valid_assignee(assignee):
                 valid_assignees.append(assignee)
             else:
                 print(f'Assignee {assignee} does not exist! Dropping this assignee!')
@@ -351,15 +662,21 @@ class GitHubClient(Client):
             else:
                 print(f'Milestone {issue.milestone} could not be set. Dropping this milestone!')
 
+        self._pace_writes()
         if issue.issue_url:
             # Update existing issue.
-            issue_request = requests.patch(url=endpoint, headers=self.issue_headers, json=new_issue_body)
+            issue_request = self.session.patch(url=endpoint, headers=self.issue_headers, json=new_issue_body)
         else:
             # Create new issue.
-            issue_request = requests.post(url=endpoint, headers=self.issue_headers, json=new_issue_body)
+            issue_request = self.session.post(url=endpoint, headers=self.issue_headers, json=new_issue_body)
 
         request_status = issue_request.status_code
         issue_number = issue_request.json()['number'] if request_status in [200, 201] else None
+        if issue.issue_url and request_status == 200 and self._existing_issues is not None:
+            # Keep the existing issue up to date, in case the same TODO appears again.
+            self.existing_issues = [self._get_issue_summary(issue_request.json())
+                                    if str(existing_issue['number']) == str(issue_number)
+                                    else existing_issue for existing_issue in self.existing_issues]
 
         # Check if issue should be added to a project now it exists.
         if issue_number and self.project:
@@ -372,56 +689,152 @@ class GitHubClient(Client):
 
         return request_status, issue_number
 
-    def close_issue(self, issue):
-        """Check to see if this issue can be found on GitHub and if so close it."""
-        issue_number = None
+    @staticmethod
+    def _get_fingerprint(fields):
+        return hashlib.sha256(json.dumps(fields).encode('utf-8')).hexdigest()[:16]
+
+    def _get_existing_fingerprint(self, issue_number):
+        """Get the fingerprint in the body of an open issue, if there is one."""
+        if self._existing_issues is not None:
+            for existing_issue in self._existing_issues:
+                if str(existing_issue['number']) == str(issue_number):
+                    return existing_issue['fingerprint']
+            return None
+        # Rather than loading every open issue just for this one.
+        issue_request = self.session.get(f'{self.issues_url}/{issue_number}', headers=self.issue_headers)
+        if issue_request.status_code != 200 or issue_request.json().get('state') != 'open':
+            return None
+        return self._get_issue_summary(issue_request.json())['fingerprint']
+
+    def _get_existing_issue_number(self, issue, action='closure'):
+        """Find the number of the open issue for a TODO, as long as there's only one it could be."""
         if issue.issue_number:
             # If URL insertion is enabled.
-            issue_number = issue.issue_number
-        else:
-            # Try simple matching.
-            matched = 0
-            # If title length is long, make sure we're searching using the exact same title as would've been inserted.
-            search_title = issue.title + '...' if len(issue.title) > self.max_issue_title_length else issue.title
-            for existing_issue in self.existing_issues:
-                if existing_issue['title'] == search_title:
-                    matched += 1
-                    # If there are multiple issues with similar titles, don't try and close any.
-                    if matched > 1:
-                        print(f'Skipping issue closure due to ambiguous match against multiple existing issues, shown below')
-                        for x in self.existing_issues:
-                            if x['title'] == search_title:
-                                print(f' {x["html_url"]}')
-                        issue_number = None
-                        break
-                    issue_number = existing_issue['number']
+            return issue.issue_number
+        # Try simple matching.
+        # If title length is long, make sure we're searching using the exact same title as would've been inserted.
+        search_title = issue.title + '...' if len(issue.title) > self.max_issue_title_length else issue.title
+        matches = self._get_issues_with_title(search_title)
+        if len(matches) > 1:
+            # The issue linking to the TODO's file is the one, if only one does (e.g. for a TODO in a deleted file).
+            file_name = getattr(issue, 'file_name', None)
+            file_matches = [match for match in matches if file_name and match.get('file_name') == file_name]
+            if len(file_matches) == 1:
+                return file_matches[0]['number']
+            # If there are multiple issues with similar titles, don't try and match any.
+            print(f'Skipping issue {action} due to ambiguous match against multiple existing issues, shown below')
+            for x in matches:
+                print(f' {x["html_url"]}')
+            return None
+        return matches[0]['number'] if matches else None
+
+    def move_issue(self, old_issue, new_issue):
+        """Update the issue for a TODO that has moved, so that it links to where the TODO is now."""
+        issue_number = self._get_existing_issue_number(old_issue, 'update')
+        if not issue_number:
+            return None, None
+        new_issue.issue_number = issue_number
+        new_issue.issue_url = self.get_issue_url(issue_number)
+        return self.create_issue(new_issue)
+
+    def close_issue(self, issue):
+        """Check to see if this issue can be found on GitHub and if so close it."""
+        issue_number = self._get_existing_issue_number(issue)
+        if issue_number and issue_number in self.closed_issue_numbers:
+            # Another TODO for the same issue (e.g. in the same deleted file) has already closed it.
+            return 200
         if issue_number:
+            self.closed_issue_numbers.add(issue_number)
+            # Reference the issue in the description if this is a PR, all at once at the end of the run.
+            pr_number = self._get_pr_number()
+            if pr_number:
+                self.pr_closed_issues.append(issue_number)
+                if self.close_on_merge:
+                    # GitHub closes the issue once the PR is merged.
+                    return 200
             update_issue_url = f'{self.issues_url}/{issue_number}'
             body = {'state': 'closed'}
-            requests.patch(update_issue_url, headers=self.issue_headers, json=body)
-            request_status = self._comment_issue(issue_number, f'Closed in {self.sha}.')
-
-            # Update the description if this is a PR.
-            if os.getenv('GITHUB_EVENT_NAME') == 'pull_request':
-                pr_number = os.getenv('PR_NUMBER')
-                if pr_number:
-                    request_status = self._update_pr_body(pr_number, body)
-            return request_status
+            self._pace_writes()
+            self.session.patch(update_issue_url, headers=self.issue_headers, json=body)
+            return self._comment_issue(issue_number, f'Closed in {self.sha}.')
         return None
 
-    def _update_pr_body(self, pr_number, issue_number):
-        """Add a close message for an issue to a PR."""
+    # noinspection PyMethodMayBeStatic
+    def _get_pr_number(self):
+        """Get the number of the PR this run is for, if it is for one."""
+        if os.getenv('GITHUB_EVENT_NAME') == 'pull_request':
+            return os.getenv('PR_NUMBER') or None
+        return None
+
+    def finish(self):
+        """Add a close message to the PR for each issue closed during the run."""
+        pr_number = self._get_pr_number()
+        if pr_number and self.pr_closed_issues and self.defer_pr_update:
+            print(f'Leaving the close messages for PR #{pr_number} to the job merging the shard summaries')
+        elif pr_number and self.pr_closed_issues:
+            status_code = self._update_pr_body(pr_number, self.pr_closed_issues)
+            if status_code == 200:
+                self.pr_closed_issues = []
+            else:
+                print(f'Could not update the description of PR #{pr_number}')
+
+    def _update_pr_body(self, pr_number, issue_numbers):
+        """Add a close message for each issue to a PR, in one update."""
         pr_url = f'{self.repos_url}{self.repo}/pulls/{pr_number}'
-        pr_request = requests.get(pr_url, headers=self.issue_headers)
+        pr_request = self.session.get(pr_url, headers=self.issue_headers)
         if pr_request.status_code == 200:
-            pr_body = pr_request.json()['body']
-            close_message = f'Closes #{issue_number}'
-            if close_message not in pr_body:
+            pr_body = pr_request.json()['body'] or ''
+            close_messages = [f'Closes #{issue_number}' for issue_number in dict.fromkeys(issue_numbers)]
+            close_messages = [close_message for close_message in close_messages
+                              if not re.search(fr'{re.escape(close_message)}\b', pr_body)]
+            if close_messages:
+                close_message = '\n'.join(close_messages)
                 updated_pr_body = f'{pr_body}\n\n{close_message}' if pr_body.strip() else close_message
                 body = {'body': updated_pr_body}
-                pr_update_request = requests.patch(pr_url, headers=self.issue_headers, json=body)
+                pr_update_request = self.session.patch(pr_url, headers=self.issue_headers, json=body)
                 return pr_update_request.status_code
         return pr_request.status_code
 
+    def get_rate_limit(self):
+        """Get the number of requests left under each rate limit, or None if it couldn't be checked."""
+        # Checking the rate limit doesn't count against it. With a token pool, the limits of all the tokens add up.
+        remaining = {}
+        for token in self.token_pool.tokens if self.token_pool else [self.token]:
+            headers = dict(self.issue_headers, Authorization=f'token {token}')
+            rate_limit_request = self.session.get(f'{self.base_url}rate_limit', headers=headers)
+            if rate_limit_request.status_code != 200:
+                continue
+            for name, resource in rate_limit_request.json().get('resources', {}).items():
+                remaining[name] = remaining.get(name, 0) + resource['remaining']
+        return remaining or None
+
+    def estimate_requests(self, issue):
+        """
+        Estimate the requests needed to create, update or close the issue for a TODO, under each rate limit.
+        'writes' counts the requests creating content, which GitHub limits separately.
+        """
+        if issue.status == LineStatus.DELETED:
+            # Closing it, and commenting on it, unless that's left until the PR is merged. The PR description is
+            # updated once for all the issues, which the reserved requests allow for.
+            if self.close_on_merge and self._get_pr_number():
+                return {}
+            return {'core': 2, 'writes': 2}
+        if issue.ref and issue.ref.startswith('#'):
+            # Just a comment.
+            return {'core': 1, 'writes': 1}
+        # Creating or updating it, after checking its assignees exist. The search for duplicates isn't counted, as its
+        # limit resets every minute, and issues are processed more slowly than that.
+        estimate = {'core': 1 + len(issue.assignees), 'writes': 1}
+        if self.project:
+            estimate['graphql'] = 3
+        return estimate
+
+    def get_todo_issues(self):
+        """
+        Get the open issues that were created for TODOs, i.e. those with the fingerprint the action adds. Linking to a
+        file isn't enough, as people link to code in the issues they write too.
+        """
+        return [existing_issue for existing_issue in self.existing_issues if existing_issue.get('fingerprint')]
+
     def get_issue_url(self, new_issue_number):
         return f'{self.line_base_url}{self.repo}/issues/{new_issue_number}'
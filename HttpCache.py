@@ -0,0 +1,138 @@
+import atexit
+import base64
+import hashlib
+import json
+import os
+import threading
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+class HttpCache(object):
+    """
+    Persistent cache of GET responses along with their validators (ETag and Last-Modified), so that the same requests
+    can be made conditionally next time. GitHub doesn't count a 304 Not Modified response against the rate limit.
+    """
+    VERSION = 1
+    MAX_ENTRIES = 5000
+    # The response headers worth keeping: the validators, and those used to read the response.
+    KEPT_HEADERS = ['ETag', 'Last-Modified', 'Link', 'Content-Type']
+    # One cache for each path, shared by every client in this process.
+    _caches: dict[str, 'HttpCache'] = {}
+    _caches_lock = threading.Lock()
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.changed = False
+        self.lock = threading.Lock()
+        if os.path.isfile(path):
+            try:
+                with open(path) as cache_file:
+                    data = json.load(cache_file)
+                if data.get('version') == self.VERSION:
+                    self.entries = data.get('entries', {})
+            except (OSError, ValueError):
+                print('Invalid HTTP cache, ignoring.')
+
+    @classmethod
+    def open(cls, path):
+        """Get the cache for a path, loading it the first time, and saving it when the process exits."""
+        with cls._caches_lock:
+            if path not in cls._caches:
+                cls._caches[path] = cls(path)
+                atexit.register(cls._caches[path].save)
+            return cls._caches[path]
+
+    @staticmethod
+    def get_key(url, params, headers):
+        """
+        Get the cache key for a request. Responses depend on who's asking (e.g. private repos), so the token is part
+        of the key, though only a hash of it is stored.
+        """
+        headers = CaseInsensitiveDict(headers or {})
+        key = [url, sorted((params or {}).items()), headers.get('Accept'), headers.get('Authorization')]
+        return hashlib.sha256(json.dumps(key, default=str).encode('utf-8')).hexdigest()
+
+    def get_validators(self, key):
+        """Get the headers making a request conditional on the cached response having changed."""
+        with self.lock:
+            entry = self.entries.get(key)
+        if not entry:
+            return {}
+        validators = {}
+        if 'ETag' in entry['headers']:
+            validators['If-None-Match'] = entry['headers']['ETag']
+        if 'Last-Modified' in entry['headers']:
+            validators['If-Modified-Since'] = entry['headers']['Last-Modified']
+        return validators
+
+    def get(self, key, url):
+        """Rebuild the cached response for a key, or return None if it isn't cached."""
+        with self.lock:
+            entry = self.entries.get(key)
+        if not entry:
+            return None
+        response = requests.Response()
+        response.status_code = entry['status']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response._content = base64.b64decode(entry['content'])
+        response.encoding = 'utf-8'
+        response.url = url
+        return response
+
+    def set(self, key, response):
+        headers = {header: response.headers[header] for header in self.KEPT_HEADERS if header in response.headers}
+        if 'ETag' not in headers and 'Last-Modified' not in headers:
+            # The response can't be revalidated, so there's no point keeping it.
+            return
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = {'status': response.status_code, 'headers': headers,
+                                 'content': base64.b64encode(response.content).decode('ascii')}
+            self.changed = True
+
+    def save(self):
+        """Write the cache back to disk, discarding the oldest entries if it has grown too large."""
+        with self.lock:
+            if not self.changed:
+                return
+            for key in list(self.entries)[:max(len(self.entries) - self.MAX_ENTRIES, 0)]:
+                del self.entries[key]
+            data = {'version': self.VERSION, 'entries': self.entries}
+            temp_path = f'{self.path}.tmp'
+            try:
+                with open(temp_path, 'w') as cache_file:
+                    json.dump(data, cache_file)
+                os.replace(temp_path, self.path)
+                self.changed = False
+            except OSError:
+                print(f'Could not write HTTP cache to "{self.path}".')
+
+
+class CachedSession(object):
+    """Wraps a session (or the requests module), making GET requests conditional on the cached responses."""
+
+    def __init__(self, session, cache):
+        self.session = session
+        self.cache = cache
+
+    def get(self, url, params=None, headers=None, **kwargs):
+        key = self.cache.get_key(url, params, headers)
+        request_headers = dict(headers or {})
+        request_headers.update(self.cache.get_validators(key))
+        response = self.session.get(url, params=params, headers=request_headers, **kwargs)
+        if response.status_code == 304:
+            cached_response = self.cache.get(key, response.url)
+            if cached_response is not None:
+                return cached_response
+        elif response.status_code == 200:
+            self.cache.set(key, response)
+        return response
+
+    def post(self, *args, **kwargs):
+        return self.session.post(*args, **kwargs)
+
+    def patch(self, *args, **kwargs):
+        return self.session.patch(*args, **kwargs)
@@ -1,3 +1,7 @@
+from CodeSnippet import CodeSnippet
+from LineStatus import LineStatus
+
+
 class Issue(object):
     """Basic Issue model for collecting the necessary info to send to GitHub."""
 
@@ -24,9 +28,44 @@ class Issue(object):
         self.issue_number = issue_number
         self.start_line_within_hunk = start_line_within_hunk
 
+    @property
+    def hunk(self):
+        """The code snippet for this issue, which may be shared with other issues from the same code block."""
+        if isinstance(self._hunk, CodeSnippet):
+            return self._hunk.text
+        return self._hunk
+
+    @hunk.setter
+    def hunk(self, value):
+        self._hunk = value
+
+    @property
+    def snippet(self):
+        """The shared code block this issue was found in, unless the snippet has since been replaced."""
+        return self._hunk if isinstance(self._hunk, CodeSnippet) else None
+
+    def materialise(self):
+        """
+        Replace the shared code block with this issue's cleaned snippet, e.g. before the issue is sent to another
+        process, so only the snippet is copied rather than the raw code block.
+        """
+        self._hunk = self.hunk
+
+    def to_dict(self):
+        """Get the issue as a dict of plain values, e.g. to store as JSON."""
+        issue_dict = {key.lstrip('_'): value for key, value in vars(self).items()}
+        issue_dict['hunk'] = self.hunk
+        issue_dict['status'] = self.status.name
+        return issue_dict
+
+    @classmethod
+    def from_dict(cls, issue_dict):
+        """Create an issue from a dict made by to_dict."""
+        return cls(**dict(issue_dict, status=LineStatus[issue_dict['status']]))
+
     def __str__(self):
         selflist = []
-        for key in [x for x in vars(self).keys() if x not in ("hunk")]:
+        for key in [x for x in vars(self).keys() if x not in ("_hunk")]:
             selflist.append(f'"{key}": "{getattr(self, key)}"')
         selflist.append((f'"hunk": "{self.hunk}"'))
         return '\n'.join(selflist)
\ No newline at end of file
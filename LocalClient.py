@@ -1,8 +1,34 @@
+import io
 import subprocess
 import os
 from Client import Client
 
+
+class DiffPipe(io.TextIOWrapper):
+    """
+    Text stream over the output of git, which waits for git to exit when closed, raising if it failed (so that a failed
+    diff isn't mistaken for an empty one).
+    """
+
+    def __init__(self, process):
+        super().__init__(process.stdout, encoding='latin-1', newline='\n')
+        self.process = process
+
+    def close(self):
+        super().close()
+        return_code = self.process.wait()
+        if return_code != 0:
+            raise subprocess.CalledProcessError(return_code, self.process.args)
+
+
 class LocalClient(Client):
+    # Characters with a special meaning in POSIX extended regular expressions.
+    ERE_SPECIAL_CHARACTERS = '.[]()*+?{}|^$\\'
+    # Characters with a special meaning in git pathspecs.
+    PATHSPEC_SPECIAL_CHARACTERS = '*?[]\\'
+    # Characters with a special meaning in Python regular expressions.
+    REGEX_SPECIAL_CHARACTERS = '.^$*+?{}[]\\|()'
+
     def __init__(self):
         self.diff_url = None
         self.commits = ['placeholder'] # content doesn't matter, just length
@@ -32,3 +58,85 @@ class LocalClient(Client):
 
     def get_last_diff(self):
         return subprocess.run(['git', 'diff', f'{self.base_ref}..{self.sha}'], stdout=subprocess.PIPE).stdout.decode('latin-1')
+
+    def get_last_diff_file(self, parser=None):
+        """Stream the diff from git, letting git leave out any files the parser would skip anyway."""
+        return DiffPipe(subprocess.Popen(self._get_diff_command(parser), stdout=subprocess.PIPE))
+
+    def _get_diff_command(self, parser=None):
+        command = ['git', 'diff', f'{self.base_ref}..{self.sha}']
+        if parser is None:
+            return command
+        if parser.identifiers and os.getenv('INPUT_LOCAL_PICKAXE', 'false') == 'true':
+            # Only include files where an added or removed line mentions an identifier.
+            identifiers_regex = '|'.join(self._escape_ere(identifier) for identifier in parser.identifiers)
+            command.extend(['--regexp-ignore-case', f'-G{identifiers_regex}'])
+        command.append('--')
+        command.extend(self._get_supported_pathspecs(parser))
+        command.extend(self._get_ignore_pathspecs())
+        command.extend(self._get_exclude_pathspecs(parser))
+        return command
+
+    def _get_supported_pathspecs(self, parser):
+        """Get pathspecs matching every file whose language the parser supports."""
+        supported_languages = {syntax['language'] for syntax in parser.syntax_dict}
+        pathspecs = set()
+        for language_name, language in parser.languages_dict.items():
+            if language_name not in supported_languages:
+                continue
+            for extension in language.get('extensions', []):
+                pathspecs.add(f':(icase)*{self._escape_pathspec(extension)}')
+            for file_name in language.get('filenames', []):
+                # The parser compares file names without their extension.
+                pathspecs.add(f':(icase)*{self._escape_pathspec(file_name)}')
+                pathspecs.add(f':(icase)*{self._escape_pathspec(file_name)}.*')
+        return sorted(pathspecs)
+
+    def _get_ignore_pathspecs(self):
+        """Get exclude pathspecs for the IGNORE patterns simple enough to be expressed as pathspecs."""
+        ignore_patterns = os.getenv('INPUT_IGNORE', None)
+        pathspecs = []
+        if ignore_patterns:
+            for pattern in filter(None, [pattern.strip() for pattern in ignore_patterns.split(',')]):
+                pathspec = self._regex_to_pathspec(pattern)
+                if pathspec:
+                    pathspecs.append(f':(exclude){pathspec}')
+        return pathspecs
+
+    # noinspection PyMethodMayBeStatic
+    def _get_exclude_pathspecs(self, parser):
+        """Get exclude pathspecs for the EXCLUDE globs."""
+        pathspecs = []
+        for glob in parser.path_filter.exclude_globs:
+            # Like .gitignore, a glob without a slash matches files in any directory.
+            prefix = '**/' if '/' not in glob.rstrip('/') else ''
+            pathspecs.append(f':(exclude,glob){prefix}{glob.rstrip("/")}')
+        return pathspecs
+
+    def _regex_to_pathspec(self, pattern):
+        """Translate a regex made only of literals and '.*' into a pathspec, or return None if it can't be."""
+        pathspec = ''
+        i = 0
+        while i < len(pattern):
+            if pattern.startswith('.*', i):
+                pathspec += '*'
+                i += 2
+            elif pattern[i] == '\\' and i + 1 < len(pattern) and pattern[i + 1] in self.REGEX_SPECIAL_CHARACTERS:
+                pathspec += self._escape_pathspec(pattern[i + 1])
+                i += 2
+            elif pattern[i] == '$' and i == len(pattern) - 1:
+                # The pattern is anchored at the end, so nothing more can follow.
+                return pathspec
+            elif pattern[i] not in self.REGEX_SPECIAL_CHARACTERS:
+                pathspec += self._escape_pathspec(pattern[i])
+                i += 1
+            else:
+                return None
+        # Patterns are only anchored at the start, so anything can follow.
+        return pathspec + '*'
+
+    def _escape_ere(self, value):
+        return ''.join('\\' + c if c in self.ERE_SPECIAL_CHARACTERS else c for c in value)
+
+    def _escape_pathspec(self, value):
+        return ''.join('\\' + c if c in self.PATHSPEC_SPECIAL_CHARACTERS else c for c in value)
@@ -0,0 +1,185 @@
+import json
+import os
+import sqlite3
+import threading
+
+from Client import Client
+
+
+class LocalTrackerClient(Client):
+    """
+    Client keeping issues in a local SQLite file instead of on GitHub, with the same behaviour where it matters:
+    issues are numbered in order, duplicates are found by title, and closing an issue matches it by number or title
+    and leaves a comment. Useful for trying out (or timing) runs over a repo's history without touching GitHub.
+    """
+    def __init__(self, path, repo=None, diff_client=None):
+        self.path = path
+        self.repo = repo or os.getenv('INPUT_REPO') or 'local/repo'
+        # Where the diff comes from, if anywhere (e.g. a LocalClient); otherwise it's given to process_diff directly.
+        self.diff_client = diff_client
+        self.sha = getattr(diff_client, 'sha', None) or os.getenv('INPUT_SHA') or 'HEAD'
+        self.line_base_url = os.getenv('INPUT_GITHUB_SERVER_URL') or 'https://github.com/'
+        if not self.line_base_url.endswith('/'):
+            self.line_base_url += '/'
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        # Writes are committed once per batch, so durability on every write isn't needed.
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS issues (
+                repo TEXT NOT NULL,
+                number INTEGER NOT NULL,
+                title TEXT NOT NULL,
+                body TEXT NOT NULL,
+                state TEXT NOT NULL,
+                labels TEXT NOT NULL,
+                assignees TEXT NOT NULL,
+                milestone TEXT,
+                file_name TEXT,
+                PRIMARY KEY (repo, number)
+            );
+            CREATE INDEX IF NOT EXISTS issues_by_title ON issues (repo, title, state);
+            CREATE TABLE IF NOT EXISTS comments (
+                repo TEXT NOT NULL,
+                issue_number INTEGER NOT NULL,
+                body TEXT NOT NULL
+            );
+        """)
+        self.connection.commit()
+
+    def get_last_diff(self):
+        return self.diff_client.get_last_diff() if self.diff_client else None
+
+    def get_last_diff_file(self, parser=None):
+        if self.diff_client:
+            return self.diff_client.get_last_diff_file(parser)
+        return super().get_last_diff_file(parser)
+
+    def create_issue(self, issue):
+        with self.lock:
+            result = self._create_issue(issue)
+            self.connection.commit()
+        return result
+
+    def create_issues(self, issues):
+        with self.lock:
+            results = [self._create_issue(issue) for issue in issues]
+            self.connection.commit()
+        return results
+
+    def close_issue(self, issue):
+        with self.lock:
+            result = self._close_issue(issue)
+            self.connection.commit()
+        return result
+
+    def close_issues(self, issues):
+        with self.lock:
+            results = [self._close_issue(issue) for issue in issues]
+            self.connection.commit()
+        return results
+
+    def move_issue(self, old_issue, new_issue):
+        with self.lock:
+            issue_number = self._get_existing_issue_number(old_issue)
+            if not issue_number:
+                return None, None
+            new_issue.issue_number = issue_number
+            new_issue.issue_url = self.get_issue_url(issue_number)
+            result = self._create_issue(new_issue)
+            self.connection.commit()
+        return result
+
+    def finish(self):
+        with self.lock:
+            self.connection.commit()
+
+    def get_issue_url(self, new_issue_number):
+        return f'{self.line_base_url}{self.repo}/issues/{new_issue_number}'
+
+    def get_todo_issues(self):
+        with self.lock:
+            rows = self.connection.execute("SELECT number, title, file_name FROM issues "
+                                           "WHERE repo = ? AND state = 'open' ORDER BY number", [self.repo]).fetchall()
+        return [{'number': number, 'title': title, 'file_name': file_name} for number, title, file_name in rows]
+
+    def get_issues(self, state=None):
+        """Get the issues in the tracker (optionally only those in a state), in order."""
+        query = 'SELECT number, title, body, state, labels, assignees, milestone FROM issues WHERE repo = ?'
+        params = [self.repo]
+        if state:
+            query += ' AND state = ?'
+            params.append(state)
+        with self.lock:
+            rows = self.connection.execute(query + ' ORDER BY number', params).fetchall()
+        return [{'number': number, 'title': title, 'body': body, 'state': issue_state, 'labels': json.loads(labels),
+                 'assignees': json.loads(assignees), 'milestone': milestone}
+                for number, title, body, issue_state, labels, assignees, milestone in rows]
+
+    def get_comments(self, issue_number):
+        with self.lock:
+            rows = self.connection.execute('SELECT body FROM comments WHERE repo = ? AND issue_number = ? '
+                                           'ORDER BY rowid', [self.repo, int(issue_number)]).fetchall()
+        return [body for body, in rows]
+
+    def _create_issue(self, issue):
+        body = '\n\n'.join(issue.body + [f'{issue.file_name}#L{issue.start_line}'])
+        labels = list(issue.labels)
+        assignees = list(issue.assignees)
+        if issue.ref:
+            if issue.ref.startswith('@'):
+                assignees.append(issue.ref.lstrip('@'))
+            elif issue.ref.startswith('!'):
+                labels.append(issue.ref.lstrip('!'))
+            elif issue.ref.startswith('#'):
+                issue_number = issue.ref.lstrip('#')
+                if issue_number.isdigit():
+                    return self._comment_issue(issue_number, f'{issue.title}\n\n{body}'), None
+        title = self.get_issue_title(issue)
+        fields = [title, body, json.dumps(labels), json.dumps(assignees), issue.milestone, issue.file_name]
+
+        if issue.issue_url:
+            cursor = self.connection.execute('UPDATE issues SET title = ?, body = ?, labels = ?, assignees = ?, '
+                                             'milestone = ?, file_name = ? WHERE repo = ? AND number = ?',
+                                             fields + [self.repo, int(issue.issue_number)])
+            return (200, issue.issue_number) if cursor.rowcount else (404, None)
+
+        # Like a search on GitHub, an issue with the same title counts as a duplicate whether it's open or closed.
+        existing = self.connection.execute('SELECT number FROM issues WHERE repo = ? AND title = ? LIMIT 1',
+                                           [self.repo, title]).fetchone()
+        if existing:
+            print(f'Skipping issue creation (duplicate found): #{existing[0]} "{title}"')
+            return 200, existing[0]
+        number = self.connection.execute('SELECT COALESCE(MAX(number), 0) + 1 FROM issues WHERE repo = ?',
+                                         [self.repo]).fetchone()[0]
+        self.connection.execute('INSERT INTO issues (title, body, labels, assignees, milestone, file_name, repo, '
+                                "number, state) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'open')", fields + [self.repo, number])
+        return 201, number
+
+    def _close_issue(self, issue):
+        issue_number = self._get_existing_issue_number(issue)
+        if not issue_number:
+            return None
+        self.connection.execute("UPDATE issues SET state = 'closed' WHERE repo = ? AND number = ?",
+                                [self.repo, int(issue_number)])
+        return self._comment_issue(issue_number, f'Closed in {self.sha}.')
+
+    def _get_existing_issue_number(self, issue):
+        """Find the number of the open issue for a TODO, as long as there's only one it could be."""
+        if issue.issue_number:
+            return issue.issue_number
+        search_title = issue.title + '...' if len(issue.title) > self.max_issue_title_length else issue.title
+        matches = self.connection.execute("SELECT number FROM issues WHERE repo = ? AND title = ? AND state = 'open' "
+                                          "LIMIT 2", [self.repo, search_title]).fetchall()
+        if len(matches) > 1:
+            print('Skipping issue closure due to ambiguous match against multiple existing issues')
+            return None
+        return matches[0][0] if matches else None
+
+    def _comment_issue(self, issue_number, comment):
+        if not self.connection.execute('SELECT 1 FROM issues WHERE repo = ? AND number = ?',
+                                       [self.repo, int(issue_number)]).fetchone():
+            return 404
+        self.connection.execute('INSERT INTO comments VALUES (?, ?, ?)', [self.repo, int(issue_number), comment])
+        return 201
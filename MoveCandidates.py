@@ -0,0 +1,57 @@
+import re
+from collections import defaultdict
+
+from TodoParser import TodoParser
+
+
+class MoveCandidates(object):
+    """
+    Finds the TODOs in a diff that may have moved between files, without parsing it. Every line that looks like a TODO
+    is keyed on its identifier, ref and the first word of its title, which all stay the same when a TODO moves, and a
+    key found on both a removed line and an added line is a candidate. The check is much looser than the parser, so
+    it may find too many candidates, but never too few.
+    """
+
+    def __init__(self, identifiers):
+        # Matched at every position, as the parser may pick a different match on the line than the first one.
+        self.title_pattern = re.compile('(?=(' + '|'.join(re.escape(identifier) for identifier in identifiers)
+                                        + r')(\(([^)]+)\))?\s*[:\s]\s*\W*(\w*))', re.IGNORECASE)
+        # The files with a TODO-like line removed, and those with one added, for each key.
+        self.removed_files = defaultdict(set)
+        self.added_files = defaultdict(set)
+        self.files = []
+        self.curr_file = None
+        self.in_hunk = False
+
+    def add_line(self, line):
+        """Check the next line of the diff."""
+        if line.startswith('diff --git '):
+            header_search = TodoParser.SECTION_HEADER_PATTERN.search(line.rstrip('\n'))
+            self.curr_file = header_search.group(2) if header_search else None
+            if self.curr_file:
+                self.files.append(self.curr_file)
+            self.in_hunk = False
+        elif line.startswith('@@'):
+            self.in_hunk = True
+        elif self.in_hunk and self.curr_file and line[:1] in ['+', '-', ' ']:
+            for title_search in self.title_pattern.finditer(line):
+                key = (title_search.group(1).lower(), title_search.group(3), title_search.group(4))
+                # Unchanged lines count on both sides, as a TODO whose body has changed counts as added.
+                if line[0] != '+':
+                    self.removed_files[key].add(self.curr_file)
+                if line[0] != '-':
+                    self.added_files[key].add(self.curr_file)
+
+    @staticmethod
+    def get_issue_key(issue):
+        """Get the key for a TODO the parser has found."""
+        return ((issue.identifier_actual or '').lower(), issue.ref or None,
+                re.match(r'\W*(\w*)', issue.title).group(1))
+
+    def get_keys(self):
+        """Get the keys of the TODOs that may have moved."""
+        return set(self.removed_files).intersection(self.added_files)
+
+    def get_linked_files(self):
+        """Get the groups of files that the TODOs may have moved between, one for each key."""
+        return [self.removed_files[key] | self.added_files[key] for key in self.get_keys()]
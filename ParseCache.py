@@ -0,0 +1,90 @@
+import hashlib
+import json
+import os
+import re
+
+from Issue import Issue
+
+
+class ParseCache(object):
+    """Persistent cache of the issues found in each file section of a diff, keyed by the section's blob hashes."""
+    # Bumped when what's stored changes, e.g. version 2 fixed the snippets of removed TODOs, and version 3 stored each
+    # snippet only once for all the issues sharing it.
+    VERSION = 3
+    MAX_ENTRIES = 10000
+    NULL_HASH_PATTERN = re.compile(r'^0+$')
+
+    def __init__(self, path, config):
+        self.path = path
+        self.fingerprint = self._get_fingerprint(config)
+        self.entries = {}
+        self.changed = False
+        if os.path.isfile(path):
+            try:
+                with open(path) as cache_file:
+                    data = json.load(cache_file)
+                if data.get('version') == self.VERSION and data.get('config') == self.fingerprint:
+                    self.entries = data.get('entries', {})
+                else:
+                    print('Parse cache was created with a different configuration, ignoring.')
+            except (OSError, ValueError):
+                print('Invalid parse cache, ignoring.')
+
+    @staticmethod
+    def _get_fingerprint(config):
+        return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def is_valid_for(self, config):
+        """Check whether the cache was populated using this configuration."""
+        return self.fingerprint == self._get_fingerprint(config)
+
+    def get_key(self, file_name, old_hash, new_hash):
+        """Get the cache key for a file section, or None if the section has no real blob hashes."""
+        if self.NULL_HASH_PATTERN.match(old_hash) and self.NULL_HASH_PATTERN.match(new_hash):
+            return None
+        return f'{old_hash}..{new_hash} {file_name}'
+
+    def get(self, key):
+        """Get new copies of the issues cached for this key, or None if it isn't cached."""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        issues = []
+        for issue_dict in entry['issues']:
+            issue = self._from_dict(issue_dict)
+            issue.hunk = entry['snippets'][issue_dict['hunk']]
+            issues.append(issue)
+        return issues
+
+    def set(self, key, issues):
+        # The TODOs in a code block share its snippet, so each snippet is stored once, and the issues refer to it.
+        snippets = {}
+        issue_dicts = []
+        for issue in issues:
+            issue_dict = issue.to_dict()
+            issue_dict['hunk'] = snippets.setdefault(issue_dict['hunk'], len(snippets))
+            issue_dicts.append(issue_dict)
+        self.entries.pop(key, None)
+        self.entries[key] = {'snippets': list(snippets), 'issues': issue_dicts}
+        self.changed = True
+
+    def save(self):
+        """Write the cache back to disk, discarding the oldest entries if it has grown too large."""
+        if not self.changed:
+            return
+        for key in list(self.entries)[:max(len(self.entries) - self.MAX_ENTRIES, 0)]:
+            del self.entries[key]
+        data = {'version': self.VERSION, 'config': self.fingerprint, 'entries': self.entries}
+        temp_path = f'{self.path}.tmp'
+        try:
+            with open(temp_path, 'w') as cache_file:
+                json.dump(data, cache_file)
+            os.replace(temp_path, self.path)
+            self.changed = False
+        except OSError:
+            print(f'Could not write parse cache to "{self.path}".')
+
+    @staticmethod
+    def _from_dict(issue_dict):
+        # Issues are modified once created, so they mustn't share any lists with the cache.
+        return Issue.from_dict(json.loads(json.dumps(issue_dict)))
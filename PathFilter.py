@@ -0,0 +1,78 @@
+import re
+
+
+class PathFilter(object):
+    """Matcher for the files that should be skipped, compiled once from the IGNORE, INCLUDE and EXCLUDE settings."""
+
+    def __init__(self, ignore_patterns='', include_globs='', exclude_globs=''):
+        self.ignore_patterns = self._split(ignore_patterns)
+        self.include_globs = self._split(include_globs)
+        self.exclude_globs = self._split(exclude_globs)
+        # IGNORE regexes are matched from the start of the path, so can be combined with the translated globs.
+        self.exclude_pattern = self._compile(self.ignore_patterns + [self._translate_glob(glob)
+                                                                     for glob in self.exclude_globs])
+        self.include_pattern = self._compile([self._translate_glob(glob) for glob in self.include_globs])
+
+    @staticmethod
+    def _split(setting):
+        return list(filter(None, [value.strip() for value in (setting or '').split(',')]))
+
+    @staticmethod
+    def _compile(patterns):
+        if not patterns:
+            return None
+        try:
+            return re.compile('|'.join(f'(?:{pattern})' for pattern in patterns))
+        except re.error:
+            # Some patterns (e.g. with inline flags) can't be combined, so fall back to matching each in turn.
+            compiled_patterns = [re.compile(pattern) for pattern in patterns]
+            return CombinedPattern(compiled_patterns)
+
+    @staticmethod
+    def _translate_glob(glob):
+        """Translate a glob into a regex, where '**' matches across directories and '*' doesn't."""
+        regex = ''
+        i = 0
+        while i < len(glob):
+            if glob.startswith('**/', i):
+                regex += '(?:.*/)?'
+                i += 3
+            elif glob.startswith('**', i):
+                regex += '.*'
+                i += 2
+            elif glob[i] == '*':
+                regex += '[^/]*'
+                i += 1
+            elif glob[i] == '?':
+                regex += '[^/]'
+                i += 1
+            else:
+                regex += re.escape(glob[i])
+                i += 1
+        # Like .gitignore, a glob without a slash matches files in any directory.
+        if '/' not in glob.rstrip('/'):
+            regex = '(?:.*/)?' + regex
+        # A directory matches everything inside it.
+        return regex.rstrip('/') + r'(?:/.*)?$'
+
+    def should_ignore(self, file):
+        """Check whether a file should be skipped."""
+        if self.exclude_pattern and self.exclude_pattern.match(file):
+            return True
+        if self.include_pattern and not self.include_pattern.match(file):
+            return True
+        return False
+
+
+class CombinedPattern(object):
+    """A set of patterns that matches if any one of them does."""
+
+    def __init__(self, patterns):
+        self.patterns = patterns
+
+    def match(self, value):
+        for pattern in self.patterns:
+            match = pattern.match(value)
+            if match:
+                return match
+        return None
@@ -0,0 +1,41 @@
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class RateLimitedSession(requests.Session):
+    """
+    HTTP session which can be shared between threads, reusing its pooled connections, and which spaces out requests
+    so that all of them together stay within a budget of requests per hour.
+    """
+
+    def __init__(self, requests_per_hour=0, burst=100, pool_size=10):
+        super().__init__()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+        self.rate = requests_per_hour / 3600
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def request(self, method, url, *args, **kwargs):
+        self._wait_for_budget()
+        return super().request(method, url, *args, **kwargs)
+
+    def _wait_for_budget(self):
+        """Take a request from the budget, waiting until there is one if it's been used up."""
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            # Taking the request straight away reserves it, so waiting threads are served in turn.
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
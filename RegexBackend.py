@@ -0,0 +1,37 @@
+import os
+import re
+from functools import lru_cache
+
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+
+class RegexBackend(object):
+    """
+    Compiler for the parser's patterns, which uses RE2 (from google-re2) when it's installed, so matching takes linear
+    time however the input is crafted, falling back to the re module for patterns RE2 doesn't support (e.g. lookarounds).
+    """
+    INLINE_FLAGS = {re.IGNORECASE: 'i', re.MULTILINE: 'm', re.DOTALL: 's'}
+    RE2_FLAGS = re.IGNORECASE | re.MULTILINE | re.DOTALL
+
+    @classmethod
+    def compile(cls, pattern, flags=0):
+        """Compile a pattern, accepting the same flags as re.compile."""
+        return cls._compile(pattern, flags, cls.use_re2())
+
+    @staticmethod
+    def use_re2():
+        return re2 is not None and os.getenv('INPUT_REGEX_ENGINE', 'auto') != 're'
+
+    @classmethod
+    @lru_cache(maxsize=512)
+    def _compile(cls, pattern, flags, use_re2):
+        if use_re2 and not flags & ~cls.RE2_FLAGS:
+            inline_flags = ''.join(letter for flag, letter in cls.INLINE_FLAGS.items() if flags & flag)
+            try:
+                return re2.compile(f'(?{inline_flags}){pattern}' if inline_flags else pattern)
+            except Exception:
+                pass
+        return re.compile(pattern, flags)
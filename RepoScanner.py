@@ -0,0 +1,150 @@
+import fnmatch
+import mmap
+import os
+import re
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from io import StringIO
+
+
+class RepoScanner(object):
+    """Scanner for finding TODOs in every file of a checked-out repository, as if each file had just been added."""
+    # Same heuristic as git: a file containing a null byte near the start is treated as binary.
+    BINARY_CHECK_LENGTH = 8000
+
+    def __init__(self, parser, root='.'):
+        self.parser = parser
+        self.root = root
+        self.max_file_size = int(os.getenv('INPUT_SCAN_MAX_FILE_SIZE', '1048576'))
+        workers = os.getenv('INPUT_SCAN_WORKERS', '')
+        self.workers = int(workers) if workers else os.cpu_count()
+        # The files that couldn't be checked for TODOs (e.g. binary or oversized files), so whose TODOs are unknown.
+        self.skipped_files = set()
+        # Files without any identifier can be skipped before they're decoded.
+        self.identifiers_pattern = re.compile(b'|'.join(re.escape(identifier.encode('utf-8'))
+                                                        for identifier in parser.identifiers), re.IGNORECASE)
+
+    def get_files(self):
+        """Get the paths of all files in the working tree, excluding those ignored by git or the IGNORE setting."""
+        try:
+            git_files = subprocess.run(['git', 'ls-files', '--cached', '--others', '--exclude-standard', '-z'],
+                                       cwd=self.root, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        except FileNotFoundError:
+            git_files = None
+        if git_files and git_files.returncode == 0:
+            files = [file for file in git_files.stdout.decode('utf-8').split('\0') if file]
+        else:
+            # Not a git checkout (or git is unavailable), so walk the tree instead.
+            files = self._walk()
+        return [file for file in files if not self.parser._should_ignore(file)]
+
+    def _walk(self):
+        """Walk the tree, honouring only the root .gitignore."""
+        gitignore_patterns = []
+        gitignore_path = os.path.join(self.root, '.gitignore')
+        if os.path.isfile(gitignore_path):
+            with open(gitignore_path) as gitignore:
+                gitignore_patterns = [line.strip().strip('/') for line in gitignore
+                                      if line.strip() and not line.startswith(('#', '!'))]
+        files = []
+        for dir_path, dir_names, file_names in os.walk(self.root):
+            rel_dir = os.path.relpath(dir_path, self.root)
+            dir_names[:] = [d for d in dir_names if d != '.git' and
+                            not self._is_git_ignored(os.path.normpath(os.path.join(rel_dir, d)),
+                                                     gitignore_patterns)]
+            for file_name in file_names:
+                file = os.path.normpath(os.path.join(rel_dir, file_name))
+                if not self._is_git_ignored(file, gitignore_patterns):
+                    files.append(file.replace(os.sep, '/'))
+        return files
+
+    @staticmethod
+    def _is_git_ignored(path, patterns):
+        name = os.path.basename(path)
+        return any(fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(path, pattern) for pattern in patterns)
+
+    def scan(self):
+        """Scan all files across a pool of processes, yielding the issues found in each."""
+        files = self.get_files()
+        print(f'Scanning {len(files)} files for TODOs')
+        if self.workers and self.workers > 1 and len(files) > 1:
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                     initargs=(self,)) as executor:
+                for file, (issues, skipped) in zip(files, executor.map(_scan_file, files, chunksize=16)):
+                    if skipped:
+                        self.skipped_files.add(file)
+                    yield from issues
+        else:
+            for file in files:
+                yield from self.scan_file(file)
+
+    def scan_file(self, file_name):
+        """Parse a single file for TODOs, treating the whole file as a new addition."""
+        markers, markdown_language = self.parser._get_file_details(file_name)
+        if not markers or not markdown_language:
+            return []
+        contents = self._read_file(file_name)
+        if contents is None:
+            return []
+        issues = self.parser.parse(StringIO(self._as_new_file_diff(file_name, contents)))
+        self.skipped_files.update(self.parser.skipped_files)
+        for issue in issues:
+            # Only the cleaned snippet needs sending back from the worker.
+            issue.materialise()
+        return issues
+
+    def _read_file(self, file_name):
+        """Read the file if it's a text file of acceptable size that could contain a TODO, otherwise return None."""
+        path = os.path.join(self.root, file_name)
+        try:
+            size = os.path.getsize(path)
+            if size == 0:
+                return None
+            if size > self.max_file_size:
+                self.skipped_files.add(file_name)
+                return None
+            with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as contents:
+                if contents.find(b'\0', 0, self.BINARY_CHECK_LENGTH) != -1:
+                    self.skipped_files.add(file_name)
+                    return None
+                if not self.identifiers_pattern.search(contents):
+                    return None
+                return contents[:].decode('utf-8', errors='replace')
+        except (OSError, ValueError):
+            self.skipped_files.add(file_name)
+            return None
+
+    @staticmethod
+    def _as_new_file_diff(file_name, contents):
+        """Build the diff git would produce if this file had just been added."""
+        lines = contents.split('\n')
+        no_newline_at_end = lines[-1] != ''
+        if not no_newline_at_end:
+            lines.pop()
+        diff_lines = [f'diff --git a/{file_name} b/{file_name}',
+                      'new file mode 100644',
+                      'index 0000000..0000000',
+                      '--- /dev/null',
+                      f'+++ b/{file_name}',
+                      f'@@ -0,0 +1,{len(lines)} @@']
+        diff_lines.extend('+' + line for line in lines)
+        if no_newline_at_end:
+            diff_lines.append('\\ No newline at end of file')
+        return '\n'.join(diff_lines) + '\n'
+
+
+# The scanner used by each worker process, set once when the worker starts.
+_worker_scanner: RepoScanner | None = None
+
+
+def _init_worker(scanner):
+    global _worker_scanner
+    _worker_scanner = scanner
+
+
+def _scan_file(file_name):
+    """Scan a file in a worker, returning its issues and whether it was skipped, which the worker can't record."""
+    if _worker_scanner is None:
+        return [], True
+    issues = _worker_scanner.scan_file(file_name)
+    return issues, file_name in _worker_scanner.skipped_files
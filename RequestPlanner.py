@@ -0,0 +1,121 @@
+import json
+import os
+import sys
+import threading
+import time
+
+from Issue import Issue
+
+
+class RequestPlanner(object):
+    """
+    Plans how many issues can be processed in this run, so that the requests they need stay within the API's remaining
+    rate limits and an optional time budget. The issues that don't fit are saved to a queue, to be processed first
+    in the next run.
+    """
+    VERSION = 1
+    # GitHub's secondary rate limits allow around 500 requests creating content per hour.
+    MAX_WRITES = 500
+    # Requests kept back for anything not planned for, e.g. retrieving the existing issues.
+    RESERVED_REQUESTS = 20
+    # Clients for several repos may share the queue (e.g. in batch mode).
+    queue_lock = threading.Lock()
+    # When the current hour started, and the writes planned in it, for each token. GitHub doesn't report the writes
+    # made, so they're counted across every planner in this process (e.g. for each group of a pipelined run, or each
+    # job in batch mode), rather than starting afresh each time.
+    planned_writes: dict[str | None, tuple[float, int]] = {}
+    writes_lock = threading.Lock()
+
+    def __init__(self, client, queue_path='', time_budget=0, file_filter=None):
+        self.client = client
+        self.queue_path = queue_path
+        self.deadline = time.monotonic() + time_budget if time_budget else None
+        # The queue holds the deferred issues of each repo.
+        self.repo = getattr(client, 'repo', None) or ''
+        self.deferred = []
+        # Only the deferred issues for the files this run covers are taken (e.g. when sharded), and the rest are kept.
+        self.file_filter = file_filter
+        self.kept = []
+
+    def _load_queues(self):
+        if not self.queue_path or not os.path.isfile(self.queue_path):
+            return {}
+        try:
+            with open(self.queue_path) as queue_file:
+                data = json.load(queue_file)
+            if data.get('version') == self.VERSION:
+                return data.get('repos', {})
+        except (OSError, ValueError):
+            print('Invalid deferral queue, ignoring.')
+        return {}
+
+    def take_deferred(self):
+        """Take the issues deferred by previous runs."""
+        with self.queue_lock:
+            queues = self._load_queues()
+        issue_dicts = queues.get(self.repo, [])
+        if self.file_filter:
+            self.kept = [issue_dict for issue_dict in issue_dicts if not self.file_filter(issue_dict['file_name'])]
+            issue_dicts = [issue_dict for issue_dict in issue_dicts if self.file_filter(issue_dict['file_name'])]
+        return [Issue.from_dict(issue_dict) for issue_dict in issue_dicts]
+
+    def plan(self, issues, output=sys.stdout):
+        """Get as many of the issues, in order, as the rate limits allow, deferring the rest."""
+        if not issues:
+            return issues
+        remaining = self.client.get_rate_limit()
+        if remaining is None:
+            return issues
+        token = getattr(self.client, 'token', None)
+        now = time.time()
+        with self.writes_lock:
+            hour_start, writes = self.planned_writes.get(token, (now, 0))
+            if now - hour_start >= 3600:
+                hour_start, writes = now, 0
+            remaining = dict(remaining, writes=self.MAX_WRITES - writes)
+            if 'core' in remaining:
+                remaining['core'] -= self.RESERVED_REQUESTS
+            planned_issues = issues
+            for i, issue in enumerate(issues):
+                estimate = self.client.estimate_requests(issue)
+                if any(count > remaining.get(resource, count) for resource, count in estimate.items()):
+                    print(f'Not enough of the rate limit is left to process {len(issues) - i} of {len(issues)} '
+                          f'issues, deferring them.', file=output)
+                    self.defer(issues[i:])
+                    planned_issues = issues[:i]
+                    break
+                for resource, count in estimate.items():
+                    if resource in remaining:
+                        remaining[resource] -= count
+            self.planned_writes[token] = (hour_start, self.MAX_WRITES - remaining['writes'])
+        return planned_issues
+
+    def is_out_of_time(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def defer(self, issues):
+        self.deferred.extend(issues)
+
+    def save(self, output=sys.stdout):
+        """Write the deferred issues back to the queue, replacing those taken from it."""
+        if not self.queue_path:
+            if self.deferred:
+                print(f'{len(self.deferred)} issues were not processed. Set DEFERRAL_QUEUE to process them in the '
+                      f'next run.', file=output)
+            return
+        if self.deferred:
+            print(f'{len(self.deferred)} issues deferred to the next run.', file=output)
+        with self.queue_lock:
+            queues = self._load_queues()
+            # The issues taken from the queue have all been processed or deferred again.
+            queues.pop(self.repo, None)
+            if self.kept or self.deferred:
+                queues[self.repo] = self.kept + [issue.to_dict() for issue in self.deferred]
+            data = {'version': self.VERSION, 'repos': queues}
+            temp_path = f'{self.queue_path}.tmp'
+            try:
+                with open(temp_path, 'w') as queue_file:
+                    json.dump(data, queue_file)
+                os.replace(temp_path, self.queue_path)
+            except OSError:
+                print(f'Could not write deferral queue to "{self.queue_path}".', file=output)
@@ -1,12 +1,18 @@
 import os
 import re
+import time
 from ruamel.yaml import YAML
 from LineStatus import LineStatus
 from Issue import Issue
+from CodeSnippet import CodeSnippet
+from CommentScanner import CommentScanner
+from FileClassifier import FileClassifier
+from ParseCache import ParseCache
+from PathFilter import PathFilter
+from RegexBackend import RegexBackend
 import requests
 import json
 from urllib.parse import urlparse
-import itertools
 
 headers = {
     'User-Agent': 'TODOToIssue'
@@ -14,22 +20,55 @@ headers = {
 
 class TodoParser(object):
     """Parser for extracting information from a given diff file."""
-    FILE_HUNK_PATTERN = r'(?<=diff)(.*?)(?=diff\s--git\s)'
-    HEADERS_PATTERN = re.compile(r'(?<=--git) a/(.*?) b/(.*?)$\n(?=((new|deleted).*?$\n)?index ([0-9a-f]+)\.\.([0-9a-f]+))', re.MULTILINE)
-    LINE_NUMBERS_PATTERN = re.compile(r'^@@[\d\s,\-+]*\s@@.*', re.MULTILINE)
-    LINE_NUMBERS_INNER_PATTERN = re.compile(r'^@@[\d\s,\-+]*\s@@', re.MULTILINE)
-    ADDITION_PATTERN = re.compile(r'(?<=^\+).*')
-    DELETION_PATTERN = re.compile(r'(?<=^-).*')
-    REF_PATTERN = re.compile(r'.+?(?=\))')
-    LABELS_PATTERN = re.compile(r'(?<=labels:\s).+', re.IGNORECASE)
-    ASSIGNEES_PATTERN = re.compile(r'(?<=assignees:\s).+', re.IGNORECASE)
-    MILESTONE_PATTERN = re.compile(r'(?<=milestone:\s).+', re.IGNORECASE)
-    ISSUE_URL_PATTERN = re.compile(r'(?<=Issue URL:\s).+', re.IGNORECASE)
-    ISSUE_NUMBER_PATTERN = re.compile(r'/issues/(\d+)', re.IGNORECASE)
+    SECTION_HEADER_PATTERN = RegexBackend.compile(r'^diff --git a/(.*?) b/(.*?)$')
+    HEADERS_PATTERN = RegexBackend.compile(r'(?<=--git) a/(.*?) b/(.*?)$\n(?=((new|deleted).*?$\n)?index ([0-9a-f]+)\.\.([0-9a-f]+))', re.MULTILINE)
+    LINE_NUMBERS_PATTERN = RegexBackend.compile(r'^@@[\d\s,\-+]*\s@@.*', re.MULTILINE)
+    LINE_NUMBERS_INNER_PATTERN = RegexBackend.compile(r'^@@[\d\s,\-+]*\s@@', re.MULTILINE)
+    ADDITION_PATTERN = RegexBackend.compile(r'(?<=^\+).*')
+    DELETION_PATTERN = RegexBackend.compile(r'(?<=^-).*')
+    REF_PATTERN = RegexBackend.compile(r'.+?(?=\))')
+    LABELS_PATTERN = RegexBackend.compile(r'(?<=labels:\s).+', re.IGNORECASE)
+    ASSIGNEES_PATTERN = RegexBackend.compile(r'(?<=assignees:\s).+', re.IGNORECASE)
+    MILESTONE_PATTERN = RegexBackend.compile(r'(?<=milestone:\s).+', re.IGNORECASE)
+    ISSUE_URL_PATTERN = RegexBackend.compile(r'(?<=Issue URL:\s).+', re.IGNORECASE)
+    ISSUE_NUMBER_PATTERN = RegexBackend.compile(r'/issues/(\d+)', re.IGNORECASE)
+    # The status of every line in the section for a file that has been added or deleted, by the header saying which.
+    WHOLE_FILE_STATUSES = {'new': LineStatus.ADDED, 'deleted': LineStatus.DELETED}
 
     def __init__(self, options=dict()):
         # Determine if the issues should be escaped.
         self.should_escape = os.getenv('INPUT_ESCAPE', 'true') == 'true'
+        # Determine how many lines either side of a TODO to include in its code snippet,
+        # falling back to any specified by the constructor argument, otherwise using the whole code block.
+        snippet_context = os.getenv('INPUT_SNIPPET_CONTEXT', '') or options.get('snippet_context', None)
+        self.snippet_context = None
+        if snippet_context is not None:
+            try:
+                self.snippet_context = max(int(snippet_context), 0)
+            except ValueError:
+                print('Invalid snippet context, ignoring.')
+        # Determine where to persist the results of parsing each file section, if anywhere.
+        self.parse_cache_path = os.getenv('INPUT_PARSE_CACHE', '') or options.get('parse_cache', None)
+        self.parse_cache = None
+        # Determine how many seconds of CPU time can be spent checking each file section before it's skipped, if any.
+        section_cpu_budget = os.getenv('INPUT_SECTION_CPU_BUDGET', '') or options.get('section_cpu_budget', 0)
+        try:
+            self.section_cpu_budget = max(float(section_cpu_budget), 0)
+        except ValueError:
+            print('Invalid section CPU budget, ignoring.')
+            self.section_cpu_budget = 0
+        # Compile the patterns for files that should be skipped.
+        self.path_filter = PathFilter(os.getenv('INPUT_IGNORE', ''), os.getenv('INPUT_INCLUDE', ''),
+                                      os.getenv('INPUT_EXCLUDE', ''))
+        # Determine if vendored, generated and minified files should be skipped.
+        self.skip_generated = os.getenv('INPUT_SKIP_GENERATED', 'false') == 'true'
+        self.skipped_sections = {}
+        self.skipped_files = set()
+        # If set, only the files it accepts are checked (e.g. those in this job's shard of the diff).
+        self.section_filter = None
+        self.file_details_cache = {}
+        self.file_details_cache_source = None
+        self.comment_scanners = {}
         # Load any custom identifiers specified by the environment,
         # falling back to any specified by the constructor argument,
         # otherwise using the default.
@@ -55,6 +94,7 @@ class TodoParser(object):
                 print('Invalid identifiers dict, ignoring.')
 
         self.languages_dict = None
+        vendor_patterns = None
         # Check if the standard collections should be loaded.
         if os.getenv('INPUT_NO_STANDARD', 'false') != 'true':
             # Load the languages data for ascertaining file types.
@@ -74,10 +114,24 @@ class TodoParser(object):
                 self.syntax_dict = syntax_request.json()
             else:
                 raise Exception('Cannot retrieve syntax data. Operation will abort.')
+
+            # Load the paths of vendored files, which are only needed if they're being skipped.
+            if self.skip_generated:
+                vendor_url = 'https://raw.githubusercontent.com/github/linguist/master/lib/linguist/vendor.yml'
+                try:
+                    vendor_request = requests.get(url=vendor_url, headers=headers)
+                    if vendor_request.status_code == 200:
+                        vendor_patterns = YAML(typ='safe').load(vendor_request.text)
+                    else:
+                        print('Cannot retrieve vendored paths data, using the defaults.')
+                except requests.exceptions.RequestException:
+                    print('Cannot retrieve vendored paths data, using the defaults.')
         else:
             self.syntax_dict = []
             self.languages_dict = {}
 
+        self.file_classifier = FileClassifier(vendor_patterns)
+
         custom_languages = os.getenv('INPUT_LANGUAGES', '')
         if custom_languages != '':
             # Load all custom languages.
@@ -136,85 +190,127 @@ class TodoParser(object):
 
     # noinspection PyTypeChecker
     def parse(self, diff_file):
-        issues = []
+        return [issue for section_issues in self.parse_sections(diff_file) for issue in section_issues]
+
+    def parse_sections(self, diff_file):
+        """Parse the diff a file section at a time, yielding the issues found in each as soon as it has been checked."""
+        parse_cache = self._get_parse_cache()
+        # The number of sections skipped for being vendored, generated or minified, by type.
+        self.skipped_sections = {}
+        # The files that weren't checked for TODOs, so whose TODOs are unknown rather than gone.
+        self.skipped_files = set()
+        # Used to rule out whole files without a TODO before they're checked line by line.
+        identifiers_pattern = RegexBackend.compile('|'.join(re.escape(identifier) for identifier in self.identifiers),
+                                                   re.IGNORECASE)
 
         # The parser works by gradually breaking the diff file down into smaller and smaller segments.
         # At each level relevant information is extracted.
 
-        # First separate the diff into sections for each changed file.
-        file_hunks = re.finditer(self.FILE_HUNK_PATTERN, diff_file.read(), re.DOTALL)
-        last_end = None
-        extracted_file_hunks = []
-        for i, file_hunk in enumerate(file_hunks):
-            extracted_file_hunks.append(file_hunk.group(0))
-            last_end = file_hunk.end()
-        diff_file.seek(0)
-        extracted_file_hunks.append(diff_file.read()[last_end:])
-        diff_file.close()
-
-        code_blocks = []
-        prev_block = None
-        # Iterate through each section extracted above.
-        for hunk in extracted_file_hunks:
+        # First separate the diff into sections for each changed file, and iterate through them.
+        for hunk in self._get_file_sections(diff_file):
             # Extract the file information so we can figure out the Markdown language and comment syntax.
             headers = self.HEADERS_PATTERN.search(hunk)
             if not headers:
                 continue
             curr_file = headers.group(2)
-            if self._should_ignore(curr_file):
-                continue
             curr_markers, curr_markdown_language = self._get_file_details(curr_file)
             if not curr_markers or not curr_markdown_language:
                 print(f'Could not check "{curr_file}" for TODOs as this language is not yet supported by default.')
                 continue
 
-            # Break this section down into individual changed code blocks.
-            line_numbers_iterator = re.finditer(self.LINE_NUMBERS_PATTERN, hunk)
-            for i, line_numbers in enumerate(line_numbers_iterator):
-                line_numbers_inner_search = re.search(self.LINE_NUMBERS_INNER_PATTERN, line_numbers.group(0))
-                line_numbers_str = line_numbers_inner_search.group(0).strip('@@ -')
-                deleted_start_line = line_numbers_str.split(' ')[0]
-                deleted_start_line = int(deleted_start_line.split(',')[0])
-                added_start_line = line_numbers_str.split(' ')[1].strip('+')
-                added_start_line = int(added_start_line.split(',')[0])
-
-                # Put this information into a temporary dict for simplicity.
-                block = {
-                    'file': curr_file,
-                    'markers': curr_markers,
-                    'markdown_language': curr_markdown_language,
-                    'deleted_start_line': deleted_start_line,
-                    'added_start_line': added_start_line,
-                    'hunk': hunk,
-                    'hunk_start': line_numbers.end(),
-                    'hunk_end': None
-                }
-
-                prev_index = len(code_blocks) - 1
-                # Set the end of the last code block based on the start of this one.
-                if prev_block and prev_block['file'] == block['file']:
-                    # noinspection PyTypedDict
-                    code_blocks[prev_index]['hunk_end'] = line_numbers.start()
-                    code_blocks[prev_index]['hunk'] = (prev_block['hunk']
-                                                       [prev_block['hunk_start']:line_numbers.start()])
-                elif prev_block:
-                    code_blocks[prev_index]['hunk'] = prev_block['hunk'][prev_block['hunk_start']:]
-
-                code_blocks.append(block)
-                prev_block = block
-
-        if len(code_blocks) > 0:
-            last_index = len(code_blocks) - 1
-            last_block = code_blocks[last_index]
-            code_blocks[last_index]['hunk'] = last_block['hunk'][last_block['hunk_start']:]
-
-        # Now for each code block, check for comments, then those comments for TODOs.
-        for block in code_blocks:
-            # for both the set of deleted lines and set of new lines, convert hunk string into
-            # newline-separated list (excluding first element which is always null and not
-            # actually first line of hunk)
-            old=[]
-            new=[]
+            # If this exact change to this file has been parsed before, reuse the result.
+            cache_key = parse_cache.get_key(curr_file, headers.group(5), headers.group(6)) if parse_cache else None
+            if cache_key:
+                cached_issues = parse_cache.get(cache_key)
+                if cached_issues is not None:
+                    yield self._trim_snippets(cached_issues)
+                    continue
+            curr_issues = []
+            curr_section = {
+                'file': curr_file,
+                'issues': curr_issues,
+                'cpu_time': 0.0,
+                'skipped': False
+            }
+            # A section for a file that has been added or deleted is all additions or all deletions, so doesn't need
+            # the old and new versions separating, and can't contain a TODO if there's no identifier in it anywhere.
+            whole_file_status = self.WHOLE_FILE_STATUSES.get(headers.group(4))
+            if not whole_file_status or identifiers_pattern.search(hunk):
+                # Break this section down into individual changed code blocks, and check each one.
+                for block in self._get_code_blocks(hunk, curr_section, curr_markers, curr_markdown_language,
+                                                   whole_file_status):
+                    self._check_code_block(block)
+
+            self._trim_snippets(curr_issues)
+            if cache_key and not curr_section['skipped']:
+                parse_cache.set(cache_key, curr_issues)
+            yield curr_issues
+
+        if parse_cache:
+            parse_cache.save()
+
+        if self.skipped_sections:
+            print(f'Skipped {sum(self.skipped_sections.values())} generated, minified or vendored files ('
+                  + ', '.join(f'{count} {file_type}' for file_type, count in self.skipped_sections.items()) + ').')
+
+    def _get_code_blocks(self, hunk, section, markers, markdown_language, whole_file_status):
+        """Split a file section into its changed code blocks."""
+        code_blocks = []
+        for line_numbers in self.LINE_NUMBERS_PATTERN.finditer(hunk):
+            line_numbers_inner_search = self.LINE_NUMBERS_INNER_PATTERN.search(line_numbers.group(0))
+            line_numbers_str = line_numbers_inner_search.group(0).strip('@@ -')
+            deleted_start_line = line_numbers_str.split(' ')[0]
+            deleted_start_line = int(deleted_start_line.split(',')[0])
+            added_start_line = line_numbers_str.split(' ')[1].strip('+')
+            added_start_line = int(added_start_line.split(',')[0])
+
+            # Put this information into a temporary dict for simplicity.
+            block = {
+                'file': section['file'],
+                'markers': markers,
+                'markdown_language': markdown_language,
+                'deleted_start_line': deleted_start_line,
+                'added_start_line': added_start_line,
+                'hunk': hunk,
+                'hunk_start': line_numbers.end(),
+                'hunk_end': None,
+                'issues': section['issues'],
+                'section': section,
+                'whole_file_status': whole_file_status
+            }
+
+            # Set the end of the last code block based on the start of this one.
+            if code_blocks:
+                prev_block = code_blocks[-1]
+                prev_block['hunk_end'] = line_numbers.start()
+                prev_block['hunk'] = prev_block['hunk'][prev_block['hunk_start']:line_numbers.start()]
+            code_blocks.append(block)
+
+        if code_blocks:
+            last_block = code_blocks[-1]
+            last_block['hunk'] = last_block['hunk'][last_block['hunk_start']:]
+        return code_blocks
+
+    def _check_code_block(self, block):
+        """Check a code block for comments, then those comments for TODOs."""
+        if block['section']['skipped']:
+            return
+        block_start_time = time.thread_time()
+        # Every issue in this block shares the one snippet, which is only cleaned when first needed.
+        block['snippet'] = CodeSnippet(block['hunk'], excerpts=self.snippet_context is not None)
+        # for both the set of deleted lines and set of new lines, convert hunk string into
+        # newline-separated list (excluding first element which is always null and not
+        # actually first line of hunk)
+        old=[]
+        new=[]
+        if block['whole_file_status'] is not None:
+            # Every line of an added or deleted file is on the one side.
+            lines = [line for line in block['hunk'].split('\n')[1:] if line != '\\ No newline at end of file']
+            if block['whole_file_status'] == LineStatus.ADDED:
+                new = lines
+            else:
+                old = lines
+        else:
             for line in block['hunk'].split('\n')[1:]:
                 if line: # if not empty
                     match line[0]:
@@ -230,149 +326,122 @@ class TodoParser(object):
                     old.append(line)
                     new.append(line)
 
-            for marker in block['markers']:
-                # initialize list
-                contiguous_comments_and_positions = []
-
-                # Check if there are line or block comments.
-                if marker['type'] == 'line':
-                    # Add a negative lookup to include the second character from alternative comment patterns.
-                    # This step is essential to handle cases like in Julia, where '#' and '#=' are comment patterns.
-                    # It ensures that when a space after the comment is optional ('\s' => '\s*'),
-                    # the second character would be matched because of the any character expression ('.+').
-                    suff_escape_list = []
-                    pref_escape_list = []
-                    for to_escape in block['markers']:
-                        if to_escape['type'] == 'line':
-                            if to_escape['pattern'] == marker['pattern']:
-                                continue
-                            if marker['pattern'][0] == to_escape['pattern'][0]:
-                                suff_escape_list.append(self._extract_character(to_escape['pattern'], 1))
-                        else:
-                            # Block comments and line comments cannot have the same comment pattern,
-                            # so a check if the string is the same is unnecessary.
-                            if to_escape['pattern']['start'][0] == marker['pattern'][0]:
-                                suff_escape_list.append(self._extract_character(to_escape['pattern']['start'], 1))
-                            search = to_escape['pattern']['end'].find(marker['pattern'])
-                            if search != -1:
-                                pref_escape_list.append(self._extract_character(to_escape['pattern']['end'],
-                                                                                search - 1))
-
-                    comment_pattern = (r'(^.*'
-                                       + (r'(?<!(' + '|'.join(pref_escape_list) + r'))' if len(pref_escape_list) > 0
-                                          else '')
-                                       + marker['pattern']
-                                       + (r'(?!(' + '|'.join(suff_escape_list) + r'))' if len(suff_escape_list) > 0
-                                          else '')
-                                       + r'\s*.+$)')
-
-                    # create regex object to search for comments
-                    compiled_pattern=re.compile(comment_pattern)
-                    # analyze the set of old lines and new lines separately, so that we don't, for example,
-                    # accidentally treat deleted lines as if they were being added in this diff
-                    for block_lines in [old, new]:
-                        # for each element of list, enumerate it and if value is a regex match, include it in list that is returned,
-                        # where each element of the list is a dictionary that is the start and end lines of the match (relative to
-                        # start of the hunk) and the matching string itself
-                        comments_and_positions = [{'start': i, 'end': i, 'comment': x} for i, x in enumerate(block_lines) if compiled_pattern.search(x)]
-                        if len(comments_and_positions) > 0:
-                            # append filtered list which consolidates contiguous lines
-                            contiguous_comments_and_positions.append(comments_and_positions[0])
-                            for j, x in enumerate(comments_and_positions[1:]):
-                                if x['start'] == (comments_and_positions[j]['end'] + 1):
-                                    contiguous_comments_and_positions[-1]['end']+=1
-                                    contiguous_comments_and_positions[-1]['comment'] += '\n' + x['comment']
-                                else:
-                                    contiguous_comments_and_positions.append(x)
-                else:
-                    # pattern consists of one group, the first comment block encountered
-                    pattern=(r'([+\-\s]\s*' + marker['pattern']['start'] + r'.*?'
-                                       + marker['pattern']['end'] + ')')
-                    # compile above pattern
-                    compiled_pattern = re.compile(pattern, re.DOTALL)
-
-                    # analyze the set of old lines and new lines separately, so that we don't, for example,
-                    # accidentally treat deleted lines as if they were being added in this diff
-                    for block_lines in [old, new]:
-                        # convert list to string
-                        block_lines_str = '\n'.join(block_lines)
-                        # search for the pattern within the hunk and
-                        # return a list of iterators to all of the matches
-                        match_iters = compiled_pattern.finditer(block_lines_str)
-
-                        # split off into overlapping pairs. i.e. ['A', 'B', C'] => [('A', 'B'), ('B', 'C')]
-                        pairs = itertools.pairwise(match_iters)
-
-                        for i, pair in enumerate(pairs):
-                            # get start/end index (within hunk) of previous section
-                            prev_span = pair[0].span()
-
-                            # if first iteration, special handling
-                            if i == 0:
-                                # set start line and comment string of first section
-                                contiguous_comments_and_positions.append({
-                                            'start': block_lines_str.count('\n', 0, prev_span[0]),
-                                            'end': 0,
-                                            'comment': pair[0].group(0)
-                                        })
-                                # get number of lines in first section
-                                num_lines_in_first_section = block_lines_str.count('\n', prev_span[0], prev_span[1])
-                                # set end line of first section relative to its start
-                                contiguous_comments_and_positions[-1]['end'] = contiguous_comments_and_positions[-1]['start'] + num_lines_in_first_section
-
-                            # get start/end index (within hunk) of current section
-                            curr_span = pair[1].span()
-                            # determine number of lines between previous end and current start
-                            num_lines_from_prev_section_end_line = block_lines_str.count('\n', prev_span[1], curr_span[0])
-                            # set start line of current section based on previous end
-                            contiguous_comments_and_positions.append({
-                                        'start': contiguous_comments_and_positions[-1]['end'] + num_lines_from_prev_section_end_line,
-                                        'end': 0,
-                                        'comment': pair[1].group(0)
-                                    })
-                            # get number of lines in current section
-                            num_lines_in_curr_section = block_lines_str.count('\n', curr_span[0], curr_span[1])
-                            # set end line of current section relative to its start
-                            contiguous_comments_and_positions[-1]['end'] = contiguous_comments_and_positions[-1]['start'] + num_lines_in_curr_section
-
-                        # handle potential corner case where there was only one match
-                        # and therefore it couldn't be paired off
-                        if len(contiguous_comments_and_positions) == 0:
-                            # redo the search, this time returning the
-                            # result directly rather than an iterator
-                            match = compiled_pattern.search(block_lines_str)
-
-                            if match:
-                                # get start/end index (within hunk) of this section
-                                span = match.span()
-                                # set start line and comment string of first section
-                                contiguous_comments_and_positions.append({
-                                            'start': block_lines_str.count('\n', 0, span[0]),
-                                            'end': 0,
-                                            'comment': match.group(0)
-                                        })
-                                # get number of lines in first section
-                                num_lines_in_first_section = block_lines_str.count('\n', span[0], span[1])
-                                # set end line of first section relative to its start
-                                contiguous_comments_and_positions[-1]['end'] = contiguous_comments_and_positions[-1]['start'] + num_lines_in_first_section
-
-                for comment_and_position in contiguous_comments_and_positions:
-                    extracted_issues = self._extract_issue_if_exists(comment_and_position, marker, block)
-                    if extracted_issues:
-                        issues.extend(extracted_issues)
-
-        for i, issue in enumerate(issues):
-            # Strip some of the diff symbols so it can be included as a code snippet in the issue body.
-            # Strip removed lines.
-            cleaned_hunk = re.sub(r'\n^-.*$', '', issue.hunk, count=0, flags=re.MULTILINE)
-            # Strip leading symbols/whitespace.
-            cleaned_hunk = re.sub(r'^.', '', cleaned_hunk, count=0, flags=re.MULTILINE)
-            # Strip newline message.
-            cleaned_hunk = re.sub(r'\n\sNo newline at end of file', '', cleaned_hunk, count=0, flags=re.MULTILINE)
-            issue.hunk = cleaned_hunk
-
+        # Find the comments for every marker, in the set of old lines and new lines separately, so that we don't,
+        # for example, accidentally treat deleted lines as if they were being added in this diff.
+        comment_scanner = self._get_comment_scanner(block['markers'])
+        old_comments = comment_scanner.scan(old) if old else [[] for _ in block['markers']]
+        new_comments = comment_scanner.scan(new) if new else [[] for _ in block['markers']]
+        for marker, old_marker_comments, new_marker_comments in zip(block['markers'], old_comments, new_comments):
+            for comment_and_position in old_marker_comments + new_marker_comments:
+                if self._exceeds_cpu_budget(block['section'], block_start_time):
+                    break
+                extracted_issues = self._extract_issue_if_exists(comment_and_position, marker, block)
+                if extracted_issues:
+                    block['issues'].extend(extracted_issues)
+        block['section']['cpu_time'] += time.thread_time() - block_start_time
+
+    def _trim_snippets(self, issues):
+        """Trim each snippet down to the lines around its TODO, so the full code blocks can be released."""
+        if self.snippet_context is not None:
+            for issue in issues:
+                if issue.snippet:
+                    issue.hunk = issue.snippet.excerpt(issue.start_line_within_hunk, issue.num_lines,
+                                                       self.snippet_context, issue.status == LineStatus.DELETED)
         return issues
 
+    def _exceeds_cpu_budget(self, section, block_start_time):
+        """Check whether checking a file section has taken too long, in which case its issues are dropped."""
+        if section['skipped']:
+            return True
+        if not self.section_cpu_budget:
+            return False
+        if section['cpu_time'] + time.thread_time() - block_start_time > self.section_cpu_budget:
+            print(f'Skipping "{section["file"]}" as checking it for TODOs took more than '
+                  f'{self.section_cpu_budget:g} seconds.')
+            section['skipped'] = True
+            section['issues'].clear()
+            self.skipped_files.add(section['file'])
+        return section['skipped']
+
+    def _get_file_sections(self, diff_file):
+        """Read the diff a line at a time, yielding the section for each changed file, so it can be streamed in.
+
+        Sections for ignored files, unsupported languages and binary files are dropped as soon as their header is read,
+        so are never held in memory.
+        """
+        section = []
+        # Anything before the first section can't be parsed.
+        skip_section = True
+        for line in diff_file:
+            if line.startswith('diff --git '):
+                if section and not self._should_skip_section_content(section):
+                    yield ''.join(section)
+                section = []
+                skip_section = self._should_skip_section(line)
+            elif not skip_section and line.startswith(('Binary files ', 'GIT binary patch')):
+                section = []
+                skip_section = True
+            if not skip_section:
+                section.append(line)
+        if section and not self._should_skip_section_content(section):
+            yield ''.join(section)
+        diff_file.close()
+
+    def _should_skip_section(self, header_line):
+        """Check the first line of a file section to see if the file shouldn't be checked for TODOs."""
+        header_search = self.SECTION_HEADER_PATTERN.search(header_line.rstrip('\n'))
+        if not header_search:
+            return False
+        curr_file = header_search.group(2)
+        if self.section_filter and not self.section_filter(curr_file):
+            # Another shard is checking this file.
+            return True
+        if self._should_ignore(curr_file):
+            return True
+        curr_markers, curr_markdown_language = self._get_file_details(curr_file)
+        if not curr_markers or not curr_markdown_language:
+            print(f'Could not check "{curr_file}" for TODOs as this language is not yet supported by default.')
+            return True
+        if self.skip_generated:
+            file_type = self.file_classifier.classify_path(curr_file)
+            if file_type:
+                self._skip_section(curr_file, file_type)
+                return True
+        return False
+
+    def _should_skip_section_content(self, section_lines):
+        """Check the lines of a file section to see if the file is generated or minified, so shouldn't be checked."""
+        if not self.skip_generated:
+            return False
+        file_type = self.file_classifier.classify_section(section_lines)
+        if file_type:
+            header_search = self.SECTION_HEADER_PATTERN.search(section_lines[0].rstrip('\n'))
+            self._skip_section(header_search.group(2) if header_search else None, file_type)
+            return True
+        return False
+
+    def _skip_section(self, file, file_type):
+        print(f'Skipping "{file}" as it looks {file_type}.')
+        self.skipped_sections[file_type] = self.skipped_sections.get(file_type, 0) + 1
+        self.skipped_files.add(file)
+
+    def _get_parse_cache(self):
+        """Load the parse cache, if enabled, checking it was populated using the current configuration."""
+        if not self.parse_cache_path:
+            return None
+        # Anything that can change the issues found in a section must invalidate the cache.
+        config = {
+            'identifiers': self.identifiers_dict or self.identifiers,
+            'languages': self.languages_dict,
+            'syntax': self.syntax_dict,
+            'escape': self.should_escape,
+            'skip_generated': self.skip_generated,
+            'snippet_context': self.snippet_context
+        }
+        if self.parse_cache is None or not self.parse_cache.is_valid_for(config):
+            self.parse_cache = ParseCache(self.parse_cache_path, config)
+        return self.parse_cache
+
     def _get_language_details(self, language_name, attribute, value):
         """Try and get the Markdown language and comment syntax data based on a specified attribute of the language."""
         attributes = [at.lower() for at in self.languages_dict[language_name][attribute]]
@@ -384,7 +453,17 @@ class TodoParser(object):
 
     def _get_file_details(self, file):
         """Try and get the Markdown language and comment syntax data for the given file."""
-        file_name, extension = os.path.splitext(os.path.basename(file))
+        # The details only depend on the file's name, so only need finding once for each name.
+        if self.file_details_cache_source != (id(self.languages_dict), id(self.syntax_dict)):
+            self.file_details_cache = {}
+            self.file_details_cache_source = (id(self.languages_dict), id(self.syntax_dict))
+        base_name = os.path.basename(file)
+        if base_name not in self.file_details_cache:
+            self.file_details_cache[base_name] = self._find_file_details(base_name)
+        return self.file_details_cache[base_name]
+
+    def _find_file_details(self, base_name):
+        file_name, extension = os.path.splitext(base_name)
         for language_name in self.languages_dict:
             # Check if the file extension matches the language's extensions.
             if extension != '' and 'extensions' in self.languages_dict[language_name]:
@@ -398,6 +477,15 @@ class TodoParser(object):
                     return syntax_details, ace_mode
         return None, None
 
+    def _get_comment_scanner(self, markers):
+        """Get the comment scanner for a language's markers, only compiling it the first time they're seen."""
+        # The markers are kept alongside the scanner, so their id can't be reused while it's cached.
+        cached_markers, comment_scanner = self.comment_scanners.get(id(markers), (None, None))
+        if cached_markers is not markers or comment_scanner is None:
+            comment_scanner = CommentScanner(markers)
+            self.comment_scanners[id(markers)] = (markers, comment_scanner)
+        return comment_scanner
+
     def _tabs_and_spaces(self, num_tabs: int, num_spaces: int) -> str:
         """
         Helper function which returns a string containing the
@@ -411,7 +499,8 @@ class TodoParser(object):
         Check if this is a block comment (with a start and end marker) on a single line.
         """
         if marker['type'] == 'block':
-            return bool(re.match(fr'^[\s\+\-]*{marker["pattern"]["start"]}.*{marker["pattern"]["end"]}\s*$', line))
+            return bool(RegexBackend.compile(fr'^[\s\+\-]*{marker["pattern"]["start"]}.*{marker["pattern"]["end"]}\s*$')
+                        .match(line))
         return False
 
     def _extract_issue_if_exists(self, comment_block, marker, hunk_info):
@@ -442,7 +531,7 @@ class TodoParser(object):
                     assignees=[],
                     milestone=None,
                     body=[],
-                    hunk=hunk_info['hunk'],
+                    hunk=hunk_info['snippet'],
                     file_name=hunk_info['file'],
                     start_line=((hunk_info['deleted_start_line'] if line_status == LineStatus.DELETED else hunk_info['added_start_line'])
                                 + comment_block['start'] + line_number_within_comment_block),
@@ -528,26 +617,6 @@ class TodoParser(object):
                 escaped += c
         return escaped
 
-    @staticmethod
-    def _extract_character(input_str, pos):
-        # Extracts a character from the input string at the specified position,
-        # considering escape sequences when applicable.
-        # Test cases
-        # print(_extract_character("/\\*", 1))   # Output: "\*"
-        # print(_extract_character("\\*", 0))    # Output: "\*"
-        # print(_extract_character("\\", 0))     # Output: "\\"
-        # print(_extract_character("w", 0))      # Output: "w"
-        # print(_extract_character("wa", 1))     # Output: "a"
-        # print(_extract_character("\\\\w", 1))  # Output: "\\"
-        if input_str[pos] == '\\':
-            if pos >= 1 and not input_str[pos - 1] == '\\' and len(input_str) > pos + 1:
-                return '\\' + input_str[pos + 1]
-            return '\\\\'
-        if pos >= 1:
-            if input_str[pos - 1] == '\\':
-                return '\\' + input_str[pos]
-        return input_str[pos]
-
     def _get_line_status(self, comment):
         """Return a Tuple indicating whether this is an addition/deletion/unchanged, plus the cleaned comment."""
         addition_search = self.ADDITION_PATTERN.search(comment)
@@ -570,8 +639,8 @@ class TodoParser(object):
             num_pre_marker_tabs = comment.count('\t', 0, pre_marker_length)
             start_pattern = r'^' + marker['pattern']['start']
             end_pattern = marker['pattern']['end'] + r'$'
-            comment = re.sub(start_pattern, '', comment)
-            comment = re.sub(end_pattern, '', comment)
+            comment = RegexBackend.compile(start_pattern).sub('', comment)
+            comment = RegexBackend.compile(end_pattern).sub('', comment)
             # Some block comments might have an asterisk on each line.
             if '*' in start_pattern and comment.startswith('*'):
                 comment = comment.lstrip('*')
@@ -579,9 +648,11 @@ class TodoParser(object):
             if self._is_inline_block_comment(marker, original_comment):
                 post_marker_length = 1
         else:
-            comment_segments = re.search(fr'^(.*?)({marker["pattern"]})(\s*)(.*?)\s*$', comment)
+            # Trailing whitespace is stripped afterwards, as matching it lazily can take quadratic time.
+            comment_segments = RegexBackend.compile(fr'^(.*?)({marker["pattern"]})(\s*)(.*)$').search(comment)
             if comment_segments:
                 pre_marker_text, _, post_marker_whitespace, comment = comment_segments.groups()
+                comment = comment.rstrip()
                 pre_marker_length = len(pre_marker_text)
                 num_pre_marker_tabs = pre_marker_text.count('\t', 0, pre_marker_length)
                 post_marker_length = len(post_marker_whitespace)
@@ -598,14 +669,15 @@ class TodoParser(object):
         title_identifier_actual = None
         title_identifier = None
         for identifier in self.identifiers:
-            title_pattern = re.compile(fr'(^|(^.*?)(\s*?)\s)({re.escape(identifier)})(\(([^)]+)\))?\s*(:|\s)\s*(.+)',
-                                       re.IGNORECASE)
+            # The identifier must be at the start or follow whitespace.
+            title_pattern = RegexBackend.compile(fr'(?:^|\s)({re.escape(identifier)})(\(([^)]+)\))?\s*(:|\s)\s*(.+)',
+                                                 re.IGNORECASE)
             title_search = title_pattern.search(comment)
             if title_search:
-                title_identifier_actual = title_search.group(4)
+                title_identifier_actual = title_search.group(1)
                 title_identifier = identifier
-                ref = title_search.group(6) # may be empty, which is OK
-                title = title_search.group(8)
+                ref = title_search.group(3) # may be empty, which is OK
+                title = title_search.group(5)
                 break
         return title, ref, title_identifier, title_identifier_actual
 
@@ -645,12 +717,15 @@ class TodoParser(object):
             milestone = milestone_search.group(0)
         return milestone
 
-    # noinspection PyMethodMayBeStatic
+    def should_parse(self, file):
+        """Check whether a file can be checked for TODOs, i.e. it isn't ignored or vendored and its language is supported."""
+        if self._should_ignore(file):
+            return False
+        if self.skip_generated and self.file_classifier.classify_path(file):
+            return False
+        markers, markdown_language = self._get_file_details(file)
+        return bool(markers and markdown_language)
+
     def _should_ignore(self, file):
-        ignore_patterns = os.getenv('INPUT_IGNORE', None)
-        if ignore_patterns:
-            for pattern in filter(None, [pattern.strip() for pattern in ignore_patterns.split(',')]):
-                if re.match(pattern, file):
-                    return True
-        return False
+        return self.path_filter.should_ignore(file)
 
@@ -0,0 +1,125 @@
+import threading
+import time
+from urllib.parse import urlparse
+
+
+class TokenPool(object):
+    """
+    Tokens to spread requests across. Each request uses the token with the most of its rate limit left, according to the
+    headers of the responses so far, and a token that hits a secondary rate limit is rested until it may be used again.
+    """
+    # Assumed for a token until a response says otherwise.
+    DEFAULT_REMAINING = 5000
+    # How long a token rests after hitting a secondary rate limit, unless GitHub says how long to wait.
+    DEFAULT_QUARANTINE = 60
+    # One pool for each set of tokens, shared by every client in this process.
+    _pools: dict[tuple, 'TokenPool'] = {}
+    _pools_lock = threading.Lock()
+
+    def __init__(self, tokens):
+        self.tokens = list(dict.fromkeys(tokens))
+        # The requests left, and when they reset, for each token and rate limit.
+        self.budgets = {}
+        self.quarantined_until = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def open(cls, tokens):
+        """Get the pool for these tokens, creating it the first time."""
+        key = tuple(tokens)
+        with cls._pools_lock:
+            if key not in cls._pools:
+                cls._pools[key] = cls(tokens)
+            return cls._pools[key]
+
+    @staticmethod
+    def get_resource(url):
+        """Get the rate limit that a request to this URL counts against."""
+        path = urlparse(url).path
+        if path.endswith('/graphql'):
+            return 'graphql'
+        if '/search/' in path:
+            return 'search'
+        return 'core'
+
+    def _get_remaining(self, token, resource, now):
+        remaining, reset = self.budgets.get((token, resource), (self.DEFAULT_REMAINING, 0))
+        return remaining if reset > now else max(remaining, self.DEFAULT_REMAINING)
+
+    def choose(self, resource, exclude=()):
+        """Choose the token to make a request with, or None if they're all resting (or excluded)."""
+        now = time.time()
+        with self.lock:
+            candidates = [token for token in self.tokens
+                          if token not in exclude and self.quarantined_until.get(token, 0) <= now]
+            if not candidates:
+                return None
+            token = max(candidates, key=lambda candidate: self._get_remaining(candidate, resource, now))
+            # Count the request straight away, so that requests made at the same time are spread out.
+            _, reset = self.budgets.get((token, resource), (0, now + 3600))
+            self.budgets[token, resource] = (self._get_remaining(token, resource, now) - 1, max(reset, now + 1))
+            return token
+
+    def update(self, token, response):
+        """
+        Update a token's budget from the headers of a response to a request made with it.
+        Returns True if the request was refused because of a rate limit, so it's worth trying another token.
+        """
+        headers = response.headers
+        now = time.time()
+        with self.lock:
+            if 'X-RateLimit-Remaining' in headers and 'X-RateLimit-Reset' in headers:
+                resource = headers.get('X-RateLimit-Resource', 'core')
+                self.budgets[token, resource] = (int(headers['X-RateLimit-Remaining']),
+                                                 int(headers['X-RateLimit-Reset']))
+            if response.status_code not in [403, 429]:
+                return False
+            if 'Retry-After' in headers:
+                self.quarantined_until[token] = now + int(headers['Retry-After'])
+            elif headers.get('X-RateLimit-Remaining') == '0':
+                self.quarantined_until[token] = int(headers.get('X-RateLimit-Reset', now + self.DEFAULT_QUARANTINE))
+            elif 'secondary rate limit' in response.text or 'abuse' in response.text:
+                self.quarantined_until[token] = now + self.DEFAULT_QUARANTINE
+            else:
+                # Refused for some other reason, e.g. the token doesn't have permission.
+                return False
+            return True
+
+
+class TokenPoolSession(object):
+    """
+    Wraps a session (or the requests module), making each request authenticated with the primary token with the best
+    token in the pool instead, and retrying with another token if it's refused because of a rate limit.
+    """
+
+    def __init__(self, session, pool, token):
+        self.session = session
+        self.pool = pool
+        self.authorization = f'token {token}'
+
+    def get(self, url, **kwargs):
+        return self._request('get', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self._request('post', url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self._request('patch', url, **kwargs)
+
+    def _request(self, method, url, headers=None, **kwargs):
+        send = getattr(self.session, method)
+        # Each token's rate limit is checked with that token.
+        if not headers or headers.get('Authorization') != self.authorization or url.endswith('/rate_limit'):
+            return send(url, headers=headers, **kwargs)
+        resource = self.pool.get_resource(url)
+        tried = []
+        response = None
+        while True:
+            token = self.pool.choose(resource, tried)
+            if token is None:
+                # Every token has been refused or is resting, so there's nothing more to try.
+                return response if response is not None else send(url, headers=headers, **kwargs)
+            response = send(url, headers=dict(headers, Authorization=f'token {token}'), **kwargs)
+            if not self.pool.update(token, response):
+                return response
+            tried.append(token)
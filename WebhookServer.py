@@ -0,0 +1,187 @@
+import hashlib
+import hmac
+import ipaddress
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class WebhookServer(object):
+    """
+    Receives push and pull_request webhooks over HTTP and queues a job for each, to compare the base and head commits
+    of the repo. Jobs are processed by a pool of worker threads, so a warm parser and session can be reused for every
+    event. Pushes to a branch that arrive before the previous one has been picked up are merged into one compare range.
+    Jobs for different repos are processed in parallel, but only one job is processed at a time for each repo, so
+    the same issue isn't created twice.
+    """
+    NULL_SHA = '0000000000000000000000000000000000000000'
+    # GitHub caps webhook payloads at 25 MB, so anything larger is refused before it's read into memory.
+    MAX_PAYLOAD_SIZE = 25 * 1024 * 1024
+
+    def __init__(self, process_job, host='127.0.0.1', port=8080, workers=4, max_queue=100, secret='',
+                 output=sys.stdout):
+        if not secret and not self.is_loopback(host):
+            # Anyone who could reach the server could otherwise create and close issues with its token.
+            raise ValueError(f'A webhook secret is required to listen on {host}')
+        # Called with each job, returning whether it succeeded, along with its log.
+        self.process_job = process_job
+        self.workers = workers
+        self.max_queue = max_queue
+        self.secret = secret
+        self.output = output
+        # Jobs waiting to be processed, oldest first.
+        self.pending = []
+        self.active_repos = set()
+        self.stopping = False
+        self.condition = threading.Condition()
+        self.worker_threads = []
+        webhook_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                try:
+                    length = int(self.headers.get('Content-Length') or 0)
+                except ValueError:
+                    length = -1
+                if not 0 <= length <= webhook_server.MAX_PAYLOAD_SIZE:
+                    # The payload is left unread, so the connection can't be reused.
+                    self.close_connection = True
+                    status = 400 if length < 0 else 413
+                else:
+                    payload = self.rfile.read(length)
+                    status = webhook_server.receive(self.headers.get('X-GitHub-Event', ''), payload,
+                                                    self.headers.get('X-Hub-Signature-256', ''))
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.url = f'http://{self.server.server_address[0]}:{self.server.server_address[1]}'
+        self.server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @staticmethod
+    def is_loopback(host):
+        """Check whether a host can only be reached from this machine."""
+        if host == 'localhost':
+            return True
+        try:
+            return ipaddress.ip_address(host).is_loopback
+        except ValueError:
+            return False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        for _ in range(self.workers):
+            worker_thread = threading.Thread(target=self._work, daemon=True)
+            worker_thread.start()
+            self.worker_threads.append(worker_thread)
+        self.server_thread.start()
+
+    def stop(self):
+        """Stop accepting events, and wait for the job being processed by each worker to finish."""
+        self.server.shutdown()
+        self.server.server_close()
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        for worker_thread in self.worker_threads:
+            worker_thread.join()
+
+    def serve_forever(self):
+        self.start()
+        print(f'Listening for webhooks on {self.url}', file=self.output)
+        self.server_thread.join()
+
+    def wait_until_idle(self, timeout=None):
+        """Wait until every queued job has been processed. Returns False if it timed out first."""
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.pending and not self.active_repos, timeout)
+
+    def receive(self, event, payload, signature=''):
+        """Queue a job for a webhook event. Returns the HTTP status to respond with."""
+        if self.secret:
+            expected = 'sha256=' + hmac.new(self.secret.encode('utf-8'), payload, hashlib.sha256).hexdigest()
+            if not hmac.compare_digest(expected, signature):
+                return 401
+        try:
+            job = self._get_job(event, json.loads(payload))
+        except (ValueError, KeyError, TypeError):
+            return 400
+        if not job:
+            # Nothing to do for this event, e.g. a ping or a deleted branch.
+            return 204
+        return 202 if self.enqueue(job) else 503
+
+    def enqueue(self, job):
+        """Add a job to the queue, merging it into a waiting job that it follows on from. Returns False if full."""
+        with self.condition:
+            for pending_job in reversed(self.pending):
+                if pending_job['repo'] == job['repo'] and pending_job['ref'] == job['ref']:
+                    if pending_job['head'] == job['base']:
+                        pending_job['head'] = job['head']
+                        return True
+                    # The branch was force-pushed, so the range can't be extended.
+                    break
+            if len(self.pending) >= self.max_queue:
+                return False
+            self.pending.append(job)
+            self.condition.notify_all()
+            return True
+
+    def _get_job(self, event, payload):
+        if event not in ['push', 'pull_request']:
+            return None
+        repo = payload['repository']['full_name']
+        if event == 'push':
+            if payload.get('deleted'):
+                return None
+            # A new branch has no base to compare with.
+            base = payload['before'] if payload['before'] != self.NULL_SHA else None
+            return {'repo': repo, 'ref': payload['ref'], 'base': base, 'head': payload['after']}
+        if event == 'pull_request':
+            action = payload['action']
+            pull_request = payload['pull_request']
+            ref = f'refs/pull/{pull_request["number"]}'
+            if action == 'synchronize':
+                return {'repo': repo, 'ref': ref, 'base': payload['before'], 'head': payload['after']}
+            if action in ['opened', 'reopened']:
+                return {'repo': repo, 'ref': ref, 'base': pull_request['base']['sha'],
+                        'head': pull_request['head']['sha']}
+        return None
+
+    def _next_job(self):
+        """Take the oldest job for a repo that isn't already being processed, waiting until there is one."""
+        with self.condition:
+            while not self.stopping:
+                for i, job in enumerate(self.pending):
+                    if job['repo'] not in self.active_repos:
+                        self.active_repos.add(job['repo'])
+                        return self.pending.pop(i)
+                self.condition.wait()
+            return None
+
+    def _work(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            try:
+                succeeded, job_log = self.process_job(job)
+            except Exception as e:
+                succeeded, job_log = False, f'{e}\n'
+            with self.condition:
+                print(f'{"Processed" if succeeded else "Failed to process"} {job["repo"]} '
+                      f'({job["base"] or ""}...{job["head"]})', file=self.output)
+                print(job_log, end='', file=self.output)
+                self.active_repos.discard(job['repo'])
+                self.condition.notify_all()
@@ -1,41 +1,95 @@
 # -*- coding: utf-8 -*-
 """Convert IDE TODOs to GitHub issues."""
 
+import glob
 import os
 import re
-from time import sleep
-from io import StringIO
-import itertools
 import operator
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+import json
 import sys
+import threading
 
 from Client import Client
+from DiffPipeline import DiffPipeline
+from DiffSharder import DiffSharder
 from GitHubClient import GitHubClient
+from Issue import Issue
 from LineStatus import LineStatus
 from LocalClient import LocalClient
+from LocalTrackerClient import LocalTrackerClient
+from RateLimitedSession import RateLimitedSession
+from RepoScanner import RepoScanner
+from RequestPlanner import RequestPlanner
 from TodoParser import TodoParser
+from WebhookServer import WebhookServer
+
+# The responses to requests refused because a rate limit has been reached.
+RATE_LIMITED_STATUS_CODES = [403, 429]
+# The number of issues sent to the client at a time.
+ISSUE_BATCH_SIZE = 10
 
-def process_diff(diff, client=Client(), insert_issue_urls=False, parser=TodoParser(), output=sys.stdout):
+
+def process_diff(diff, client=Client(), insert_issue_urls=False, parser=None, output=sys.stdout):
     # Parse the diff for TODOs and create an Issue object for each.
+    parser = parser or TodoParser()
     raw_issues = parser.parse(diff)
-    # This is a simple, non-perfect check to filter out any TODOs that have just been moved.
-    # It looks for items that appear in the diff as both an addition and deletion.
-    # It is based on the assumption that TODOs will not have identical titles in identical files.
-    # That is about as good as we can do for TODOs without issue URLs.
-    issues_to_process = []
-    for values, similar_issues_iter in itertools.groupby(raw_issues, key=operator.attrgetter('title', 'file_name',
-                                                                                        'markdown_language')):
-        similar_issues = list(similar_issues_iter)
-        if (len(similar_issues) == 2 and all(issue.issue_url is None for issue in similar_issues)
-                and ((similar_issues[0].status == LineStatus.ADDED
-                        and similar_issues[1].status == LineStatus.DELETED)
-                    or (similar_issues[1].status == LineStatus.ADDED
-                        and similar_issues[0].status == LineStatus.DELETED))):
-            print(f'Issue "{values[0]}" appears as both addition and deletion. '
-                    f'Assuming this issue has been moved so skipping.', file=output)
-            continue
-        issues_to_process.extend(similar_issues)
+    # If only some of the files are being checked (e.g. by a shard), only the deferred issues for those are processed.
+    return process_issues(raw_issues, client, insert_issue_urls, output, parser.section_filter)
+
+
+def process_diff_pipelined(diff_file, client=Client(), insert_issue_urls=False, parser=None, queue_size=16,
+                           output=sys.stdout):
+    """
+    Like process_diff, but the issues for each group of TODOs are created and closed while the rest of the diff is
+    still being read and parsed.
+    """
+    pipeline = DiffPipeline(parser or TodoParser(), queue_size, insert_issue_urls)
+    planner = RequestPlanner(client, os.getenv('INPUT_DEFERRAL_QUEUE', ''), float(os.getenv('INPUT_TIME_BUDGET', '0')),
+                             pipeline.parser.section_filter)
+    send_issues(planner.take_deferred(), client, planner, insert_issue_urls, output)
+    for raw_issues in pipeline.get_groups(diff_file):
+        send_issues(sort_issues(resolve_issues(raw_issues, client, output)), client, planner, insert_issue_urls,
+                    output)
+
+    client.finish()
+    planner.save(output)
+    return pipeline.raw_issues
+
+
+def process_issues(raw_issues, client=Client(), insert_issue_urls=False, output=sys.stdout, file_filter=None):
+    # The issues may be streamed in (e.g. from a scan), but all of them are needed to check for moved TODOs.
+    raw_issues = list(raw_issues)
+    issues_to_process = resolve_issues(raw_issues, client, output)
+
+    # Issues deferred by previous runs go first, then the rest, from the bottom of each file up.
+    planner = RequestPlanner(client, os.getenv('INPUT_DEFERRAL_QUEUE', ''), float(os.getenv('INPUT_TIME_BUDGET', '0')),
+                             file_filter)
+    send_issues(planner.take_deferred() + sort_issues(issues_to_process), client, planner, insert_issue_urls, output)
+
+    client.finish()
+    planner.save(output)
+    return raw_issues
+
+
+def resolve_issues(raw_issues, client, output=sys.stdout):
+    """
+    Update the issues for the TODOs that have moved to another file, and drop the TODOs that don't need an issue
+    created or closed. Returns the TODOs left to process.
+    """
+    issues_to_process, moved_issues = match_moved_issues(raw_issues, output)
+    for old_issue, new_issue in moved_issues:
+        print(f'Issue "{new_issue.title}" has moved from {old_issue.file_name} to {new_issue.file_name}.', file=output)
+        status_code, issue_number = client.move_issue(old_issue, new_issue)
+        if status_code == 200:
+            print(f'Issue updated: #{issue_number} @ {client.get_issue_url(issue_number)}', file=output)
+        elif status_code is None:
+            # There's no issue to update, so treat it like any other new TODO.
+            issues_to_process.append(new_issue)
+        else:
+            print('Issue could not be updated', file=output)
 
     # If a TODO with an issue URL is updated, it may appear as both an addition and a deletion.
     # We need to ignore the deletion so it doesn't update then immediately close the issue.
@@ -58,14 +112,33 @@ def process_diff(diff, client=Client(), insert_issue_urls=False, parser=TodoPars
             update_and_close_issues.add(_issue_url)
 
     # Remove issues from issues_to_process if they are both to be updated and closed (i.e., ignore deletions).
-    issues_to_process = [issue for issue in issues_to_process if
-                            not (issue.issue_url in update_and_close_issues and issue.status == LineStatus.DELETED)]
+    return [issue for issue in issues_to_process if
+            not (issue.issue_url in update_and_close_issues and issue.status == LineStatus.DELETED)]
+
+
+def sort_issues(issues):
+    """Sort the issues by file, and from the bottom of each file up, so inserted URLs don't move the lines below."""
+    return sorted(reversed(sorted(issues, key=operator.attrgetter('start_line'))), key=operator.attrgetter('file_name'))
+
+
+def send_issues(issues_to_process, client, planner, insert_issue_urls=False, output=sys.stdout):
+    """Create or close the issue for each TODO, in order, leaving the planner to defer what there's no time for."""
+    issues_to_process = planner.plan(issues_to_process, output)
 
     # Cycle through the Issue objects and create or close a corresponding GitHub issue for each.
-    for j, raw_issue in enumerate(sorted(reversed(sorted(issues_to_process, key = operator.attrgetter('start_line'))), key = operator.attrgetter('file_name'))):
+    # The client is given a batch of them at a time, so it can share lookups and schedule the requests.
+    close_issues = os.getenv('INPUT_CLOSE_ISSUES', 'true') == 'true'
+    results = {}
+    for j, raw_issue in enumerate(issues_to_process):
+        if j % ISSUE_BATCH_SIZE == 0:
+            if planner.is_out_of_time():
+                print(f'Out of time, deferring the remaining {len(issues_to_process) - j} issues.', file=output)
+                planner.defer(issues_to_process[j:])
+                break
+            results = send_issue_batch(issues_to_process[j:j + ISSUE_BATCH_SIZE], client, close_issues)
         print(f"Processing issue {j + 1} of {len(issues_to_process)}: '{raw_issue.title}' @ {raw_issue.file_name}:{raw_issue.start_line}", file=output)
         if raw_issue.status == LineStatus.ADDED:
-            status_code, new_issue_number = client.create_issue(raw_issue)
+            status_code, new_issue_number = results[id(raw_issue)]
             if status_code == 201:
                 print(f'Issue created: #{new_issue_number} @ {client.get_issue_url(new_issue_number)}', file=output)
                 # Don't insert URLs for comments. Comments do not get updated.
@@ -131,22 +204,202 @@ def process_diff(diff, client=Client(), insert_issue_urls=False, parser=TodoPars
                 print(f'Issue updated: #{new_issue_number} @ {client.get_issue_url(new_issue_number)}', file=output)
             else:
                 print('Issue could not be created', file=output)
-        elif raw_issue.status == LineStatus.DELETED and os.getenv('INPUT_CLOSE_ISSUES', 'true') == 'true':
+                if status_code in RATE_LIMITED_STATUS_CODES:
+                    planner.defer([raw_issue])
+        elif raw_issue.status == LineStatus.DELETED and close_issues:
             if raw_issue.ref and raw_issue.ref.startswith('#'):
                 print('Issue looks like a comment, will not attempt to close.', file=output)
                 continue
-            status_code = client.close_issue(raw_issue)
+            status_code = results[id(raw_issue)]
             if status_code in [200, 201]:
                 print('Issue closed', file=output)
             else:
                 print('Issue could not be closed', file=output)
-        # Stagger the requests to be on the safe side.
-        sleep(1)
+                if status_code in RATE_LIMITED_STATUS_CODES:
+                    planner.defer([raw_issue])
+
+
+def send_issue_batch(batch, client, close_issues=True):
+    """
+    Create the issues for the TODOs added in a batch, and close those for the TODOs removed (other than comments).
+    Returns the result for each issue, by the issue's id.
+    """
+    added_issues = [issue for issue in batch if issue.status == LineStatus.ADDED]
+    deleted_issues = [issue for issue in batch if issue.status == LineStatus.DELETED and close_issues
+                      and not (issue.ref and issue.ref.startswith('#'))]
+    results = {}
+    if added_issues:
+        results.update(zip(map(id, added_issues), client.create_issues(added_issues)))
+    if deleted_issues:
+        results.update(zip(map(id, deleted_issues), client.close_issues(deleted_issues)))
+    return results
 
-    return raw_issues
 
+def match_moved_issues(raw_issues, output=sys.stdout):
+    """
+    Pair up each TODO removed by the diff with an identical one added elsewhere in the diff, as it's likely been moved.
+    This is a simple, non-perfect check, based on the assumption that TODOs will not have identical titles.
+    That is about as good as we can do for TODOs without issue URLs. Bodies aren't compared, as the parser doesn't
+    collect them for removed TODOs.
+    Returns the TODOs left to process, and the pairs of TODOs (old and new) that have moved to another file.
+    """
+    def get_key(issue):
+        return issue.identifier.lower(), issue.ref, issue.title
+
+    # The TODOs removed, for each key and for each key and file, in the order they appear in the diff.
+    deleted_issues = defaultdict(deque)
+    deleted_issues_by_file = defaultdict(deque)
+    for raw_issue in raw_issues:
+        if raw_issue.status == LineStatus.DELETED and raw_issue.issue_url is None:
+            key = get_key(raw_issue)
+            deleted_issues[key].append(raw_issue)
+            deleted_issues_by_file[key, raw_issue.file_name].append(raw_issue)
+
+    moved = set()
+    moved_issues = []
+
+    def take_deleted_issue(candidates):
+        # A TODO may already have been taken from the other queue.
+        while candidates and id(candidates[0]) in moved:
+            candidates.popleft()
+        return candidates.popleft() if candidates else None
+
+    for raw_issue in raw_issues:
+        if raw_issue.status != LineStatus.ADDED or raw_issue.issue_url is not None:
+            continue
+        key = get_key(raw_issue)
+        # Prefer a TODO removed from the same file, otherwise take the first one removed.
+        old_issue = (take_deleted_issue(deleted_issues_by_file[key, raw_issue.file_name])
+                     or take_deleted_issue(deleted_issues[key]))
+        if not old_issue:
+            continue
+        moved.update([id(old_issue), id(raw_issue)])
+        if old_issue.file_name == raw_issue.file_name or (raw_issue.ref and raw_issue.ref.startswith('#')):
+            # Nothing about the issue has changed (and comments are never updated).
+            print(f'Issue "{raw_issue.title}" appears as both addition and deletion. '
+                  f'Assuming this issue has been moved so skipping.', file=output)
+        else:
+            moved_issues.append((old_issue, raw_issue))
+
+    return [issue for issue in raw_issues if id(issue) not in moved], moved_issues
+
+
+def reconcile(client, parser, insert_issue_urls=False, output=sys.stdout):
+    """
+    Bring the open issues in line with the TODOs in the working tree, however many diffs have been missed: an issue is
+    created for each TODO without one, and the issues whose TODOs have gone are closed. The issues for files that
+    couldn't be checked are left alone, as their TODOs may still be there.
+    """
+    todo_issues = client.get_todo_issues()
+    open_titles = {todo_issue['title'] for todo_issue in todo_issues}
+    # The issues that TODOs link to (with URL insertion), and the titles of the issues the rest would have.
+    linked_numbers = set()
+    todo_titles = set()
+    added_issues = []
+    scanner = RepoScanner(parser)
+    for raw_issue in scanner.scan():
+        if raw_issue.ref and raw_issue.ref.startswith('#'):
+            # Comments on existing issues aren't tracked by their own issue.
+            continue
+        if raw_issue.issue_number:
+            linked_numbers.add(str(raw_issue.issue_number))
+            continue
+        title = client.get_issue_title(raw_issue)
+        if title not in open_titles and title not in todo_titles:
+            added_issues.append(raw_issue)
+        todo_titles.add(title)
+    deleted_issues = [Issue(title=todo_issue['title'], labels=[], assignees=[], milestone=None, body=[], hunk='',
+                            file_name=todo_issue.get('file_name') or '', start_line=0, num_lines=1, prefix='',
+                            suffix='', markdown_language='', status=LineStatus.DELETED, identifier=None,
+                            identifier_actual=None, ref=None,
+                            issue_url=client.get_issue_url(todo_issue['number']), issue_number=todo_issue['number'])
+                      for todo_issue in todo_issues
+                      if str(todo_issue['number']) not in linked_numbers and todo_issue['title'] not in todo_titles
+                      and todo_issue.get('file_name') not in scanner.skipped_files]
+    print(f'{len(added_issues)} TODOs have no issue and {len(deleted_issues)} of {len(todo_issues)} open issues '
+          f'have no TODO', file=output)
+    return process_issues(added_issues + deleted_issues, client, insert_issue_urls, output)
+
+
+def finish_shards(client, summary_paths):
+    """Once every shard of a PR's diff has finished, reference all the issues they closed in the PR description."""
+    if not isinstance(client, GitHubClient):
+        return
+    client.pr_closed_issues.extend(DiffSharder.read_pr_closed_issues(summary_paths))
+    client.defer_pr_update = False
+    client.finish()
+
+
+def load_manifest(path):
+    """Load the list of jobs for a batch, each a dict with the repo, and the base and head commits to compare."""
+    with open(path) as manifest_file:
+        jobs = json.load(manifest_file)
+    for job in jobs:
+        if not job.get('repo') or not job.get('head'):
+            raise ValueError(f'Invalid batch job, a repo and head commit are required: {job}')
+    return jobs
+
+
+def process_job(job, parser, session, parse_lock):
+    """
+    Process the diff between the base and head commits of a job's repo, with its own client.
+    Returns whether it succeeded, along with its log.
+    """
+    job_output = StringIO()
+    try:
+        client = GitHubClient(repo=job['repo'], before=job.get('base'), sha=job['head'], session=session)
+        last_diff = client.get_last_diff_file(parser)
+        if last_diff:
+            # The parser isn't thread-safe, and parsing is bound by the CPU anyway, so only one diff is parsed at a time.
+            with parse_lock:
+                raw_issues = parser.parse(last_diff)
+            # There's no checkout to insert issue URLs into.
+            process_issues(raw_issues, client, False, job_output)
+        return True, job_output.getvalue()
+    except Exception as e:
+        print(f'Could not process {job["repo"]}: {e}', file=job_output)
+        return False, job_output.getvalue()
+
+
+def process_batch(jobs, parser, session, workers=4, output=sys.stdout):
+    """
+    Process the diffs of several repos concurrently, sharing one parser and HTTP session between them.
+    Each repo gets its own client, so its issues and milestones are kept separate.
+    Returns the jobs that failed.
+    """
+    parse_lock = threading.Lock()
+    failed_jobs = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Each repo's log is printed in one go, so the logs of repos processed at the same time don't get mixed up.
+        results = executor.map(lambda job: process_job(job, parser, session, parse_lock), jobs)
+        for job, (succeeded, job_log) in zip(jobs, results):
+            print(f'Processed {job["repo"]} ({job.get("base") or ""}...{job["head"]})', file=output)
+            print(job_log, end='', file=output)
+            if not succeeded:
+                failed_jobs.append(job)
+    print(f'Processed {len(jobs)} repos, {len(failed_jobs)} failed', file=output)
+    return failed_jobs
 
 if __name__ == "__main__":
+    batch_manifest = os.getenv('INPUT_BATCH_MANIFEST', '')
+    webhook_port = os.getenv('INPUT_WEBHOOK_PORT', '')
+    if batch_manifest or webhook_port:
+        batch_workers = int(os.getenv('INPUT_BATCH_WORKERS', '4'))
+        batch_session = RateLimitedSession(requests_per_hour=int(os.getenv('INPUT_BATCH_REQUESTS_PER_HOUR', '4500')),
+                                           pool_size=batch_workers * GitHubClient.max_concurrent_requests)
+        batch_parser = TodoParser()
+        if webhook_port:
+            # Keep the parser and session warm, and process each webhook event as it arrives.
+            batch_parse_lock = threading.Lock()
+            WebhookServer(lambda job: process_job(job, batch_parser, batch_session, batch_parse_lock),
+                          host=os.getenv('INPUT_WEBHOOK_HOST', '127.0.0.1'), port=int(webhook_port),
+                          workers=batch_workers, max_queue=int(os.getenv('INPUT_WEBHOOK_QUEUE_SIZE', '100')),
+                          secret=os.getenv('INPUT_WEBHOOK_SECRET', '')).serve_forever()
+            sys.exit(0)
+        # Process every repo in the manifest in this one process.
+        batch_failed_jobs = process_batch(load_manifest(batch_manifest), batch_parser, batch_session, batch_workers)
+        sys.exit(1 if batch_failed_jobs else 0)
+
     client: Client | None = None
     # Try to create a basic client for communicating with the remote version control server, automatically initialised with environment variables.
     try:
@@ -157,13 +410,43 @@ if __name__ == "__main__":
         pass
     # if needed, fall back to using a local client for testing
     client = client or LocalClient()
+    local_tracker = os.getenv('INPUT_LOCAL_TRACKER', '')
+    if local_tracker:
+        # Keep the issues in a local file instead, still getting the diff as above.
+        client = LocalTrackerClient(local_tracker, getattr(client, 'repo', None), diff_client=client)
 
-    # Get the diff from the last pushed commit.
-    last_diff = client.get_last_diff()
+    # Check to see if we should insert the issue URL back into the linked TODO.
+    insert_issue_urls = os.getenv('INPUT_INSERT_ISSUE_URLS', 'false') == 'true'
 
-    # process the diff
-    if last_diff:
-        # Check to see if we should insert the issue URL back into the linked TODO.
-        insert_issue_urls = os.getenv('INPUT_INSERT_ISSUE_URLS', 'false') == 'true'
+    parser = TodoParser()
+    shard_summaries = os.getenv('INPUT_SHARD_SUMMARIES', '')
+    if shard_summaries:
+        # Run after the shards, to make the changes to the PR description that they left to a single job.
+        finish_shards(client, [path for pattern in shard_summaries.split() for path in sorted(glob.glob(pattern))])
+    elif os.getenv('INPUT_RECONCILE', 'false') == 'true':
+        # Make the open issues match the TODOs in the whole working tree, rather than processing the diff.
+        reconcile(client, parser, insert_issue_urls)
+    elif os.getenv('INPUT_SCAN', 'false') == 'true':
+        # Scan the whole working tree rather than the diff, treating every TODO found as newly added.
+        process_issues(RepoScanner(parser).scan(), client, insert_issue_urls)
+    else:
+        # Get the diff from the last pushed commit, so it can be parsed as it arrives.
+        last_diff = client.get_last_diff_file(parser)
+        shard_count = int(os.getenv('INPUT_SHARD_COUNT', '1'))
+        sharder = None
+        if last_diff and shard_count > 1:
+            # Only check this job's share of the files, with the rest left to the other jobs.
+            sharder = DiffSharder(parser.identifiers, int(os.getenv('INPUT_SHARD_INDEX', '0')), shard_count)
+            last_diff = sharder.shard(last_diff, parser)
 
-        process_diff(StringIO(last_diff), client, insert_issue_urls)
+        # process the diff
+        if last_diff:
+            if os.getenv('INPUT_PIPELINE', 'false') == 'true':
+                # Start creating and closing issues while the rest of the diff is still being read and parsed.
+                raw_issues = process_diff_pipelined(last_diff, client, insert_issue_urls, parser,
+                                                    int(os.getenv('INPUT_PIPELINE_QUEUE_SIZE', '16')))
+            else:
+                raw_issues = process_diff(last_diff, client, insert_issue_urls, parser)
+            shard_summary = os.getenv('INPUT_SHARD_SUMMARY', '')
+            if sharder and shard_summary:
+                sharder.write_summary(shard_summary, raw_issues, getattr(client, 'pr_closed_issues', []))
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+
+class FakeGitHubApi(object):
+    """A local stand-in for the parts of the GitHub REST API used by GitHubClient, run on a background thread."""
+
+    def __init__(self):
+        # For each repo, its issues, and the diffs returned for each compare range or commit.
+        self.repos = {}
+        # Every request received, as (method, path).
+        self.requests = []
+        # The number of conditional requests answered with 304 Not Modified.
+        self.not_modified = 0
+        # The number of times to fail each (path, page) request before succeeding.
+        self.failures = {}
+        self.lock = threading.Lock()
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                api.handle(self, 'GET')
+
+            def do_POST(self):
+                api.handle(self, 'POST')
+
+            def do_PATCH(self):
+                api.handle(self, 'PATCH')
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def add_repo(self, repo, diffs=None, issues=None, pulls=None, assignees=None):
+        self.repos[repo] = {'diffs': diffs or {}, 'issues': issues or [], 'pulls': pulls or {},
+                            'assignees': assignees or []}
+
+    def handle(self, handler, method):
+        url = urlparse(handler.path)
+        path = unquote(url.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        length = int(handler.headers.get('Content-Length') or 0)
+        body = json.loads(handler.rfile.read(length)) if length else None
+        headers = {}
+        with self.lock:
+            self.requests.append((method, path))
+            status, response = self.respond(method, path, query, body, headers)
+        if isinstance(response, str):
+            data = response.encode('utf-8')
+            content_type = 'text/plain'
+        else:
+            data = json.dumps(response).encode('utf-8')
+            content_type = 'application/json'
+        etag = f'"{hashlib.sha1(data).hexdigest()}"'
+        if method == 'GET' and status == 200 and handler.headers.get('If-None-Match') == etag:
+            with self.lock:
+                self.not_modified += 1
+            handler.send_response(304)
+            handler.send_header('ETag', etag)
+            handler.end_headers()
+            return
+        handler.send_response(status)
+        handler.send_header('Content-Type', content_type)
+        handler.send_header('ETag', etag)
+        for header, value in headers.items():
+            handler.send_header(header, value)
+        handler.send_header('Content-Length', str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def respond(self, method, path, query, body, headers):
+        if path == '/search/issues':
+            repo = re.search(r'repo:(\S+)', query.get('q', '')).group(1)
+            return 200, {'items': self.repos.get(repo, {}).get('issues', [])}
+        repo_search = re.match(r'^/repos/([^/]+/[^/]+)/(.*)$', path)
+        if not repo_search or repo_search.group(1) not in self.repos:
+            return 404, {'message': 'Not Found'}
+        repo = self.repos[repo_search.group(1)]
+        resource = repo_search.group(2)
+        issue_search = re.match(r'^issues/(\d+)$', resource)
+        if resource in repo['diffs'] and method == 'GET':
+            return 200, repo['diffs'][resource]
+        if resource == 'issues' and method == 'GET':
+            page = int(query.get('page', 1))
+            if self.failures.get((path, page)):
+                self.failures[path, page] -= 1
+                return 502, {'message': 'Server Error'}
+            per_page = int(query.get('per_page', 30))
+            open_issues = [issue for issue in repo['issues'] if issue['state'] == query.get('state', 'open')]
+            last_page = max((len(open_issues) + per_page - 1) // per_page, 1)
+            if last_page > 1:
+                headers['Link'] = f'<{self.url}{path}?per_page={per_page}&page={last_page}>; rel="last"'
+            return 200, open_issues[(page - 1) * per_page:page * per_page]
+        if resource == 'issues' and method == 'POST':
+            number = len(repo['issues']) + 1
+            issue = dict(body, number=number, state='open',
+                         html_url=f'https://github.com/{repo_search.group(1)}/issues/{number}')
+            repo['issues'].append(issue)
+            return 201, issue
+        if issue_search and method == 'GET' and int(issue_search.group(1)) <= len(repo['issues']):
+            return 200, repo['issues'][int(issue_search.group(1)) - 1]
+        if issue_search and method == 'PATCH':
+            issue = repo['issues'][int(issue_search.group(1)) - 1]
+            issue.update(body)
+            return 200, issue
+        if re.match(r'^issues/\d+/comments$', resource) and method == 'POST':
+            return 201, {}
+        pull_search = re.match(r'^pulls/(\d+)$', resource)
+        if pull_search and int(pull_search.group(1)) in repo['pulls']:
+            pull = repo['pulls'][int(pull_search.group(1))]
+            if method == 'PATCH':
+                pull.update(body)
+            return 200, pull
+        assignee_search = re.match(r'^assignees/([^/]+)$', resource)
+        if assignee_search and method == 'GET':
+            return (204, '') if assignee_search.group(1) in repo['assignees'] else (404, {'message': 'Not Found'})
+        if resource == 'milestones' and method == 'GET':
+            return 200, []
+        return 404, {'message': 'Not Found'}
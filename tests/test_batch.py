@@ -0,0 +1,69 @@
+import io
+import json
+import os
+import unittest
+from unittest import mock
+
+from RateLimitedSession import RateLimitedSession
+from TodoParser import TodoParser
+from main import process_batch
+from tests.fake_github_api import FakeGitHubApi
+
+
+def make_diff(file_name, status, line):
+    return (f'diff --git a/{file_name} b/{file_name}\n'
+            'index 1111111..2222222 100644\n'
+            f'--- a/{file_name}\n'
+            f'+++ b/{file_name}\n'
+            '@@ -1,2 +1,2 @@\n'
+            ' x = 1\n'
+            f'{"+" if status == "added" else "-"}{line}\n')
+
+
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        self.parser = TodoParser()
+        with open('syntax.json', 'r') as syntax_json:
+            self.parser.syntax_dict = json.load(syntax_json)
+
+    def test_batch(self):
+        with FakeGitHubApi() as api:
+            os.environ['INPUT_GITHUB_URL'] = api.url
+            api.add_repo('o/a', diffs={'compare/base...head': make_diff('a.py', 'added', '# TODO: Issue in a')
+                                       + make_diff('b.py', 'deleted', '# TODO: Issue in b')})
+            api.add_repo('o/b', diffs={'commits/head': make_diff('b.py', 'deleted', '# TODO: Issue in b')},
+                         issues=[{'number': 1, 'title': 'Issue in b', 'state': 'open',
+                                  'html_url': 'https://github.com/o/b/issues/1'}])
+            jobs = [{'repo': 'o/a', 'base': 'base', 'head': 'head'},
+                    {'repo': 'o/b', 'head': 'head'},
+                    {'repo': 'o/missing', 'base': 'base', 'head': 'head'}]
+            output = io.StringIO()
+            failed_jobs = process_batch(jobs, self.parser, RateLimitedSession(), workers=3, output=output)
+
+        self.assertEqual(failed_jobs, [jobs[2]])
+        self.assertIn('Processed 3 repos, 1 failed', output.getvalue())
+        # Each repo's issues are kept separate, so the issue in b is only closed in b.
+        self.assertEqual([(issue['title'], issue['state']) for issue in api.repos['o/a']['issues']],
+                         [('Issue in a', 'open')])
+        self.assertEqual([(issue['title'], issue['state']) for issue in api.repos['o/b']['issues']],
+                         [('Issue in b', 'closed')])
+
+    def tearDown(self):
+        os.environ.pop('INPUT_GITHUB_URL', None)
+
+
+class RateLimitedSessionTest(unittest.TestCase):
+    def test_budget(self):
+        session = RateLimitedSession(requests_per_hour=3600, burst=2)
+        waits = []
+        with mock.patch('RateLimitedSession.time.sleep', side_effect=waits.append):
+            for _ in range(4):
+                session._wait_for_budget()
+        # The burst is used up straight away, then each request waits its turn.
+        self.assertEqual(len(waits), 2)
+        self.assertAlmostEqual(waits[0], 1, places=1)
+        self.assertAlmostEqual(waits[1], 2, places=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
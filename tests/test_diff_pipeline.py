@@ -0,0 +1,136 @@
+import io
+import json
+import threading
+import unittest
+from unittest import mock
+
+from Client import Client
+from DiffPipeline import DiffPipeline
+from TodoParser import TodoParser
+from main import process_diff, process_diff_pipelined
+
+
+class RecordingClient(Client):
+    """Client which records what it's asked to do to each issue."""
+
+    def __init__(self):
+        self.calls = []
+
+    def create_issue(self, issue):
+        self.calls.append(('create', issue.file_name, issue.title, issue.issue_url))
+        return 201, None
+
+    def close_issue(self, issue):
+        self.calls.append(('close', issue.file_name, issue.title, issue.issue_url))
+        return 200
+
+    def move_issue(self, old_issue, new_issue):
+        self.calls.append(('move', old_issue.file_name, new_issue.file_name, new_issue.title))
+        return 200, None
+
+
+class GatedDiff(object):
+    """A diff already in hand, which waits partway through being read for the parser until a gate is opened."""
+
+    def __init__(self, diff, gate_line):
+        self.lines = diff.splitlines(keepends=True)
+        self.gate_line = gate_line
+        self.gate = threading.Event()
+        self.gate_opened = None
+        self.passes = 0
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset):
+        pass
+
+    def __iter__(self):
+        self.passes += 1
+        for i, line in enumerate(self.lines):
+            if self.passes == 2 and i == self.gate_line:
+                self.gate_opened = self.gate.wait(5)
+            yield line
+
+    def close(self):
+        pass
+
+
+class DiffPipelineTest(unittest.TestCase):
+    def setUp(self):
+        self.parser = TodoParser()
+        with open('syntax.json', 'r') as syntax_json:
+            self.parser.syntax_dict = json.load(syntax_json)
+
+    @staticmethod
+    def _get_diff(todos):
+        """Build a diff changing each file, from (file, lines) pairs where each line starts with + or -."""
+        diff = ''
+        for file_name, line in todos:
+            diff += (f'diff --git a/{file_name} b/{file_name}\n'
+                     f'index 1111111..2222222 100644\n'
+                     f'@@ -1,1 +1,1 @@\n'
+                     f'{line}\n')
+        return diff
+
+    def _process(self, diff):
+        sequential_client = RecordingClient()
+        sequential_issues = process_diff(io.StringIO(diff), sequential_client, parser=self.parser, output=io.StringIO())
+        pipelined_client = RecordingClient()
+        pipelined_issues = process_diff_pipelined(io.StringIO(diff), pipelined_client, parser=self.parser, queue_size=2,
+                                                  output=io.StringIO())
+        self.assertEqual([issue.title for issue in pipelined_issues], [issue.title for issue in sequential_issues])
+        return sequential_client.calls, pipelined_client.calls
+
+    def test_same_as_sequential(self):
+        for diff_name in ['test_new.diff', 'test_closed.diff', 'test_edit.diff', 'test_edit_py.diff']:
+            with open(f'tests/{diff_name}', 'r') as diff_file:
+                diff = diff_file.read()
+            sequential_calls, pipelined_calls = self._process(diff)
+            self.assertTrue(sequential_calls)
+            self.assertEqual(sorted(pipelined_calls), sorted(sequential_calls))
+
+    def test_moves_held_back(self):
+        todos = [('file0.py', '-# TODO: Moved')]
+        todos += [(f'file{i}.py', f'+# TODO: Unrelated {i}') for i in range(1, 40)]
+        todos += [('file40.py', '+# TODO: Moved'), ('file41.py', '+# TODO: Moved along'),
+                  ('file42.py', '-# TODO: Fixed'), ('file43.py', '+# TODO: Fixed differently'),
+                  ('file44.py', '-# TODO: Tracked\n-# Issue URL: https://github.com/o/r/issues/1'),
+                  ('file45.py', '+# TODO: Tracked here\n+# Issue URL: https://github.com/o/r/issues/1')]
+        diff = self._get_diff(todos)
+        sequential_calls, pipelined_calls = self._process(diff)
+        self.assertEqual(sorted(pipelined_calls), sorted(sequential_calls))
+        self.assertIn(('move', 'file0.py', 'file40.py', 'Moved'), pipelined_calls)
+        # The issue is updated from the TODO it was moved to, rather than closed.
+        self.assertIn(('create', 'file45.py', 'Tracked here', 'https://github.com/o/r/issues/1'), pipelined_calls)
+        self.assertNotIn('close', [call[0] for call in pipelined_calls if call[-1]])
+
+        groups = list(DiffPipeline(self.parser, 2).get_groups(io.StringIO(diff)))
+        self.assertGreater(len(groups), 1)
+        # Only the TODOs that may have moved are held back to the end, judged by the first word of the title.
+        self.assertEqual(sorted(issue.title for issue in groups[-1]),
+                         ['Fixed', 'Fixed differently', 'Moved', 'Moved', 'Moved along'])
+
+    def test_issues_sent_while_reading(self):
+        todos = [(f'file{i}.py', f'+# TODO: Unrelated {i}') for i in range(10)]
+        todos += [('file10.py', '-# TODO: Moved'), ('file11.py', '+# TODO: Moved')]
+        diff = self._get_diff(todos)
+        # The parser is stopped before the last files until an issue has been created.
+        gated_diff = GatedDiff(diff, diff[:diff.index('diff --git a/file10.py')].count('\n'))
+        client = RecordingClient()
+        create_issue = client.create_issue
+
+        def open_gate(issue):
+            gated_diff.gate.set()
+            return create_issue(issue)
+
+        client.create_issue = open_gate
+        with mock.patch.object(DiffPipeline, 'CHUNK_SIZE', 1):
+            process_diff_pipelined(gated_diff, client, parser=self.parser, queue_size=2, output=io.StringIO())
+        self.assertTrue(gated_diff.gate_opened)
+        self.assertEqual(len([call for call in client.calls if call[0] == 'create']), 10)
+        self.assertIn(('move', 'file10.py', 'file11.py', 'Moved'), client.calls)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from DiffSharder import DiffSharder
+from TodoParser import TodoParser
+
+
+class DiffSharderTest(unittest.TestCase):
+    def setUp(self):
+        self.parser = TodoParser()
+        with open('syntax.json', 'r') as syntax_json:
+            self.parser.syntax_dict = json.load(syntax_json)
+
+    @staticmethod
+    def _summarise(issues):
+        return sorted((issue.file_name, issue.start_line, issue.title, issue.status.name) for issue in issues)
+
+    def _parse_shards(self, diff, shard_count):
+        shards = []
+        for shard_index in range(shard_count):
+            sharder = DiffSharder(self.parser.identifiers, shard_index, shard_count)
+            shards.append((sharder, self.parser.parse(sharder.shard(io.StringIO(diff), self.parser))))
+        self.parser.section_filter = None
+        return shards
+
+    def test_shards_cover_diff(self):
+        with open('tests/test_new.diff', 'r') as diff_file:
+            diff = diff_file.read()
+        shards = self._parse_shards(diff, 4)
+        self.assertEqual(self._summarise(issue for _, issues in shards for issue in issues),
+                         self._summarise(self.parser.parse(io.StringIO(diff))))
+        # Every file is in exactly one shard.
+        files = [file for sharder, _ in shards for file in sharder.parents if sharder.includes(file)]
+        self.assertEqual(len(files), len(set(files)))
+        self.assertEqual(len(files), diff.count('diff --git '))
+        self.assertGreater(len({shards[0][0].get_shard(file) for file in files}), 1)
+
+    def test_moves_kept_together(self):
+        diff = ''
+        for i in range(20):
+            sign = '-' if i == 0 else '+'
+            line = '# TODO: Moved' if i in [0, 19] else f'# TODO: Unrelated {i}'
+            diff += (f'diff --git a/file{i}.py b/file{i}.py\n'
+                     f'index 1111111..2222222 100644\n'
+                     f'@@ -1,1 +1,1 @@\n'
+                     f'{sign}{line}\n')
+        sharder = DiffSharder(self.parser.identifiers, 0, 8)
+        sharder.plan(io.StringIO(diff))
+        self.assertEqual(sharder.get_shard('file0.py'), sharder.get_shard('file19.py'))
+        self.assertGreater(len({sharder.get_shard(f'file{i}.py') for i in range(20)}), 1)
+
+    def test_summary(self):
+        with open('tests/test_edit_py.diff', 'r') as diff_file:
+            diff = diff_file.read()
+        (sharder, issues), = self._parse_shards(diff, 1)
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, 'summary.json')
+            sharder.write_summary(path, issues)
+            with open(path) as summary_file:
+                summary = json.load(summary_file)
+        self.assertEqual(summary['files'], ['example_file.py'])
+        self.assertEqual(len(summary['issues']), len(issues))
+
+    def test_invalid_shard(self):
+        with self.assertRaises(ValueError):
+            DiffSharder(['TODO'], 2, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
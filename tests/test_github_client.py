@@ -1,9 +1,21 @@
+import glob
 import io
+import os
+import tempfile
 import unittest
 from contextlib import redirect_stdout
 from types import SimpleNamespace
+from unittest import mock
 
+import requests
+
+from DiffSharder import DiffSharder
 from GitHubClient import GitHubClient
+from HttpCache import HttpCache
+from Issue import Issue
+from LineStatus import LineStatus
+from main import finish_shards
+from tests.fake_github_api import FakeGitHubApi
 
 
 class CloseIssueAmbiguousMatchTest(unittest.TestCase):
@@ -52,5 +64,330 @@ class CloseIssueAmbiguousMatchTest(unittest.TestCase):
         self.assertIn('https://github.com/o/r/issues/22', log)
 
 
+class FakeResponse(object):
+    def __init__(self, status_code=200, json_data=None, content=b'', links=None):
+        self.status_code = status_code
+        self._json_data = json_data
+        self.content = content
+        self.text = content.decode('utf-8')
+        self.links = links or {}
+        self.headers = {'content-type': 'application/json'}
+
+    def json(self):
+        return self._json_data
+
+
+class FilesDiffTest(unittest.TestCase):
+    """Tests for building the diff from the paginated list of changed files."""
+
+    pr_url = 'https://api.github.com/repos/o/r/pulls/5'
+    files_url = f'{pr_url}/files'
+
+    @staticmethod
+    def _client():
+        client = GitHubClient.__new__(GitHubClient)
+        client.session = requests
+        client.repos_url = 'https://api.github.com/repos/'
+        client.repo = 'o/r'
+        client.issue_headers = {}
+        client.max_concurrent_requests = 2
+        return client
+
+    def _fake_get(self, url, headers=None, params=None):
+        page = (params or {}).get('page', 1)
+        if url == self.pr_url:
+            return FakeResponse(json_data={'base': {'sha': 'base'}, 'head': {'sha': 'head'}})
+        if url == 'https://api.github.com/repos/o/r/compare/base...head':
+            return FakeResponse(json_data={'merge_base_commit': {'sha': 'fork'}, 'files': []})
+        if url == self.files_url and page == 1:
+            return FakeResponse(json_data=[{'filename': 'a.py', 'status': 'modified', 'sha': 'aaaaaaa', 'changes': 2,
+                                            'patch': '@@ -1 +1 @@\n-x = 1\n+x = 2  # TODO: Check x'}],
+                                links={'last': {'url': f'{self.files_url}?per_page=100&page=2'}})
+        if url == self.files_url and page == 2:
+            return FakeResponse(json_data=[{'filename': 'big.py', 'status': 'added', 'sha': 'bbbbbbb',
+                                            'changes': 2}])
+        if url.endswith('/git/blobs/bbbbbbb'):
+            return FakeResponse(content=b'y = 1\n# TODO: Too big for a patch\n')
+        return FakeResponse(status_code=404)
+
+    def test_pages_stitched_into_diff(self):
+        with mock.patch('GitHubClient.requests.get', side_effect=self._fake_get), redirect_stdout(io.StringIO()):
+            diff = self._client()._get_files_diff(self.pr_url)
+        self.assertIn('diff --git a/a.py b/a.py\nindex 0000000..0000000\n--- a/a.py\n+++ b/a.py\n@@ -1 +1 @@\n', diff)
+        # The file without a patch is fetched and diffed locally.
+        self.assertIn('diff --git a/big.py b/big.py\nnew file mode 100644\nindex 0000000..bbbbbbb\n', diff)
+        self.assertIn('@@ -0,0 +1,2 @@\n+y = 1\n+# TODO: Too big for a patch\n', diff)
+
+    def test_failed_page_fails_whole_diff(self):
+        def fake_get(url, headers=None, params=None):
+            if url == self.files_url and (params or {}).get('page') == 2:
+                return FakeResponse(status_code=500)
+            return self._fake_get(url, headers, params)
+
+        with mock.patch('GitHubClient.requests.get', side_effect=fake_get), redirect_stdout(io.StringIO()):
+            self.assertIsNone(self._client()._get_files_diff(self.pr_url))
+
+    def test_modified_file_diffed_against_merge_base(self):
+        refs = []
+
+        def fake_get(url, headers=None, params=None):
+            if url == self.files_url:
+                return FakeResponse(json_data=[{'filename': 'big.py', 'status': 'modified', 'sha': 'bbbbbbb',
+                                                'changes': 1}])
+            if url.endswith('/contents/big.py'):
+                refs.append(params['ref'])
+                return FakeResponse(content=b'y = 1\n')
+            return self._fake_get(url, headers, params)
+
+        with mock.patch('GitHubClient.requests.get', side_effect=fake_get), redirect_stdout(io.StringIO()):
+            diff = self._client()._get_files_diff(self.pr_url)
+        self.assertIn('+# TODO: Too big for a patch\n', diff)
+        # The base branch may have moved on, so the old contents come from where the branch left it.
+        self.assertEqual(refs, ['fork'])
+
+    def test_too_many_files(self):
+        # A comparison lists at most 300 files, and a commit 3000, so a full list may have been cut short.
+        for diff_url, num_files in [('https://api.github.com/repos/o/r/compare/a...b', 300),
+                                    ('https://api.github.com/repos/o/r/commits/b', 3000)]:
+            def fake_get(url, headers=None, params=None):
+                if url == diff_url:
+                    files = [{'filename': f'{i}.py', 'status': 'modified', 'sha': 'aaaaaaa', 'changes': 2,
+                              'patch': '@@ -1 +1 @@\n-x = 1\n+x = 2'} for i in range(num_files)]
+                    return FakeResponse(json_data={'merge_base_commit': {'sha': 'a'}, 'parents': [{'sha': 'a'}],
+                                                   'files': files})
+                return FakeResponse(status_code=404)
+
+            client = self._client()
+            with mock.patch('GitHubClient.requests.get', side_effect=fake_get), redirect_stdout(io.StringIO()):
+                self.assertIsNone(client._get_files_diff(diff_url))
+            self.assertTrue(client.too_many_files)
+
+
+class MoveIssueTest(unittest.TestCase):
+    def test_move_issue(self):
+        def make_issue(file_name, status):
+            return Issue(title='Moved', labels=[], assignees=[], milestone=None, body=[], hunk='# TODO: Moved',
+                         file_name=file_name, start_line=3, num_lines=1, prefix='', suffix='',
+                         markdown_language='python', status=status, identifier='TODO', identifier_actual='TODO',
+                         ref=None, issue_url=None, issue_number=None)
+
+        with FakeGitHubApi() as api, mock.patch.dict(os.environ, {'INPUT_GITHUB_URL': api.url}):
+            api.add_repo('o/r', issues=[{'number': 1, 'title': 'Moved', 'state': 'open', 'body': 'a.py',
+                                         'html_url': 'https://github.com/o/r/issues/1'}])
+            client = GitHubClient(repo='o/r', sha='head')
+            with redirect_stdout(io.StringIO()):
+                status_code, issue_number = client.move_issue(make_issue('a.py', LineStatus.DELETED),
+                                                              make_issue('b.py', LineStatus.ADDED))
+        # The existing issue is updated to link to the TODO's new home, rather than closed and created again.
+        self.assertEqual((status_code, issue_number), (200, 1))
+        self.assertEqual(len(api.repos['o/r']['issues']), 1)
+        self.assertIn('/blob/head/b.py#L3', api.repos['o/r']['issues'][0]['body'])
+        self.assertNotIn('POST', [method for method, _ in api.requests])
+
+
+class FingerprintTest(unittest.TestCase):
+    @staticmethod
+    def _issue(title='Fingerprinted', start_line=3, hunk='# TODO: Fingerprinted', issue_number=None):
+        return Issue(title=title, labels=[], assignees=[], milestone=None, body=['Body'], hunk=hunk,
+                     file_name='a.py', start_line=start_line, num_lines=1, prefix='', suffix='',
+                     markdown_language='python', status=LineStatus.ADDED, identifier='TODO',
+                     identifier_actual='TODO', ref=None,
+                     issue_url=f'https://github.com/o/r/issues/{issue_number}' if issue_number else None,
+                     issue_number=issue_number)
+
+    def test_unchanged_issue_not_updated(self):
+        with FakeGitHubApi() as api, mock.patch.dict(os.environ, {'INPUT_GITHUB_URL': api.url}), \
+                redirect_stdout(io.StringIO()):
+            api.add_repo('o/r')
+            self.assertEqual(GitHubClient(repo='o/r', sha='head').create_issue(self._issue()), (201, 1))
+            client = GitHubClient(repo='o/r', sha='head')
+            # Only the code around the TODO has changed.
+            self.assertEqual(client.create_issue(self._issue(start_line=5, hunk='x = 1\n# TODO: Fingerprinted',
+                                                             issue_number='1')), (200, '1'))
+            self.assertNotIn(('PATCH', '/repos/o/r/issues/1'), api.requests)
+            client.create_issue(self._issue(title='Renamed', issue_number='1'))
+            self.assertIn(('PATCH', '/repos/o/r/issues/1'), api.requests)
+            # The fingerprint comes from the issue itself, rather than from loading every open issue.
+            self.assertEqual(api.requests.count(('GET', '/repos/o/r/issues/1')), 2)
+            self.assertNotIn(('GET', '/repos/o/r/issues'), api.requests)
+        self.assertEqual(api.repos['o/r']['issues'][0]['title'], 'Renamed')
+
+
+class ExistingIssuesTest(unittest.TestCase):
+    def test_all_pages_summarised(self):
+        issues = [{'number': i, 'title': f'Issue {i}', 'state': 'open', 'body': f'Body {i}', 'reactions': {},
+                   'html_url': f'https://github.com/o/r/issues/{i}'} for i in range(1, 251)]
+        with FakeGitHubApi() as api, mock.patch.dict(os.environ, {'INPUT_GITHUB_URL': api.url}):
+            api.add_repo('o/r', issues=issues)
+            existing_issues = GitHubClient(repo='o/r', sha='head').existing_issues
+        self.assertEqual([issue['number'] for issue in existing_issues], list(range(1, 251)))
+        self.assertEqual(existing_issues[0], {'number': 1, 'title': 'Issue 1', 'fingerprint': None, 'file_name': None,
+                                              'html_url': 'https://github.com/o/r/issues/1'})
+        self.assertEqual(api.requests.count(('GET', '/repos/o/r/issues')), 3)
+
+    def test_todo_issues(self):
+        issues = [{'number': 1, 'title': 'Crash on start', 'state': 'open', 'reactions': {},
+                   'body': 'It fails here: https://github.com/o/r/blob/main/src/app.py#L42-L50',
+                   'html_url': 'https://github.com/o/r/issues/1'},
+                  {'number': 2, 'title': 'Tidy up', 'state': 'open', 'reactions': {},
+                   'body': 'https://github.com/o/r/blob/abc/src/app.py#L1-L1\n\n'
+                           '<!-- todo-to-issue fingerprint: 0123abcd -->',
+                   'html_url': 'https://github.com/o/r/issues/2'}]
+        with FakeGitHubApi() as api, mock.patch.dict(os.environ, {'INPUT_GITHUB_URL': api.url}):
+            api.add_repo('o/r', issues=issues)
+            todo_issues = GitHubClient(repo='o/r', sha='head').get_todo_issues()
+        # An issue written by hand isn't a TODO issue just because it links to the code.
+        self.assertEqual([issue['number'] for issue in todo_issues], [2])
+
+    def test_failed_page_retried(self):
+        issues = [{'number': i, 'title': f'Issue {i}', 'state': 'open', 'body': '', 'reactions': {},
+                   'html_url': f'https://github.com/o/r/issues/{i}'} for i in range(1, 251)]
+        with FakeGitHubApi() as api, mock.patch.dict(os.environ, {'INPUT_GITHUB_URL': api.url}), \
+                mock.patch.object(GitHubClient, 'page_retry_delay', 0):
+            api.add_repo('o/r', issues=issues)
+            api.failures[('/repos/o/r/issues', 2)] = 1
+            self.assertEqual(len(GitHubClient(repo='o/r', sha='head').existing_issues), 250)
+            # A page that still can't be retrieved stops the run, rather than leaving out part of the list.
+            api.failures[('/repos/o/r/issues', 2)] = 3
+            with self.assertRaises(Exception):
+                GitHubClient(repo='o/r', sha='head').existing_issues
+
+    def test_loaded_on_demand(self):
+        with FakeGitHubApi() as api, mock.patch.dict(os.environ, {'INPUT_GITHUB_URL': api.url}):
+            api.add_repo('o/r', diffs={'commits/head': 'diff --git a/a.py b/a.py\n'})
+            client = GitHubClient(repo='o/r', sha='head')
+            client.get_last_diff()
+            # Without any TODOs, the diff is all that's needed.
+            self.assertEqual(api.requests, [('GET', '/repos/o/r/commits/head')])
+            client.milestones
+            self.assertEqual(api.requests[-1], ('GET', '/repos/o/r/milestones'))
+
+
+class PrCloseTest(unittest.TestCase):
+    def _close_issues(self, env):
+        issues = [{'number': i, 'title': f'Issue {i}', 'state': 'open',
+                   'html_url': f'https://github.com/o/r/issues/{i}'} for i in [1, 2, 3]]
+        with FakeGitHubApi() as api, mock.patch.dict(os.environ, dict(env, INPUT_GITHUB_URL=api.url,
+                                                                       GITHUB_EVENT_NAME='pull_request',
+                                                                       PR_NUMBER='5')):
+            api.add_repo('o/r', issues=issues, pulls={5: {'number': 5, 'body': 'Fixes things.\n\nCloses #3'}})
+            client = GitHubClient(repo='o/r', sha='head')
+            for i in [1, 2, 3]:
+                self.assertIn(client.close_issue(SimpleNamespace(issue_number=None, title=f'Issue {i}')), [200, 201])
+            client.finish()
+        return api
+
+    def test_pr_body_updated_once(self):
+        api = self._close_issues({})
+        self.assertEqual(api.repos['o/r']['pulls'][5]['body'], 'Fixes things.\n\nCloses #3\n\nCloses #1\nCloses #2')
+        self.assertEqual(api.requests.count(('PATCH', '/repos/o/r/pulls/5')), 1)
+        self.assertEqual([issue['state'] for issue in api.repos['o/r']['issues']], ['closed'] * 3)
+
+    def test_close_on_merge(self):
+        api = self._close_issues({'INPUT_CLOSE_ON_MERGE': 'true'})
+        self.assertIn('Closes #1\nCloses #2', api.repos['o/r']['pulls'][5]['body'])
+        # The issues are left for GitHub to close.
+        self.assertEqual([issue['state'] for issue in api.repos['o/r']['issues']], ['open'] * 3)
+
+    def test_sharded(self):
+        env = {'GITHUB_EVENT_NAME': 'pull_request', 'PR_NUMBER': '5'}
+        issues = [{'number': i, 'title': f'Issue {i}', 'state': 'open',
+                   'html_url': f'https://github.com/o/r/issues/{i}'} for i in [1, 2]]
+        with tempfile.TemporaryDirectory() as tempdir, FakeGitHubApi() as api:
+            api.add_repo('o/r', issues=issues, pulls={5: {'number': 5, 'body': ''}})
+            with mock.patch.dict(os.environ, dict(env, INPUT_GITHUB_URL=api.url, INPUT_SHARD_COUNT='2')):
+                for i in [1, 2]:
+                    client = GitHubClient(repo='o/r', sha='head')
+                    client.close_issue(SimpleNamespace(issue_number=None, title=f'Issue {i}'))
+                    client.finish()
+                    DiffSharder(['TODO'], i - 1, 2).write_summary(os.path.join(tempdir, f'shard{i}.json'), [],
+                                                                  client.pr_closed_issues)
+            # The shards leave the PR alone, so they can't overwrite each other's changes.
+            self.assertNotIn(('PATCH', '/repos/o/r/pulls/5'), api.requests)
+            with mock.patch.dict(os.environ, dict(env, INPUT_GITHUB_URL=api.url)):
+                finish_shards(GitHubClient(repo='o/r', sha='head'), sorted(glob.glob(f'{tempdir}/shard*.json')))
+        self.assertEqual(api.repos['o/r']['pulls'][5]['body'], 'Closes #1\nCloses #2')
+        self.assertEqual(api.requests.count(('PATCH', '/repos/o/r/pulls/5')), 1)
+
+
+class DeletedFileTest(unittest.TestCase):
+    def test_closed_by_file(self):
+        issues = [{'number': i, 'title': 'Vendored', 'state': 'open', 'html_url': f'https://github.com/o/r/issues/{i}',
+                   'body': f'https://github.com/o/r/blob/abc/{file_name}#L1'}
+                  for i, file_name in [(1, 'src/a.py'), (2, 'vendor/b%20c.py')]]
+        todos = [SimpleNamespace(issue_number=None, title='Vendored', file_name='vendor/b c.py') for _ in range(2)]
+        with FakeGitHubApi() as api, mock.patch.dict(os.environ, {'INPUT_GITHUB_URL': api.url}), \
+                mock.patch('GitHubClient.time.sleep'):
+            api.add_repo('o/r', issues=issues)
+            self.assertEqual(GitHubClient(repo='o/r', sha='head').close_issues(todos), [201, 200])
+        # The issue linking to the deleted file is closed, and only once.
+        self.assertEqual([issue['state'] for issue in api.repos['o/r']['issues']], ['open', 'closed'])
+        self.assertEqual(api.requests.count(('PATCH', '/repos/o/r/issues/2')), 1)
+
+
+class CreateIssuesTest(unittest.TestCase):
+    @staticmethod
+    def _issue(title, assignees, ref=None):
+        return Issue(title=title, labels=[], assignees=assignees, milestone=None, body=[], hunk='', file_name='a.py',
+                     start_line=1, num_lines=1, prefix='', suffix='', markdown_language='python',
+                     status=LineStatus.ADDED, identifier='TODO', identifier_actual='TODO', ref=ref, issue_url=None,
+                     issue_number=None)
+
+    def test_shared_lookups(self):
+        issues = [self._issue('First', ['alice', 'carol']), self._issue('Second', ['alice'], ref='@bob'),
+                  self._issue('Third', [])]
+        waits = []
+        with FakeGitHubApi() as api, mock.patch.dict(os.environ, {'INPUT_GITHUB_URL': api.url}), \
+                mock.patch('GitHubClient.time.sleep', side_effect=waits.append), redirect_stdout(io.StringIO()), \
+                mock.patch.dict(GitHubClient.next_writes, clear=True):
+            api.add_repo('o/r', assignees=['alice', 'bob'])
+            results = GitHubClient(repo='o/r', sha='head').create_issues(issues)
+        self.assertEqual(results, [(201, 1), (201, 2), (201, 3)])
+        # Each assignee is only checked once.
+        for assignee in ['alice', 'bob', 'carol']:
+            self.assertEqual(api.requests.count(('GET', f'/repos/o/r/assignees/{assignee}')), 1)
+        self.assertEqual([issue['assignees'] for issue in api.repos['o/r']['issues']],
+                         [['alice'], ['alice', 'bob'], []])
+        # The issues are written one at a time, spaced out.
+        self.assertEqual(len(waits), 2)
+
+    def test_writes_paced_per_token(self):
+        waits = []
+        with FakeGitHubApi() as api, mock.patch.dict(os.environ, {'INPUT_GITHUB_URL': api.url}), \
+                mock.patch('GitHubClient.time.sleep', side_effect=waits.append), \
+                mock.patch('GitHubClient.time.monotonic', return_value=100), \
+                mock.patch.dict(GitHubClient.next_writes, clear=True):
+            clients = [GitHubClient(repo=repo, sha='head') for repo in ['o/a', 'o/b', 'o/c']]
+            clients[2].token = 'other'
+            for client in clients:
+                client._pace_writes()
+        # Clients for different repos share the first token's pace, but another token has its own.
+        self.assertEqual(waits, [1])
+
+
+class HttpCacheTest(unittest.TestCase):
+    def test_conditional_requests(self):
+        with tempfile.TemporaryDirectory() as tempdir, FakeGitHubApi() as api:
+            cache_path = os.path.join(tempdir, 'http_cache.json')
+            with mock.patch.dict(os.environ, {'INPUT_GITHUB_URL': api.url, 'INPUT_HTTP_CACHE': cache_path}):
+                api.add_repo('o/r', issues=[{'number': 1, 'title': 'Cached', 'state': 'open',
+                                             'html_url': 'https://github.com/o/r/issues/1'}])
+                GitHubClient(repo='o/r', sha='head').existing_issues
+                HttpCache.open(cache_path).save()
+                self.assertEqual(api.not_modified, 0)
+                # The next run only gets back 304 responses, but still sees the cached issues.
+                HttpCache._caches.pop(cache_path)
+                existing_issues = GitHubClient(repo='o/r', sha='head').existing_issues
+                self.assertEqual(api.not_modified, 1)
+                self.assertEqual([issue['title'] for issue in existing_issues], ['Cached'])
+                # A response that has changed is fetched in full.
+                api.repos['o/r']['issues'].append({'number': 2, 'title': 'New', 'state': 'open',
+                                                   'html_url': 'https://github.com/o/r/issues/2'})
+                existing_issues = GitHubClient(repo='o/r', sha='head').existing_issues
+                self.assertEqual(api.not_modified, 1)
+                self.assertEqual([issue['title'] for issue in existing_issues], ['Cached', 'New'])
+            HttpCache._caches.pop(cache_path).save()
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,82 @@
+import json
+import os
+import subprocess
+import tempfile
+import unittest
+
+from LocalClient import LocalClient
+from TodoParser import TodoParser
+
+
+class LocalClientDiffFilterTest(unittest.TestCase):
+    def _git(self, *args):
+        subprocess.run(['git', '-c', 'user.name=Test', '-c', 'user.email=test@example.com', *args],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+
+    def _write(self, file_name, contents):
+        with open(file_name, 'w') as f:
+            f.write(contents)
+
+    def setUp(self):
+        self.orig_cwd = os.getcwd()
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.parser = TodoParser()
+        with open('syntax.json', 'r') as syntax_json:
+            self.parser.syntax_dict = json.load(syntax_json)
+        os.chdir(self.tempdir.name)
+        self._git('init', '-q')
+        for file_name in ['todo.py', 'no_todo.py', 'notes.unsupported', 'Ignored.java']:
+            self._write(file_name, 'start\n')
+        self._git('add', '.')
+        self._git('commit', '-q', '-m', 'Initial commit')
+        self._write('todo.py', 'start\n# todo: Find me\n')
+        self._write('no_todo.py', 'start\nprint()\n')
+        self._write('notes.unsupported', 'start\nTODO: Unsupported\n')
+        self._write('Ignored.java', 'start\n// TODO: Ignore me\n')
+        self._git('commit', '-q', '-a', '-m', 'Add TODOs')
+        os.environ['INPUT_IGNORE'] = '.*\\.java'
+
+    def test_only_candidate_files_streamed(self):
+        os.environ['INPUT_LOCAL_PICKAXE'] = 'true'
+        client = LocalClient()
+        diff_file = client.get_last_diff_file(self.parser)
+        sections = list(self.parser._get_file_sections(diff_file))
+        self.assertEqual(len(sections), 1)
+        self.assertTrue(sections[0].startswith('diff --git a/todo.py b/todo.py'))
+
+    def test_body_edit_streamed(self):
+        self._write('todo.py', 'start\n# todo: Find me\n#  With a body\n')
+        self._git('commit', '-q', '-a', '-m', 'Edit TODO body')
+        client = LocalClient()
+        diff_file = client.get_last_diff_file(self.parser)
+        sections = list(self.parser._get_file_sections(diff_file))
+        # Without the pickaxe, every supported file is streamed, including a TODO whose only change is to its body.
+        self.assertEqual(len(sections), 1)
+        self.assertIn('+#  With a body', sections[0])
+
+    def test_failed_diff_raises(self):
+        client = LocalClient()
+        client.base_ref = 'no-such-ref'
+        with self.assertRaises(subprocess.CalledProcessError):
+            self.parser.parse(client.get_last_diff_file(self.parser))
+
+    def test_parse_streamed_diff(self):
+        client = LocalClient()
+        raw_issues = self.parser.parse(client.get_last_diff_file(self.parser))
+        self.assertEqual([issue.title for issue in raw_issues], ['Find me'])
+
+    def test_regex_to_pathspec(self):
+        client = LocalClient()
+        self.assertEqual(client._regex_to_pathspec('.*\\.java'), '*.java*')
+        self.assertEqual(client._regex_to_pathspec('tests/example-file\\.php$'), 'tests/example-file.php')
+        self.assertIsNone(client._regex_to_pathspec('src/(a|b)/.*'))
+
+    def tearDown(self):
+        os.environ['INPUT_IGNORE'] = ''
+        os.environ['INPUT_LOCAL_PICKAXE'] = ''
+        os.chdir(self.orig_cwd)
+        self.tempdir.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
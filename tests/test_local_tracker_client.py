@@ -0,0 +1,48 @@
+import io
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+from Issue import Issue
+from LineStatus import LineStatus
+from LocalTrackerClient import LocalTrackerClient
+from main import process_issues
+
+
+class LocalTrackerClientTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempdir.name, 'issues.db')
+
+    @staticmethod
+    def _issue(title, status=LineStatus.ADDED, ref=None):
+        return Issue(title=title, labels=['todo'], assignees=[], milestone=None, body=['Body'], hunk='',
+                     file_name='a.py', start_line=1, num_lines=1, prefix='', suffix='', markdown_language='python',
+                     status=status, identifier='TODO', identifier_actual='TODO', ref=ref, issue_url=None,
+                     issue_number=None)
+
+    def test_issue_lifecycle(self):
+        client = LocalTrackerClient(self.path, 'o/r')
+        with redirect_stdout(io.StringIO()):
+            self.assertEqual(client.create_issues([self._issue('First'), self._issue('Second', ref='@alice'),
+                                                   self._issue('First')]), [(201, 1), (201, 2), (200, 1)])
+            self.assertEqual(client.create_issue(self._issue('Comment', ref='#2')), (201, None))
+        process_issues([self._issue('Second', LineStatus.DELETED)], client, output=io.StringIO())
+        # The issues are kept between runs.
+        client = LocalTrackerClient(self.path, 'o/r')
+        issues = client.get_issues()
+        self.assertEqual([(issue['number'], issue['state']) for issue in issues], [(1, 'open'), (2, 'closed')])
+        self.assertEqual(issues[1]['assignees'], ['alice'])
+        self.assertEqual(len(client.get_comments(2)), 2)
+        self.assertEqual(client.get_issue_url(2), 'https://github.com/o/r/issues/2')
+        # Closing an issue that isn't open does nothing.
+        self.assertIsNone(client.close_issue(self._issue('Second', LineStatus.DELETED)))
+        self.assertEqual(LocalTrackerClient(self.path, 'o/other').get_issues(), [])
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
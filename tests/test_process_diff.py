@@ -6,8 +6,11 @@ import subprocess
 import io
 import re
 
+from Client import Client
+from Issue import Issue
+from LineStatus import LineStatus
 from TodoParser import TodoParser
-from main import process_diff
+from main import process_diff, process_issues
 
 
 class IssueUrlInsertionTest(unittest.TestCase):
@@ -149,3 +152,79 @@ class IssueUrlInsertionTest(unittest.TestCase):
         # explicitly cleanup to avoid warning being printed about implicit cleanup
         self.tempdir.cleanup()
         self.tempdir = None
+
+
+class RecordingClient(Client):
+    """Client which records the changes that would be made to issues."""
+
+    def __init__(self):
+        self.changes = []
+
+    def create_issue(self, issue):
+        self.changes.append(('create', issue.file_name))
+        return [201, None]
+
+    def move_issue(self, old_issue, new_issue):
+        self.changes.append(('move', old_issue.file_name, new_issue.file_name))
+        return [200, 1]
+
+    def close_issue(self, issue):
+        self.changes.append(('close', issue.file_name))
+        return 200
+
+
+class MovedIssueTest(unittest.TestCase):
+    @staticmethod
+    def _issue(title, file_name, status, body=None):
+        return Issue(title=title, labels=[], assignees=[], milestone=None, body=body or [], hunk='', file_name=file_name,
+                     start_line=1, num_lines=1, prefix='', suffix='', markdown_language='python', status=status,
+                     identifier='TODO', identifier_actual='TODO', ref=None, issue_url=None, issue_number=None)
+
+    def _process(self, raw_issues):
+        client = RecordingClient()
+        process_issues(raw_issues, client, output=io.StringIO())
+        return client.changes
+
+    def test_moved_within_file(self):
+        # The TODO moved past another one, so the two halves aren't next to each other.
+        changes = self._process([self._issue('Moved', 'a.py', LineStatus.DELETED),
+                                 self._issue('Other', 'a.py', LineStatus.ADDED),
+                                 self._issue('Moved', 'a.py', LineStatus.ADDED)])
+        self.assertEqual(changes, [('create', 'a.py')])
+
+    def test_moved_to_other_file(self):
+        changes = self._process([self._issue('Moved', 'a.py', LineStatus.DELETED),
+                                 self._issue('Moved', 'b.py', LineStatus.ADDED)])
+        self.assertEqual(changes, [('move', 'a.py', 'b.py')])
+
+    def test_unmatched(self):
+        # A TODO whose title has changed isn't treated as the same TODO, and each deletion only pairs up once.
+        changes = self._process([self._issue('Changed', 'a.py', LineStatus.DELETED),
+                                 self._issue('Changed differently', 'b.py', LineStatus.ADDED),
+                                 self._issue('Copied', 'a.py', LineStatus.DELETED),
+                                 self._issue('Copied', 'a.py', LineStatus.ADDED),
+                                 self._issue('Copied', 'b.py', LineStatus.ADDED)])
+        self.assertEqual(sorted(changes), [('close', 'a.py'), ('create', 'b.py'), ('create', 'b.py')])
+
+    def test_moved_with_body(self):
+        # The parser doesn't collect the body of a removed TODO, so only the added one has a body.
+        parser = TodoParser()
+        with open('syntax.json', 'r') as syntax_json:
+            parser.syntax_dict = json.load(syntax_json)
+        todo = ['# TODO: Moved one', '#  With a body']
+        removed_hunk = '@@ -1,3 +1,1 @@\n' + ''.join(f'-{line}\n' for line in todo) + ' x = 1\n'
+        added_hunk = '@@ -10,1 +8,3 @@\n y = 2\n' + ''.join(f'+{line}\n' for line in todo)
+
+        def section(file_name, hunks):
+            return (f'diff --git a/{file_name} b/{file_name}\n'
+                    'index 1111111..2222222 100644\n'
+                    f'--- a/{file_name}\n'
+                    f'+++ b/{file_name}\n'
+                    + ''.join(hunks))
+
+        for diff, changes in [(section('a.py', [removed_hunk, added_hunk]), []),
+                              (section('a.py', [removed_hunk]) + section('b.py', [added_hunk]),
+                               [('move', 'a.py', 'b.py')])]:
+            client = RecordingClient()
+            process_diff(io.StringIO(diff), client, parser=parser, output=io.StringIO())
+            self.assertEqual(client.changes, changes)
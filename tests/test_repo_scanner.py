@@ -0,0 +1,129 @@
+import io
+import json
+import os
+import subprocess
+import tempfile
+import unittest
+
+from LineStatus import LineStatus
+from LocalTrackerClient import LocalTrackerClient
+from RepoScanner import RepoScanner
+from TodoParser import TodoParser
+from main import reconcile
+
+
+class RepoScannerTest(unittest.TestCase):
+    def setUp(self):
+        self.orig_cwd = os.getcwd()
+        self.tempdir = tempfile.TemporaryDirectory()
+        # Create a simulated working tree from the diff of newly added files.
+        subprocess.run(['patch', '-d', self.tempdir.name, '-i', f'{os.getcwd()}/tests/test_new.diff'],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        self.parser = TodoParser()
+        with open('syntax.json', 'r') as syntax_json:
+            self.parser.syntax_dict = json.load(syntax_json)
+        with open('tests/test_new.diff', 'r') as diff_file:
+            self.diff_issues = self.parser.parse(diff_file)
+        os.chdir(self.tempdir.name)
+
+    @staticmethod
+    def _summarise(issues):
+        return sorted((issue.file_name, issue.title, issue.status, issue.body) for issue in issues)
+
+    def test_scan_matches_new_file_diff(self):
+        os.environ['INPUT_SCAN_WORKERS'] = '1'
+        scanned_issues = list(RepoScanner(self.parser).scan())
+        self.assertTrue(all(issue.status == LineStatus.ADDED for issue in scanned_issues))
+        # Each issue holds its own cleaned snippet, not the raw code block, so it's cheap to send between processes.
+        self.assertTrue(all(issue.snippet is None for issue in scanned_issues))
+        self.assertEqual(self._summarise(scanned_issues), self._summarise(self.diff_issues))
+        line_numbers = {(issue.file_name, issue.start_line) for issue in scanned_issues}
+        self.assertIn(('example_file.py', 2), line_numbers)
+
+    def test_parallel_scan(self):
+        os.environ['INPUT_SCAN_WORKERS'] = '2'
+        scanned_issues = list(RepoScanner(self.parser).scan())
+        self.assertEqual(self._summarise(scanned_issues), self._summarise(self.diff_issues))
+
+    def test_skips_ignored_binary_and_oversized_files(self):
+        with open('binary.py', 'wb') as binary_file:
+            binary_file.write(b'# TODO: Not really code\n\0\0\0')
+        with open('.gitignore', 'w') as gitignore:
+            gitignore.write('*.java\n')
+        os.environ['INPUT_IGNORE'] = '.*\\.php'
+        os.environ['INPUT_SCAN_MAX_FILE_SIZE'] = '400'
+        os.environ['INPUT_SCAN_WORKERS'] = '1'
+        parser = TodoParser()
+        parser.syntax_dict = self.parser.syntax_dict
+        scanner = RepoScanner(parser)
+        files = scanner.get_files()
+        self.assertNotIn('ExampleFile.java', files)
+        self.assertNotIn('example-file.php', files)
+        scanned_files = {issue.file_name for issue in scanner.scan()}
+        self.assertNotIn('binary.py', scanned_files)
+        self.assertNotIn('example_file.py', scanned_files)
+        self.assertIn('example_file.yaml', scanned_files)
+
+    def tearDown(self):
+        for name in ['INPUT_SCAN_WORKERS', 'INPUT_SCAN_MAX_FILE_SIZE']:
+            os.environ.pop(name, None)
+        os.environ['INPUT_IGNORE'] = ''
+        os.chdir(self.orig_cwd)
+        self.tempdir.cleanup()
+
+
+class ReconcileTest(unittest.TestCase):
+    def setUp(self):
+        self.orig_cwd = os.getcwd()
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.parser = TodoParser()
+        with open('syntax.json', 'r') as syntax_json:
+            self.parser.syntax_dict = json.load(syntax_json)
+        os.chdir(self.tempdir.name)
+        os.environ['INPUT_SCAN_WORKERS'] = '1'
+
+    @staticmethod
+    def _write(file_name, contents):
+        with open(file_name, 'w') as f:
+            f.write(contents)
+
+    def test_reconcile(self):
+        client = LocalTrackerClient(os.path.join(self.tempdir.name, 'issues.db'), 'o/r')
+        self._write('a.py', '# TODO: Kept\n# TODO: Missed\n')
+        self._write('b.py', '# TODO: Gone\n')
+        reconcile(client, self.parser, output=io.StringIO())
+        self.assertEqual(sorted(issue['title'] for issue in client.get_todo_issues()), ['Gone', 'Kept', 'Missed'])
+        # A TODO removed without the issue being closed, and one added without an issue being created.
+        os.remove('b.py')
+        self._write('c.py', '# TODO: New\n# TODO: Linked\n# Issue URL: https://github.com/o/r/issues/2\n')
+        output = io.StringIO()
+        reconcile(client, self.parser, output=output)
+        self.assertIn('1 TODOs have no issue and 1 of 3 open issues have no TODO', output.getvalue())
+        self.assertEqual(sorted((issue['title'], issue['state']) for issue in client.get_issues()),
+                         [('Gone', 'closed'), ('Kept', 'open'), ('Missed', 'open'), ('New', 'open')])
+        # Now that they match, there's nothing to do.
+        output = io.StringIO()
+        reconcile(client, self.parser, output=output)
+        self.assertIn('0 TODOs have no issue and 0 of 3 open issues have no TODO', output.getvalue())
+
+    def test_skipped_files_left_open(self):
+        client = LocalTrackerClient(os.path.join(self.tempdir.name, 'issues.db'), 'o/r')
+        self._write('a.py', '# TODO: Unseen\n')
+        reconcile(client, self.parser, output=io.StringIO())
+        # The file grows too big to check, so its TODO can't be found, but that doesn't mean it has gone.
+        self._write('a.py', '# TODO: Unseen\n' + 'x = 1\n' * 100)
+        os.environ['INPUT_SCAN_MAX_FILE_SIZE'] = '100'
+        output = io.StringIO()
+        reconcile(client, self.parser, output=output)
+        self.assertIn('0 TODOs have no issue and 0 of 1 open issues have no TODO', output.getvalue())
+        self.assertEqual([issue['state'] for issue in client.get_issues()], ['open'])
+
+    def tearDown(self):
+        for name in ['INPUT_SCAN_WORKERS', 'INPUT_SCAN_MAX_FILE_SIZE']:
+            os.environ.pop(name, None)
+        os.chdir(self.orig_cwd)
+        self.tempdir.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import io
+import itertools
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from Client import Client
+from Issue import Issue
+from LineStatus import LineStatus
+from main import process_issues
+
+
+class RateLimitedClient(Client):
+    """Client with a limited number of requests left, which records the issues it creates."""
+
+    def __init__(self, remaining, status_code=201):
+        self.repo = 'o/r'
+        self.remaining = remaining
+        self.status_code = status_code
+        self.created = []
+
+    def get_rate_limit(self):
+        return {'core': self.remaining, 'search': 0}
+
+    def estimate_requests(self, issue):
+        return {'core': 1}
+
+    def create_issue(self, issue):
+        self.created.append(issue.title)
+        return [self.status_code, len(self.created) if self.status_code == 201 else None]
+
+
+class RequestPlannerTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.queue_path = os.path.join(self.tempdir.name, 'queue.json')
+        self.env = mock.patch.dict(os.environ, {'INPUT_DEFERRAL_QUEUE': self.queue_path})
+        self.env.start()
+
+    @staticmethod
+    def _issues(*titles):
+        return [Issue(title=title, labels=[], assignees=[], milestone=None, body=[], hunk='', file_name='a.py',
+                      start_line=len(titles) - i, num_lines=1, prefix='', suffix='', markdown_language='python',
+                      status=LineStatus.ADDED, identifier='TODO', identifier_actual='TODO', ref=None, issue_url=None,
+                      issue_number=None) for i, title in enumerate(titles)]
+
+    def test_rate_limit(self):
+        # Two requests are left once some are kept in reserve.
+        client = RateLimitedClient(remaining=22)
+        process_issues(self._issues('First', 'Second', 'Third'), client, output=io.StringIO())
+        self.assertEqual(client.created, ['First', 'Second'])
+        # The next run processes the deferred issue before any new ones.
+        client = RateLimitedClient(remaining=5000)
+        process_issues(self._issues('Fourth'), client, output=io.StringIO())
+        self.assertEqual(client.created, ['Third', 'Fourth'])
+        client = RateLimitedClient(remaining=5000)
+        process_issues([], client, output=io.StringIO())
+        self.assertEqual(client.created, [])
+
+    def test_refused(self):
+        client = RateLimitedClient(remaining=5000, status_code=403)
+        process_issues(self._issues('Refused'), client, output=io.StringIO())
+        client = RateLimitedClient(remaining=5000)
+        process_issues([], client, output=io.StringIO())
+        self.assertEqual(client.created, ['Refused'])
+
+    def test_time_budget(self):
+        # The time is checked before each batch.
+        with mock.patch.dict(os.environ, {'INPUT_TIME_BUDGET': '2'}), mock.patch('main.ISSUE_BATCH_SIZE', 1), \
+                mock.patch('RequestPlanner.time.monotonic', side_effect=itertools.count()):
+            client = RateLimitedClient(remaining=5000)
+            process_issues(self._issues('First', 'Second', 'Third'), client, output=io.StringIO())
+        self.assertEqual(client.created, ['First'])
+        client = RateLimitedClient(remaining=5000)
+        process_issues([], client, output=io.StringIO())
+        self.assertEqual(client.created, ['Second', 'Third'])
+
+    def test_writes_counted_across_plans(self):
+        client = RateLimitedClient(remaining=5000)
+        client.token = 'writes-test'
+        client.estimate_requests = lambda issue: {'core': 1, 'writes': 200}
+        for titles in [('First', 'Second'), ('Third', 'Fourth')]:
+            process_issues(self._issues(*titles), client, output=io.StringIO())
+        # The 500 writes allowed in an hour are shared by each run in this process, rather than each having its own.
+        self.assertEqual(client.created, ['First', 'Second'])
+
+    def test_deferred_issues_for_shard(self):
+        issues = self._issues('First', 'Second')
+        issues[1].file_name = 'b.py'
+        process_issues(issues, RateLimitedClient(remaining=20), output=io.StringIO())
+        # Each shard only takes the deferred issues for its own files, leaving the others in the queue.
+        client = RateLimitedClient(remaining=5000)
+        process_issues([], client, output=io.StringIO(), file_filter=lambda file_name: file_name == 'b.py')
+        self.assertEqual(client.created, ['Second'])
+        client = RateLimitedClient(remaining=5000)
+        process_issues([], client, output=io.StringIO(), file_filter=lambda file_name: file_name == 'a.py')
+        self.assertEqual(client.created, ['First'])
+        client = RateLimitedClient(remaining=5000)
+        process_issues([], client, output=io.StringIO())
+        self.assertEqual(client.created, [])
+
+    def tearDown(self):
+        self.env.stop()
+        self.tempdir.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -20,10 +20,6 @@ class MyPyTest(unittest.TestCase):
         self.__call_mypy__(mypy_args, ["main.py"])
 
     # Run test again, but without disabling any error codes.
-    # This is expected to fail, but we intentionally keep this test around to
-    #   1) try not to add any more errors to what's already in the baseline
-    #   2) as a reminder to try to move the codebase towards having type checking eventually
-    @unittest.expectedFailure
     def test_run_strict_mypy_app(self):
         mypy_args: List[str] = []
         self.__call_mypy__(mypy_args, ["main.py"])
@@ -1,7 +1,17 @@
+import io
+import itertools
 import json
 import os
+import re
+import tempfile
+import time
 import unittest
+from contextlib import redirect_stdout
+from unittest import mock
 
+from CommentScanner import CommentScanner
+from LineStatus import LineStatus
+from RegexBackend import RegexBackend
 from TodoParser import TodoParser
 
 
@@ -369,6 +379,48 @@ class IgnorePatternTest(unittest.TestCase):
         self.assertEqual(count_issues_for_file_type(self.raw_issues, 'crystal'), 2)
         os.environ['INPUT_IGNORE'] = ''
 
+    def test_exclude_and_include_globs(self):
+        os.environ['INPUT_EXCLUDE'] = '*.java, tests/*.php'
+        os.environ['INPUT_INCLUDE'] = 'tests/**'
+        parser = TodoParser()
+        with open('syntax.json', 'r') as syntax_json:
+            parser.syntax_dict = json.load(syntax_json)
+        diff_file = open('tests/test_closed.diff', 'r')
+        self.raw_issues = parser.parse(diff_file)
+        self.assertEqual(count_issues_for_file_type(self.raw_issues, 'python'), 5)
+        self.assertEqual(count_issues_for_file_type(self.raw_issues, 'php'), 0)
+        self.assertEqual(count_issues_for_file_type(self.raw_issues, 'java'), 0)
+        self.assertEqual(count_issues_for_file_type(self.raw_issues, 'ruby'), 3)
+        # Files outside the included directory are skipped.
+        os.environ['INPUT_INCLUDE'] = 'lib/**'
+        parser = TodoParser()
+        with open('syntax.json', 'r') as syntax_json:
+            parser.syntax_dict = json.load(syntax_json)
+        diff_file = open('tests/test_closed.diff', 'r')
+        self.assertEqual(len(parser.parse(diff_file)), 0)
+
+    def test_binary_sections_skipped(self):
+        parser = TodoParser()
+        with open('syntax.json', 'r') as syntax_json:
+            parser.syntax_dict = json.load(syntax_json)
+        diff_file = io.StringIO('diff --git a/image.py b/image.py\n'
+                                'index 1111111..2222222 100644\n'
+                                'Binary files a/image.py and b/image.py differ\n'
+                                'diff --git a/example.py b/example.py\n'
+                                'index 3333333..4444444 100644\n'
+                                '--- a/example.py\n'
+                                '+++ b/example.py\n'
+                                '@@ -1 +1,2 @@\n'
+                                ' x = 1\n'
+                                '+# TODO: Not binary\n')
+        sections = list(parser._get_file_sections(diff_file))
+        self.assertEqual(len(sections), 1)
+        self.assertTrue(sections[0].startswith('diff --git a/example.py b/example.py'))
+
+    def tearDown(self):
+        os.environ['INPUT_EXCLUDE'] = ''
+        os.environ['INPUT_INCLUDE'] = ''
+
 
 class EscapeMarkdownTest(unittest.TestCase):
     def test_simple_escape(self):
@@ -393,6 +445,314 @@ class EscapeMarkdownTest(unittest.TestCase):
         self.assertEqual(issue.body[1], '\\<AnotherTag\\>')
 
 
+class CodeSnippetTest(unittest.TestCase):
+    def _parse(self, options=dict()):
+        parser = TodoParser(options=options)
+        with open('syntax.json', 'r') as syntax_json:
+            parser.syntax_dict = json.load(syntax_json)
+        with open('tests/test_same_title_in_same_file.diff', 'r') as diff_file:
+            return parser.parse(diff_file)
+
+    def test_snippet_shared_within_block(self):
+        raw_issues = self._parse()
+        self.assertEqual(len(raw_issues), 5)
+        # All the TODOs are in the same code block, so should reference the same snippet.
+        self.assertEqual(len({id(issue.snippet) for issue in raw_issues}), 1)
+        self.assertTrue(raw_issues[0].hunk.startswith('\ncontract Counter {\n    // TODO: Test this'))
+        self.assertNotIn('+', raw_issues[0].hunk)
+
+    def test_snippet_context(self):
+        raw_issues = self._parse({'snippet_context': 1})
+        self.assertEqual(raw_issues[0].hunk,
+                         'contract Counter {\n    // TODO: Test this\n    //  Do it\n    // labels: urgent\n')
+        self.assertEqual(raw_issues[2].hunk, '\n    // TODO: Test this\n    /**')
+        self.assertIsNone(raw_issues[0].snippet)
+
+    def test_snippet_context_deleted(self):
+        parser = TodoParser(options={'snippet_context': 1})
+        with open('syntax.json', 'r') as syntax_json:
+            parser.syntax_dict = json.load(syntax_json)
+        diff = ('diff --git a/a.py b/a.py\n'
+                'index 1111111..2222222 100644\n'
+                '--- a/a.py\n'
+                '+++ b/a.py\n'
+                '@@ -1,5 +1,4 @@\n'
+                ' def f():\n'
+                '-    a = 1\n'
+                '-    b = 2\n'
+                '-    # TODO: Removed\n'
+                '+    c = 3\n'
+                '     return 1\n'
+                '+    # TODO: Added\n')
+        deleted_issue, added_issue = parser.parse(io.StringIO(diff))
+        # Each excerpt comes from its own side of the change, even with deletions above the TODO.
+        self.assertEqual(deleted_issue.hunk, '    b = 2\n    # TODO: Removed\n    return 1')
+        self.assertEqual(added_issue.hunk, '    return 1\n    # TODO: Added\n')
+
+
+class CommentScannerTest(unittest.TestCase):
+    def setUp(self):
+        self.parser = TodoParser()
+        with open('syntax.json', 'r') as syntax_json:
+            self.parser.syntax_dict = json.load(syntax_json)
+        self.markers, _ = self.parser._get_file_details('example.js')
+
+    def test_edited_block_comment(self):
+        diff = ('diff --git a/example.js b/example.js\n'
+                'index 1111111..2222222 100644\n'
+                '--- a/example.js\n'
+                '+++ b/example.js\n'
+                '@@ -1,4 +1,4 @@\n'
+                ' function example() {\n'
+                '     /*\n'
+                '-     * TODO: Old title\n'
+                '+     * TODO: New title\n'
+                '      */\n')
+        raw_issues = self.parser.parse(io.StringIO(diff))
+        self.assertEqual([(issue.title, issue.status, issue.start_line) for issue in raw_issues],
+                         [('Old title', LineStatus.DELETED, 3), ('New title', LineStatus.ADDED, 3)])
+
+    def test_unterminated_block_comments(self):
+        comment_scanner = self.parser._get_comment_scanner(self.markers)
+        self.assertIs(self.parser._get_comment_scanner(self.markers), comment_scanner)
+        lines = ['+/* TODO: Never closed'] * 5000 + ['+// TODO: Line comment']
+        line_comments, block_comments = comment_scanner.scan(lines)
+        self.assertEqual(block_comments, [])
+        self.assertEqual(line_comments, [{'start': 5000, 'end': 5000, 'comment': '+// TODO: Line comment'}])
+
+    def test_block_comment_positions(self):
+        comment_scanner = self.parser._get_comment_scanner(self.markers)
+        lines = ['+a = 1;', '', '     /* First', '      */ b = 2; /* Second */', '+c = 3; /* Third */']
+        _, block_comments = comment_scanner.scan(lines)
+        self.assertEqual(block_comments, [
+            {'start': 0, 'end': 3, 'comment': '\n\n     /* First\n      */'},
+            {'start': 3, 'end': 3, 'comment': ' /* Second */'},
+            {'start': 4, 'end': 4, 'comment': ' /* Third */'}
+        ])
+
+
+class GeneratedFileTest(unittest.TestCase):
+    def setUp(self):
+        with open('syntax.json', 'r') as syntax_json:
+            self.syntax_dict = json.load(syntax_json)
+
+    @staticmethod
+    def _make_section(file_name, lines, start_line=1):
+        return (f'diff --git a/{file_name} b/{file_name}\n'
+                'index 1111111..2222222 100644\n'
+                f'--- a/{file_name}\n'
+                f'+++ b/{file_name}\n'
+                f'@@ -{start_line},1 +{start_line},{len(lines) + 1} @@\n'
+                ' first_line = 1;\n'
+                + ''.join(f'+{line}\n' for line in lines))
+
+    def _parse(self):
+        parser = TodoParser()
+        parser.syntax_dict = self.syntax_dict
+        diff = (self._make_section('node_modules/lib/index.js', ['// TODO: Vendored'])
+                + self._make_section('api.pb.go', ['// TODO: Generated'])
+                + self._make_section('gen.py', ['# Code generated by a tool. DO NOT EDIT.', '# TODO: Generated'])
+                + self._make_section('bundle.js', ['var a=1;' * 200 + '// TODO: Minified'])
+                + self._make_section('late.py', ['# Not generated, DO NOT EDIT.', '# TODO: Not generated'], 50)
+                + self._make_section('data.py', ['DATA = "' + 'a' * 2000 + '"  # TODO: In a long line',
+                                                 '# TODO: Checked']))
+        return parser, parser.parse(io.StringIO(diff))
+
+    def test_generated_files_skipped(self):
+        os.environ['INPUT_SKIP_GENERATED'] = 'true'
+        output = io.StringIO()
+        with redirect_stdout(output):
+            parser, raw_issues = self._parse()
+        # A long line is still checked in a file that isn't minified.
+        self.assertEqual([issue.title for issue in raw_issues], ['Not generated', 'In a long line', 'Checked'])
+        self.assertEqual(parser.skipped_sections, {'vendored': 1, 'generated': 2, 'minified': 1})
+        self.assertFalse(parser.should_parse('node_modules/lib/index.js'))
+        # Each file skipped is logged.
+        for file_name in ['node_modules/lib/index.js', 'api.pb.go', 'gen.py', 'bundle.js']:
+            self.assertIn(f'Skipping "{file_name}"', output.getvalue())
+
+    def test_generated_files_checked_by_default(self):
+        parser, raw_issues = self._parse()
+        self.assertEqual(len(raw_issues), 7)
+        self.assertEqual(parser.skipped_sections, {})
+
+    def tearDown(self):
+        os.environ.pop('INPUT_SKIP_GENERATED', None)
+
+
+class CountedLines(list):
+    """Lines which count how many times they're visited, whether one at a time or as a slice."""
+
+    def __init__(self, lines):
+        super().__init__(lines)
+        self.visits = 0
+
+    def __getitem__(self, index):
+        item = super().__getitem__(index)
+        self.visits += len(item) if isinstance(index, slice) else 1
+        return item
+
+    def __iter__(self):
+        for line in super().__iter__():
+            self.visits += 1
+            yield line
+
+
+class ScalingTest(unittest.TestCase):
+    # The time taken to parse a diff should only grow linearly with the length of its lines and the size of its hunks.
+    def setUp(self):
+        self.parser = TodoParser(options={'section_cpu_budget': 0})
+        with open('syntax.json', 'r') as syntax_json:
+            self.parser.syntax_dict = json.load(syntax_json)
+        # Otherwise the long lines wouldn't be checked at all.
+        self.parser.skip_generated = False
+
+    @staticmethod
+    def _make_diff(lines):
+        return ('diff --git a/example.js b/example.js\n'
+                'new file mode 100644\n'
+                'index 0000000..1111111\n'
+                '--- /dev/null\n'
+                '+++ b/example.js\n'
+                f'@@ -0,0 +1,{len(lines)} @@\n'
+                + ''.join(f'+{line}\n' for line in lines))
+
+    def _assert_parsed_quickly(self, diff, num_issues):
+        # Matching a line this long in quadratic time would take minutes, so the bound leaves plenty of room for noise.
+        start = time.perf_counter()
+        self.assertEqual(len(self.parser.parse(io.StringIO(diff))), num_issues)
+        self.assertLess(time.perf_counter() - start, 5)
+
+    def _count_line_visits(self, diff):
+        """Count how many times the comment scanner visits the lines of the diff."""
+        counted_lines = []
+        scan = CommentScanner.scan
+
+        def counting_scan(comment_scanner, lines):
+            counted_lines.append(CountedLines(lines))
+            return scan(comment_scanner, counted_lines[-1])
+
+        with mock.patch.object(CommentScanner, 'scan', counting_scan):
+            self.parser.parse(io.StringIO(diff))
+        return sum(lines.visits for lines in counted_lines)
+
+    def test_line_length(self):
+        self._assert_parsed_quickly(self._make_diff([f'// TODO: Long{" " * 200000}line']), 1)
+
+    def test_whitespace_in_comment(self):
+        self._assert_parsed_quickly(self._make_diff([f'// Not a{" " * 200000}TODO']), 0)
+
+    def test_hunk_size(self):
+        visits = [self._count_line_visits(self._make_diff(['/* TODO: Never closed'] * size
+                                                          + ['// TODO: Line comment']))
+                  for size in [1000, 2000, 4000]]
+        # Each line is visited the same number of times however big the hunk is, so the visits grow in equal steps.
+        self.assertEqual(visits[2] - visits[1], 2 * (visits[1] - visits[0]), visits)
+
+    def test_cpu_budget(self):
+        parser = TodoParser(options={'section_cpu_budget': 0.5})
+        parser.syntax_dict = self.parser.syntax_dict
+        diff = self._make_diff(['// TODO: Skipped'])
+        # Every reading of the CPU time is a second after the last.
+        with mock.patch('TodoParser.time.thread_time', side_effect=itertools.count()):
+            self.assertEqual(parser.parse(io.StringIO(diff)), [])
+        self.assertEqual(len(parser.parse(io.StringIO(diff))), 1)
+        # There's no limit unless one is set, so no TODOs are dropped.
+        self.assertEqual(TodoParser().section_cpu_budget, 0)
+
+    def test_regex_backend(self):
+        # Patterns RE2 doesn't support still work.
+        self.assertEqual(RegexBackend.compile(r'(?<=labels:\s).+', re.IGNORECASE).search('Labels: a').group(0), 'a')
+        os.environ['INPUT_REGEX_ENGINE'] = 're'
+        try:
+            self.assertIsInstance(RegexBackend.compile(r'a+b'), re.Pattern)
+        finally:
+            os.environ.pop('INPUT_REGEX_ENGINE')
+
+
+class WholeFileTest(unittest.TestCase):
+    def setUp(self):
+        self.parser = TodoParser()
+        with open('syntax.json', 'r') as syntax_json:
+            self.parser.syntax_dict = json.load(syntax_json)
+
+    @staticmethod
+    def _make_diff(status, lines):
+        sign, line_numbers = ('+', f'-0,0 +1,{len(lines)}') if status == 'new' else ('-', f'-1,{len(lines)} +0,0')
+        return (f'diff --git a/example.py b/example.py\n'
+                f'{status} file mode 100644\n'
+                f'index 1111111..2222222\n'
+                f'@@ {line_numbers} @@\n'
+                + ''.join(f'{sign}{line}\n' for line in lines))
+
+    def test_deleted_file(self):
+        issues = self.parser.parse(io.StringIO(self._make_diff('deleted', ['x = 1', '# TODO: Deleted', '# More'])))
+        self.assertEqual([(issue.title, issue.status, issue.start_line, issue.num_lines) for issue in issues],
+                         [('Deleted', LineStatus.DELETED, 2, 1)])
+
+    def test_new_file(self):
+        issues = self.parser.parse(io.StringIO(self._make_diff('new', ['# TODO: Added', '# Body'])))
+        self.assertEqual([(issue.title, issue.status, issue.body) for issue in issues],
+                         [('Added', LineStatus.ADDED, ['Body'])])
+
+    def test_file_without_identifier_not_scanned(self):
+        with mock.patch.object(self.parser, '_get_comment_scanner', side_effect=AssertionError):
+            self.assertEqual(self.parser.parse(io.StringIO(self._make_diff('deleted', ['# Just a comment']))), [])
+
+
+class ParseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.tempdir.name, 'parse_cache.json')
+
+    def _parse(self, options=dict()):
+        parser = TodoParser(options=dict(options, parse_cache=self.cache_path))
+        with open('syntax.json', 'r') as syntax_json:
+            parser.syntax_dict = json.load(syntax_json)
+        with open('tests/test_edit_py.diff', 'r') as diff_file:
+            return parser, parser.parse(diff_file)
+
+    def test_cached_sections_not_reparsed(self):
+        _, raw_issues = self._parse()
+        self.assertTrue(os.path.isfile(self.cache_path))
+        parser = TodoParser(options={'parse_cache': self.cache_path})
+        with open('syntax.json', 'r') as syntax_json:
+            parser.syntax_dict = json.load(syntax_json)
+        with open('tests/test_edit_py.diff', 'r') as diff_file:
+            with mock.patch.object(parser, '_extract_issue_if_exists', side_effect=AssertionError):
+                cached_issues = parser.parse(diff_file)
+        self.assertEqual([str(issue) for issue in cached_issues], [str(issue) for issue in raw_issues])
+        self.assertEqual({issue.status for issue in cached_issues}, {LineStatus.ADDED, LineStatus.DELETED})
+
+    def test_snippets_stored_once(self):
+        parser = TodoParser(options={'parse_cache': self.cache_path})
+        with open('syntax.json', 'r') as syntax_json:
+            parser.syntax_dict = json.load(syntax_json)
+        diff = ('diff --git a/a.py b/a.py\n'
+                'index 1111111..2222222 100644\n'
+                '--- a/a.py\n'
+                '+++ b/a.py\n'
+                '@@ -1,1 +1,4 @@\n'
+                ' x = 1\n'
+                '+# TODO: First\n'
+                '+y = 2\n'
+                '+# TODO: Second\n')
+        self.assertEqual(len(parser.parse(io.StringIO(diff))), 2)
+        with open(self.cache_path) as cache_file:
+            entry, = json.load(cache_file)['entries'].values()
+        self.assertEqual(len(entry['snippets']), 1)
+        self.assertIn('# TODO: Second', entry['snippets'][0])
+        self.assertEqual([issue_dict['hunk'] for issue_dict in entry['issues']], [0, 0])
+
+    def test_config_change_invalidates_cache(self):
+        self._parse()
+        parser, raw_issues = self._parse({'identifiers': [{'name': 'FIXME', 'labels': []}]})
+        self.assertEqual(len(raw_issues), 0)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+
 class BaseCustomLanguageTests:
     class BaseTest(unittest.TestCase):
         @staticmethod
@@ -0,0 +1,62 @@
+import time
+import unittest
+from types import SimpleNamespace
+
+from requests.structures import CaseInsensitiveDict
+
+from TokenPool import TokenPool, TokenPoolSession
+
+
+class FakeSession(object):
+    """Session which records the token used for each request, and responds as each token's rate limit dictates."""
+
+    def __init__(self, responses):
+        # The status and headers to respond with for each token.
+        self.responses = responses
+        self.tokens = []
+
+    def get(self, url, headers=None, **kwargs):
+        token = headers['Authorization'].split()[-1]
+        self.tokens.append(token)
+        status_code, response_headers = self.responses.get(token, (200, {}))
+        return SimpleNamespace(status_code=status_code, headers=CaseInsensitiveDict(response_headers), text='')
+
+
+class TokenPoolTest(unittest.TestCase):
+    @staticmethod
+    def _budget(remaining):
+        return {'X-RateLimit-Remaining': str(remaining), 'X-RateLimit-Reset': str(int(time.time()) + 3600),
+                'X-RateLimit-Resource': 'core'}
+
+    def test_spread_by_budget(self):
+        session = FakeSession({'a': (200, self._budget(10)), 'b': (200, self._budget(1000))})
+        pool_session = TokenPoolSession(session, TokenPool(['a', 'b']), 'a')
+        for _ in range(4):
+            pool_session.get('https://api.github.com/repos/o/r/issues', headers={'Authorization': 'token a'})
+        # Both are tried while their budgets are unknown, then the one with the most left is used.
+        self.assertEqual(sorted(session.tokens[:2]), ['a', 'b'])
+        self.assertEqual(session.tokens[2:], ['b', 'b'])
+        # Other requests are left alone.
+        pool_session.get('https://api.github.com/repos/o/r/issues', headers={'Authorization': 'Bearer c'})
+        self.assertEqual(session.tokens[-1], 'c')
+
+    def test_quarantine(self):
+        session = FakeSession({'a': (403, {'Retry-After': '60'})})
+        pool_session = TokenPoolSession(session, TokenPool(['a', 'b']), 'a')
+        headers = {'Authorization': 'token a'}
+        responses = [pool_session.get('https://api.github.com/repos/o/r/issues', headers=headers) for _ in range(3)]
+        self.assertEqual([response.status_code for response in responses], [200, 200, 200])
+        # Once refused, the token rests rather than being tried again.
+        self.assertEqual(session.tokens.count('a'), 1)
+
+    def test_all_refused(self):
+        session = FakeSession({'a': (429, {'Retry-After': '60'})})
+        pool_session = TokenPoolSession(session, TokenPool(['a']), 'a')
+        headers = {'Authorization': 'token a'}
+        self.assertEqual(pool_session.get('https://api.github.com/search/issues', headers=headers).status_code, 429)
+        self.assertEqual(pool_session.get('https://api.github.com/search/issues', headers=headers).status_code, 429)
+        self.assertEqual(session.tokens, ['a', 'a'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import hashlib
+import hmac
+import io
+import json
+import os
+import threading
+import unittest
+
+import requests
+
+from RateLimitedSession import RateLimitedSession
+from TodoParser import TodoParser
+from WebhookServer import WebhookServer
+from main import process_job
+from tests.fake_github_api import FakeGitHubApi
+from tests.test_batch import make_diff
+
+
+def push_payload(repo, before, after, ref='refs/heads/main'):
+    return json.dumps({'ref': ref, 'before': before, 'after': after, 'repository': {'full_name': repo}}).encode()
+
+
+class WebhookServerTest(unittest.TestCase):
+    def setUp(self):
+        self.parser = TodoParser()
+        with open('syntax.json', 'r') as syntax_json:
+            self.parser.syntax_dict = json.load(syntax_json)
+
+    def test_coalesce_pushes(self):
+        server = WebhookServer(lambda job: (True, ''), host='127.0.0.1', port=0, max_queue=2)
+        self.assertEqual(server.receive('push', push_payload('o/a', 'a1', 'a2')), 202)
+        self.assertEqual(server.receive('push', push_payload('o/a', 'a2', 'a3')), 202)
+        # A push to another branch or repo gets its own job.
+        self.assertEqual(server.receive('push', push_payload('o/b', 'b1', 'b2')), 202)
+        # The queue is full, but this push can still be merged.
+        self.assertEqual(server.receive('push', push_payload('o/b', 'b2', 'b3')), 202)
+        self.assertEqual(server.receive('push', push_payload('o/a', 'c1', 'c2', 'refs/heads/dev')), 503)
+        self.assertEqual([(job['repo'], job['base'], job['head']) for job in server.pending],
+                         [('o/a', 'a1', 'a3'), ('o/b', 'b1', 'b3')])
+        self.assertEqual(server.receive('ping', b'{}'), 204)
+        self.assertEqual(server.receive('push', b'not json'), 400)
+        server.server.server_close()
+
+    def test_secret_required_unless_loopback(self):
+        with self.assertRaises(ValueError):
+            WebhookServer(lambda job: (True, ''), host='0.0.0.0', port=0)
+        server = WebhookServer(lambda job: (True, ''), host='0.0.0.0', port=0, secret='secret')
+        server.server.server_close()
+        server = WebhookServer(lambda job: (True, ''), port=0)
+        self.assertTrue(server.url.startswith('http://127.0.0.1:'))
+        server.server.server_close()
+
+    def test_oversized_payload_refused(self):
+        jobs = []
+        with WebhookServer(lambda job: jobs.append(job) or (True, ''), host='127.0.0.1', port=0) as server:
+            server.MAX_PAYLOAD_SIZE = 100
+            payload = push_payload('o/r', 'a', 'b')
+            response = requests.post(server.url, data=payload + b' ' * 100, headers={'X-GitHub-Event': 'push'})
+            self.assertEqual(response.status_code, 413)
+            response = requests.post(server.url, data=payload, headers={'X-GitHub-Event': 'push'})
+            self.assertEqual(response.status_code, 202)
+            self.assertTrue(server.wait_until_idle(10))
+        self.assertEqual(len(jobs), 1)
+
+    def test_one_job_per_repo(self):
+        active = []
+        max_active = []
+        lock = threading.Lock()
+        release = threading.Event()
+
+        def process(job):
+            with lock:
+                active.append(job['repo'])
+                max_active.append(sorted(active))
+            release.wait(5)
+            with lock:
+                active.remove(job['repo'])
+            return True, ''
+
+        with WebhookServer(process, host='127.0.0.1', port=0, workers=3, output=io.StringIO()) as server:
+            server.enqueue({'repo': 'o/a', 'ref': 'refs/heads/main', 'base': '1', 'head': '2'})
+            server.enqueue({'repo': 'o/a', 'ref': 'refs/heads/dev', 'base': '1', 'head': '2'})
+            server.enqueue({'repo': 'o/b', 'ref': 'refs/heads/main', 'base': '1', 'head': '2'})
+            release.set()
+            self.assertTrue(server.wait_until_idle(5))
+        # Both repos were processed in parallel, but never the same one twice at once.
+        self.assertTrue(all(len(set(repos)) == len(repos) for repos in max_active))
+        self.assertEqual(len(max_active), 3)
+
+    def test_process_events(self):
+        secret = 'secret'
+        with FakeGitHubApi() as api:
+            os.environ['INPUT_GITHUB_URL'] = api.url
+            api.add_repo('o/a', diffs={'compare/a1...a2': make_diff('a.py', 'added', '# TODO: Issue in a')})
+            api.add_repo('o/b', diffs={'compare/b1...b2': make_diff('b.py', 'added', '# TODO: Issue in b')})
+            session = RateLimitedSession()
+            parse_lock = threading.Lock()
+            output = io.StringIO()
+            with WebhookServer(lambda job: process_job(job, self.parser, session, parse_lock), host='127.0.0.1',
+                               port=0, secret=secret, output=output) as server:
+                for repo in ['o/a', 'o/b']:
+                    payload = push_payload(repo, f'{repo[-1]}1', f'{repo[-1]}2')
+                    signature = 'sha256=' + hmac.new(secret.encode(), payload, hashlib.sha256).hexdigest()
+                    response = requests.post(server.url, data=payload,
+                                             headers={'X-GitHub-Event': 'push', 'X-Hub-Signature-256': signature})
+                    self.assertEqual(response.status_code, 202)
+                response = requests.post(server.url, data=push_payload('o/a', 'a2', 'a3'),
+                                         headers={'X-GitHub-Event': 'push', 'X-Hub-Signature-256': 'sha256=bad'})
+                self.assertEqual(response.status_code, 401)
+                self.assertTrue(server.wait_until_idle(10))
+
+        self.assertIn('Processed o/a (a1...a2)', output.getvalue())
+        self.assertEqual([issue['title'] for issue in api.repos['o/a']['issues']], ['Issue in a'])
+        self.assertEqual([issue['title'] for issue in api.repos['o/b']['issues']], ['Issue in b'])
+
+    def tearDown(self):
+        os.environ.pop('INPUT_GITHUB_URL', None)
+
+
+if __name__ == '__main__':
+    unittest.main()